@@ -1,9 +1,19 @@
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from config.backend_settings import settings
 from routes import general_api
-from tools.db_utils import create_db_and_tables, SessionLocal
+from components import scan_job_manager
+from components import search_index
+from components import library_watcher
+from components import thumbnail_cache
+from components import thumbnail_pack
+from components import thumbnail_queue
+from components import thumbnail_storage
+from components import thumbnail_variants
+from tools.db_utils import create_db_and_tables, analyze_database, SessionLocal
 import threading
 import os
 import sys
@@ -36,23 +46,77 @@ if not os.path.exists(settings.thumbnails_storage_path):
     except Exception as e:
         print(f"启动时创建缩略图目录 {settings.thumbnails_storage_path} 失败: {e}")
 
+def _load_thumbnail(storage_root: str, filename: str):
+    """在线程池中运行：定位并 stat 文件，足够小时读入内存。返回 (完整路径, stat, 内容或 None)，文件不存在时返回 None。"""
+    # 迁移期间旧的平铺文件名会回退到分片目录中的新位置
+    file_path = thumbnail_storage.resolve_thumbnail_file(storage_root, filename)
+    if file_path is None:
+        return None
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return None
+    if file_stat.st_size > thumbnail_cache.MAX_CACHED_FILE_BYTES:
+        return file_path, file_stat, None
+    with open(file_path, "rb") as f:
+        return file_path, file_stat, f.read()
+
+def _thumbnail_response(content: bytes, validator_headers: dict, if_none_match: str, cache_control: str) -> Response:
+    if thumbnail_cache.etag_matches(if_none_match, validator_headers["etag"]):
+        return Response(status_code=304, headers={"etag": validator_headers["etag"], "cache-control": cache_control})
+    return Response(
+        content=content, media_type=validator_headers["content-type"],
+        headers={"etag": validator_headers["etag"], "last-modified": validator_headers["last-modified"], "cache-control": cache_control}
+    )
+
 if os.path.isdir(settings.thumbnails_storage_path):
+    thumbnail_cache.configure(settings.thumbnail_cache_max_mb * 1024 * 1024)
+
     @app.get(settings.thumbnails_base_url + "/{filename:path}", tags=["Thumbnails"])
-    async def get_thumbnail(filename: str):
-        file_path = os.path.join(settings.thumbnails_storage_path, filename)
-        if not os.path.exists(file_path) or not os.path.isfile(file_path):
-            raise HTTPException(status_code=404, detail="Thumbnail not found")
-        
-        # 尝试获取 MIME 类型
-        mime_type, _ = mimetypes.guess_type(file_path)
-        if mime_type is None:
-            mime_type = "application/octet-stream" # 默认类型
-        
-        with open(file_path, "rb") as f:
-            content = f.read()
-        return Response(content=content, media_type=mime_type)
+    async def get_thumbnail(filename: str, request: Request):
+        # 缓存命中时不访问磁盘；未命中时 stat/读取放到线程池，不阻塞事件循环
+        cache_control = thumbnail_cache.IMMUTABLE_CACHE_CONTROL if "v" in request.query_params else thumbnail_cache.REVALIDATE_CACHE_CONTROL
+        if_none_match = request.headers.get("if-none-match")
+        size = request.query_params.get("size")
+        requested_variant = None
+        if size in thumbnail_variants.THUMBNAIL_SIZES and not thumbnail_storage.variant_master_path(filename):
+            requested_variant = thumbnail_storage.variant_relative_path(filename, size)
+        cached = thumbnail_cache.get(requested_variant or filename)
+        if cached is None:
+            storage_root = os.path.realpath(settings.thumbnails_storage_path)
+            if not os.path.realpath(os.path.join(storage_root, filename)).startswith(storage_root + os.sep):
+                raise HTTPException(status_code=404, detail="Thumbnail not found")
+            if requested_variant:
+                # 尺寸变体 (WebP) 在首次请求时生成并保存在原缩略图旁，生成失败时退回原缩略图
+                filename = await run_in_threadpool(thumbnail_variants.ensure_variant, storage_root, filename, size) or filename
+            if thumbnail_storage.is_pack_thumbnail_path(filename):
+                # 从 pack 文件 (mmap) 读取并放入内存缓存
+                packed = await run_in_threadpool(thumbnail_storage.load_thumbnail_content, storage_root, filename)
+                if packed is None:
+                    raise HTTPException(status_code=404, detail="Thumbnail not found")
+                content, validator_headers = packed
+                return _thumbnail_response(content, validator_headers, if_none_match, cache_control)
+            loaded = await run_in_threadpool(_load_thumbnail, storage_root, filename)
+            if loaded is None:
+                raise HTTPException(status_code=404, detail="Thumbnail not found")
+            file_path, file_stat, content = loaded
+            mime_type, _ = mimetypes.guess_type(file_path)
+            validator_headers = {**thumbnail_cache.build_validator_headers(file_stat), "content-type": mime_type or "application/octet-stream"}
+            if content is None:
+                # 超过内存缓存上限的文件交给 FileResponse 分块发送 (服务器支持时使用 sendfile)
+                if thumbnail_cache.etag_matches(if_none_match, validator_headers["etag"]):
+                    return Response(status_code=304, headers={"etag": validator_headers["etag"], "cache-control": cache_control})
+                return FileResponse(
+                    file_path, stat_result=file_stat, media_type=validator_headers["content-type"],
+                    headers={"etag": validator_headers["etag"], "last-modified": validator_headers["last-modified"], "cache-control": cache_control}
+                )
+            thumbnail_cache.put(filename, content, validator_headers)
+            cached = (content, validator_headers)
+
+        content, validator_headers = cached
+        return _thumbnail_response(content, validator_headers, if_none_match, cache_control)
 
-    print(f"自定义缩略图服务已挂载: URL '{settings.thumbnails_base_url}/<filename>'")
+    print(f"自定义缩略图服务已挂载: URL '{settings.thumbnails_base_url}/<filename>[?size={'|'.join(thumbnail_variants.THUMBNAIL_SIZES)}]'")
 else:
     print(f"警告: 缩略图目录 '{settings.thumbnails_storage_path}' 无效，无法挂载静态文件服务。")
 
@@ -64,7 +128,32 @@ async def startup_event():
     print(f"数据库位置: {settings.database_url}")
     print(f"缩略图存储于: {settings.thumbnails_storage_path}")
     create_db_and_tables()
-    print("后端服务已启动。视频库扫描需通过 API (/api/scan-library) 手动触发。")
+    analyze_database()
+    db = SessionLocal()
+    try:
+        # 全文搜索索引 (FTS5)：首次创建时在后台从现有视频填充，之后由触发器随数据更新
+        if search_index.ensure_search_index(db):
+            submission = scan_job_manager.request_maintenance(scan_job_manager.MAINTENANCE_REBUILD_SEARCH_INDEX)
+            print(f"搜索索引需要建立，已在后台开始 (任务 #{submission['job_id']})，完成前使用逐行匹配。")
+        if thumbnail_storage.has_flat_thumbnails(db):
+            # 旧版本的缩略图都平铺在一个目录里，后台分批迁移到分片目录
+            submission = scan_job_manager.request_maintenance(scan_job_manager.MAINTENANCE_MIGRATE_THUMBNAILS)
+            print(f"检测到旧的缩略图目录布局，已在后台开始迁移 (任务 #{submission['job_id']})。")
+        if thumbnail_variants.has_missing_placeholders(db):
+            # 旧版本生成的缩略图没有低清占位图，后台分批补齐
+            submission = scan_job_manager.request_maintenance(scan_job_manager.MAINTENANCE_BACKFILL_PLACEHOLDERS)
+            print(f"部分缩略图缺少占位图，已在后台开始补齐 (任务 #{submission['job_id']})。")
+    finally:
+        db.close()
+    if settings.thumbnail_generation == "lazy":
+        thumbnail_queue.start_thumbnail_queue(settings.thumbnails_storage_path, settings.lazy_thumbnail_workers)
+    if settings.watch_mode != library_watcher.WATCH_MODE_OFF:
+        library_watcher.start_library_watcher(
+            settings.video_paths, settings.watch_mode, settings.watch_poll_interval_seconds, settings.watch_debounce_seconds
+        )
+        print(f"后端服务已启动。视频库监视模式: {settings.watch_mode}，新文件会自动入库。")
+    else:
+        print("后端服务已启动。视频库扫描需通过 API (/api/scan-library) 手动触发。")
 
 app.include_router(general_api.router)
 
@@ -74,4 +163,8 @@ async def read_root_app():
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    print("忘忧露后端正在关闭。")
\ No newline at end of file
+    print("忘忧露后端正在关闭。")
+    library_watcher.stop_library_watcher()
+    scan_job_manager.cancel_current_job()
+    thumbnail_queue.stop_thumbnail_queue()
+    thumbnail_pack.close_all_packs()
\ No newline at end of file
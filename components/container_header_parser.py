@@ -0,0 +1,342 @@
+import os
+import struct
+from typing import Optional
+
+# 纯 Python 读取常见容器头部中的时长、分辨率、编码、帧率和音轨数，不需要启动 ffprobe 进程。
+# MP4/MOV 读取 moov/mvhd、trak/mdia/hdlr、stsd (或 tkhd) 与 stts，Matroska/WebM 读取 EBML 的 Info 与 Tracks 元素。
+# 时长和宽高任何一项解析不到就返回 None，由调用方回退到 ffprobe；编码/帧率解析不到时对应字段为 None。
+
+MP4_EXTENSIONS = {".mp4", ".mov"}
+MATROSKA_EXTENSIONS = {".mkv", ".webm"}
+
+_MP4_CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+_MAX_STTS_READ = 256 * 1024 # 可变帧率文件的 stts 可能很长，超过此大小就不计算帧率
+# 编码名称与 ffprobe 的 codec_name 保持一致，方便统计时合并
+_MP4_CODEC_NAMES = {
+    b"avc1": "h264", b"avc3": "h264", b"hvc1": "hevc", b"hev1": "hevc", b"av01": "av1",
+    b"vp09": "vp9", b"vp08": "vp8", b"mp4v": "mpeg4", b"jpeg": "mjpeg", b"mjpa": "mjpeg",
+    b"apch": "prores", b"apcn": "prores", b"apcs": "prores", b"apco": "prores", b"ap4h": "prores",
+}
+_MKV_CODEC_NAMES = {
+    "V_MPEG4/ISO/AVC": "h264", "V_MPEGH/ISO/HEVC": "hevc", "V_AV1": "av1", "V_VP9": "vp9",
+    "V_VP8": "vp8", "V_MPEG4/ISO/ASP": "mpeg4", "V_MPEG2": "mpeg2video", "V_MJPEG": "mjpeg", "V_THEORA": "theora",
+}
+_MAX_MKV_ELEMENT_READ = 4 * 1024 * 1024 # Info/Tracks 超过此大小视为异常，交给 ffprobe
+
+_EBML_HEADER_ID = 0x1A45DFA3
+_EBML_DOCTYPE_ID = 0x4282
+_MKV_SEGMENT_ID = 0x18538067
+_MKV_INFO_ID = 0x1549A966
+_MKV_TRACKS_ID = 0x1654AE6B
+_MKV_CLUSTER_ID = 0x1F43B675
+_MKV_TIMESTAMP_SCALE_ID = 0x2AD7B1
+_MKV_DURATION_ID = 0x4489
+_MKV_TRACK_ENTRY_ID = 0xAE
+_MKV_TRACK_TYPE_ID = 0x83
+_MKV_CODEC_ID = 0x86
+_MKV_DEFAULT_DURATION_ID = 0x23E383
+_MKV_TRACK_VIDEO_ID = 0xE0
+_MKV_PIXEL_WIDTH_ID = 0xB0
+_MKV_PIXEL_HEIGHT_ID = 0xBA
+_MKV_TRACK_TYPE_VIDEO = 1
+_MKV_TRACK_TYPE_AUDIO = 2
+
+
+def can_parse(video_path: str) -> bool:
+    ext = os.path.splitext(video_path)[1].lower()
+    return ext in MP4_EXTENSIONS or ext in MATROSKA_EXTENSIONS
+
+
+def parse_container_metadata(video_path: str) -> Optional[dict]:
+    """
+    返回 {"duration", "width", "height", "video_codec", "bitrate", "frame_rate", "audio_track_count"}。
+    时长和宽高都能从容器头部得到时才返回，否则返回 None。bitrate 为整个文件的平均码率 (bit/s)。
+    """
+    ext = os.path.splitext(video_path)[1].lower()
+    try:
+        with open(video_path, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if ext in MP4_EXTENSIONS:
+                metadata = _parse_mp4(f, file_size)
+            elif ext in MATROSKA_EXTENSIONS:
+                metadata = _parse_matroska(f, file_size)
+            else:
+                return None
+    except (OSError, struct.error, ValueError, IndexError) as e:
+        print(f"[HEADER_PARSER] 解析容器头部失败 for '{video_path}': {e}")
+        return None
+    if not metadata or metadata.get("duration_seconds") is None or not metadata.get("width") or not metadata.get("height"):
+        return None
+    duration_seconds = metadata.pop("duration_seconds")
+    metadata["duration"] = int(duration_seconds)
+    metadata["bitrate"] = int(file_size * 8 / duration_seconds) if duration_seconds > 0 else None
+    return metadata
+
+
+# --- MP4 / MOV ---------------------------------------------------------------
+
+def _iter_mp4_boxes(f, start: int, end: int):
+    """依次产生 (box_type, box_start, box_size, header_size)，通过 seek 跳过 box 内容。"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            large_size = f.read(8)
+            if len(large_size) < 8:
+                return
+            size = struct.unpack(">Q", large_size)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_size or pos + size > end:
+            return
+        yield box_type, pos, size, header_size
+        pos += size
+
+
+def _read_box_payload(f, box_start: int, header_size: int, length: int) -> bytes:
+    f.seek(box_start + header_size)
+    return f.read(length)
+
+
+def _parse_mvhd(payload: bytes):
+    version = payload[0]
+    if version == 1:
+        timescale, duration = struct.unpack(">IQ", payload[20:32])
+        unknown = duration == 0xFFFFFFFFFFFFFFFF
+    else:
+        timescale, duration = struct.unpack(">II", payload[12:20])
+        unknown = duration == 0xFFFFFFFF
+    if not timescale or not duration or unknown:
+        return None
+    return duration / timescale
+
+
+def _parse_mp4_track(f, trak_start: int, trak_end: int) -> Optional[dict]:
+    track = {"handler": None, "duration": None, "tkhd_size": None, "stsd_size": None, "codec": None, "sample_count": None}
+    pending = [(trak_start, trak_end)]
+    while pending:
+        start, end = pending.pop()
+        for box_type, box_start, box_size, header_size in _iter_mp4_boxes(f, start, end):
+            if box_type in _MP4_CONTAINER_BOXES:
+                pending.append((box_start + header_size, box_start + box_size))
+            elif box_type == b"tkhd":
+                payload = _read_box_payload(f, box_start, header_size, min(box_size - header_size, 96))
+                if len(payload) >= 8:
+                    # tkhd 末尾是 16.16 定点数的宽和高
+                    width, height = struct.unpack(">II", payload[-8:])
+                    track["tkhd_size"] = (width >> 16, height >> 16)
+            elif box_type == b"hdlr" and track["handler"] is None:
+                # QuickTime 的 minf 里还有一个数据引用 hdlr (dhlr/alis)，只取先出现的 mdia/hdlr
+                payload = _read_box_payload(f, box_start, header_size, 12)
+                if len(payload) >= 12:
+                    track["handler"] = payload[8:12]
+            elif box_type == b"mdhd":
+                payload = _read_box_payload(f, box_start, header_size, 32)
+                if len(payload) >= 20:
+                    track["duration"] = _parse_mvhd(payload)
+            elif box_type == b"stsd":
+                payload = _read_box_payload(f, box_start, header_size, 44)
+                # fullbox(4) + entry_count(4) + VisualSampleEntry: size(4) format(4) reserved(6) index(2) pre_defined/reserved(16) width(2) height(2)
+                if len(payload) >= 16:
+                    fourcc = payload[12:16]
+                    track["codec"] = _MP4_CODEC_NAMES.get(fourcc, fourcc.decode("latin-1").strip().lower() or None)
+                if len(payload) >= 44:
+                    width, height = struct.unpack(">HH", payload[40:44])
+                    track["stsd_size"] = (width, height)
+            elif box_type == b"stts" and box_size - header_size <= _MAX_STTS_READ:
+                payload = _read_box_payload(f, box_start, header_size, box_size - header_size)
+                if len(payload) >= 8:
+                    entry_count = struct.unpack(">I", payload[4:8])[0]
+                    entries = payload[8:8 + entry_count * 8]
+                    if len(entries) == entry_count * 8:
+                        track["sample_count"] = sum(struct.unpack(">%dI" % (entry_count * 2), entries)[0::2])
+    return track
+
+
+def _parse_mp4(f, file_size: int) -> Optional[dict]:
+    moov = None
+    for box_type, box_start, box_size, header_size in _iter_mp4_boxes(f, 0, file_size):
+        if box_type == b"moov":
+            moov = (box_start + header_size, box_start + box_size)
+            break
+    if moov is None:
+        return None
+
+    duration = None
+    video_track = None
+    audio_track_count = 0
+    for box_type, box_start, box_size, header_size in _iter_mp4_boxes(f, moov[0], moov[1]):
+        if box_type == b"mvhd":
+            duration = _parse_mvhd(_read_box_payload(f, box_start, header_size, 32))
+        elif box_type == b"trak":
+            track = _parse_mp4_track(f, box_start + header_size, box_start + box_size)
+            if track["handler"] == b"vide" and video_track is None:
+                video_track = track
+            elif track["handler"] == b"soun":
+                audio_track_count += 1
+    if video_track is None:
+        return None
+
+    if duration is None:
+        duration = video_track["duration"]
+    size = video_track["stsd_size"] if video_track["stsd_size"] and all(video_track["stsd_size"]) else video_track["tkhd_size"]
+    if duration is None or not size:
+        return None
+    frame_rate = None
+    if video_track["sample_count"] and video_track["duration"]:
+        frame_rate = round(video_track["sample_count"] / video_track["duration"], 3)
+    return {
+        "duration_seconds": duration, "width": size[0], "height": size[1], "video_codec": video_track["codec"],
+        "frame_rate": frame_rate, "audio_track_count": audio_track_count,
+    }
+
+
+# --- Matroska / WebM ---------------------------------------------------------
+
+def _read_vint(data: bytes, pos: int, keep_marker: bool):
+    first = data[pos]
+    if first == 0:
+        raise ValueError("invalid EBML variable-length integer")
+    length = 1
+    mask = 0x80
+    while not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8 or len(data) < pos + length:
+        raise ValueError("truncated EBML variable-length integer")
+    value = first if keep_marker else first & (mask - 1)
+    all_ones = (first & (mask - 1)) == mask - 1
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+        all_ones = all_ones and byte == 0xFF
+    if not keep_marker and all_ones:
+        value = None # 未知大小
+    return value, pos + length
+
+
+def _read_element_header(f):
+    """从文件当前位置读取 EBML 元素头，返回 (element_id, data_size 或 None, header_length)，文件位置停在元素数据开头。"""
+    start = f.tell()
+    head = f.read(12)
+    if len(head) < 2:
+        return None
+    element_id, pos = _read_vint(head, 0, keep_marker=True)
+    data_size, pos = _read_vint(head, pos, keep_marker=False)
+    f.seek(start + pos)
+    return element_id, data_size, pos
+
+
+def _iter_elements(data: bytes):
+    pos = 0
+    while pos < len(data):
+        element_id, pos = _read_vint(data, pos, keep_marker=True)
+        data_size, pos = _read_vint(data, pos, keep_marker=False)
+        if data_size is None:
+            return
+        yield element_id, data[pos:pos + data_size]
+        pos += data_size
+
+
+def _read_uint(payload: bytes) -> int:
+    return int.from_bytes(payload, "big") if payload else 0
+
+
+def _read_float(payload: bytes) -> Optional[float]:
+    if len(payload) == 4:
+        return struct.unpack(">f", payload)[0]
+    if len(payload) == 8:
+        return struct.unpack(">d", payload)[0]
+    return None
+
+
+def _parse_matroska(f, file_size: int) -> Optional[dict]:
+    header = _read_element_header(f)
+    if not header or header[0] != _EBML_HEADER_ID or header[1] is None or header[1] > 4096:
+        return None
+    ebml_header = f.read(header[1])
+    doc_type = None
+    for element_id, payload in _iter_elements(ebml_header):
+        if element_id == _EBML_DOCTYPE_ID:
+            doc_type = payload.rstrip(b"\x00")
+    if doc_type not in (b"matroska", b"webm"):
+        return None
+
+    segment_header_start = f.tell()
+    segment = _read_element_header(f)
+    if not segment or segment[0] != _MKV_SEGMENT_ID:
+        return None
+    segment_data_start = segment_header_start + segment[2]
+    segment_end = file_size if segment[1] is None else min(file_size, segment_data_start + segment[1])
+
+    info_payload, tracks_payload = None, None
+    pos = segment_data_start
+    while pos < segment_end and (info_payload is None or tracks_payload is None):
+        f.seek(pos)
+        element = _read_element_header(f)
+        if not element or element[1] is None:
+            break
+        element_id, data_size, header_length = element
+        if element_id == _MKV_CLUSTER_ID:
+            break # Info/Tracks 不在媒体数据之前，交给 ffprobe
+        if element_id in (_MKV_INFO_ID, _MKV_TRACKS_ID):
+            if data_size > _MAX_MKV_ELEMENT_READ:
+                return None
+            f.seek(pos + header_length)
+            payload = f.read(data_size)
+            if element_id == _MKV_INFO_ID:
+                info_payload = payload
+            else:
+                tracks_payload = payload
+        pos += header_length + data_size
+    if info_payload is None or tracks_payload is None:
+        return None
+
+    timestamp_scale = 1000000
+    raw_duration = None
+    for element_id, payload in _iter_elements(info_payload):
+        if element_id == _MKV_TIMESTAMP_SCALE_ID:
+            timestamp_scale = _read_uint(payload) or timestamp_scale
+        elif element_id == _MKV_DURATION_ID:
+            raw_duration = _read_float(payload)
+    if raw_duration is None:
+        return None
+
+    width, height, video_codec, frame_rate = None, None, None, None
+    audio_track_count = 0
+    for element_id, track_entry in _iter_elements(tracks_payload):
+        if element_id != _MKV_TRACK_ENTRY_ID:
+            continue
+        track_type, video_payload, codec_id, default_duration = None, None, None, None
+        for child_id, child_payload in _iter_elements(track_entry):
+            if child_id == _MKV_TRACK_TYPE_ID:
+                track_type = _read_uint(child_payload)
+            elif child_id == _MKV_TRACK_VIDEO_ID:
+                video_payload = child_payload
+            elif child_id == _MKV_CODEC_ID:
+                codec_id = child_payload.rstrip(b"\x00").decode("ascii", errors="replace")
+            elif child_id == _MKV_DEFAULT_DURATION_ID:
+                default_duration = _read_uint(child_payload)
+        if track_type == _MKV_TRACK_TYPE_AUDIO:
+            audio_track_count += 1
+        elif track_type == _MKV_TRACK_TYPE_VIDEO and video_payload is not None and width is None:
+            for child_id, child_payload in _iter_elements(video_payload):
+                if child_id == _MKV_PIXEL_WIDTH_ID:
+                    width = _read_uint(child_payload)
+                elif child_id == _MKV_PIXEL_HEIGHT_ID:
+                    height = _read_uint(child_payload)
+            if codec_id:
+                video_codec = _MKV_CODEC_NAMES.get(codec_id, codec_id.split("/")[0].lower().replace("v_", "", 1))
+            if default_duration:
+                frame_rate = round(1e9 / default_duration, 3) # DefaultDuration 是每帧的纳秒数
+    if not width or not height:
+        return None
+    return {
+        "duration_seconds": raw_duration * timestamp_scale / 1e9, "width": width, "height": height,
+        "video_codec": video_codec, "frame_rate": frame_rate, "audio_track_count": audio_track_count,
+    }
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, Table, ForeignKey, Float 
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, func, Table, ForeignKey, Float, Index, event
 from sqlalchemy.orm import relationship
 from tools.db_utils import Base
+from components import pinyin_text
 
 video_tags_table = Table('video_tags', Base.metadata,
     Column('video_id', Integer, ForeignKey('videos.id'), primary_key=True),
@@ -16,26 +17,61 @@ class Video(Base):
     __tablename__ = "videos"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
+    name_pinyin = Column(String, nullable=True) # 名称的全拼和首字母 (换行分隔)，随名称一起写入，供全文索引的拼音列使用
     path = Column(String, unique=True, index=True)
     folder = Column(String, index=True)
     added_date = Column(DateTime(timezone=True), server_default=func.now())
     updated_date = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     duration = Column(Integer, nullable=True)
     width = Column(Integer, nullable=True)
-    height = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True, index=True)
     thumbnail_path = Column(String, nullable=True)
     view_count = Column(Integer, default=0)
     rating = Column(Float, default=0.0, nullable=True) 
     studio = Column(String, nullable=True, index=True)
+    file_size = Column(BigInteger, nullable=True, index=True)
+    file_mtime = Column(Float, nullable=True, index=True)
+    fingerprint = Column(String, nullable=True, index=True) # 文件大小 + 首尾数据的哈希，用于识别被移动/重命名的文件
+    missing_since = Column(DateTime(timezone=True), nullable=True, index=True) # 扫描时发现文件已不在磁盘上的时间
+    # 扫描时写入的流信息，统计和排序直接查询这些列，不再访问磁盘
+    video_codec = Column(String, nullable=True, index=True) # 与 ffprobe 的 codec_name 一致，如 h264/hevc/av1
+    bitrate = Column(Integer, nullable=True, index=True) # 整体平均码率，bit/s
+    frame_rate = Column(Float, nullable=True)
+    audio_track_count = Column(Integer, nullable=True)
+    thumbnail_version = Column(BigInteger, nullable=True) # 缩略图每次生成/关联时更新 (毫秒时间戳)，作为缩略图地址的版本参数
+    thumbnail_placeholder = Column(String, nullable=True) # 缩略图的低清占位图 (WebP data URI，约 200 字节)，列表接口直接返回
+    storyboard_path = Column(String, nullable=True) # 进度条预览雪碧图，相对缩略图目录，索引为同名 .json
+    teaser_path = Column(String, nullable=True) # 悬停预览短片 (几段拼接的低码率无声 MP4)，相对缩略图目录
     
 
     tags = relationship("Tag", secondary=video_tags_table, back_populates="videos")
     persons = relationship("Person", secondary=video_persons_table, back_populates="videos")
+    scan_failure = relationship("ScanFailure", back_populates="video", uselist=False, cascade="all, delete-orphan")
+
+    # 列表接口各排序方式的复合索引 (排序列, id)：游标分页从上一页末尾直接定位，深翻页与第一页一样快。
+    # name/studio/file_size/file_mtime/bitrate/video_codec/height 的单列索引在 SQLite 中隐含 rowid (即 id)，已可直接使用。
+    __table_args__ = (
+        Index("ix_videos_sort_duration", "duration", "id"),
+        Index("ix_videos_sort_view_count", "view_count", "id"),
+        Index("ix_videos_sort_added_date", "added_date", "id"),
+        Index("ix_videos_sort_updated_date", "updated_date", "id"),
+        Index("ix_videos_sort_rating", "rating", "id"),
+        Index("ix_videos_sort_width", "width", "id"),
+        Index("ix_videos_sort_resolution", "height", "width", "id"),
+        Index("ix_videos_sort_frame_rate", "frame_rate", "id"),
+        Index("ix_videos_sort_audio_track_count", "audio_track_count", "id"),
+        # 按片商筛选 (等值) 后排序：在片商内直接按排序列顺序读取。时长/高度/日期的范围筛选由上面对应的排序索引支撑
+        Index("ix_videos_studio_added_date", "studio", "added_date", "id"),
+        Index("ix_videos_studio_rating", "studio", "rating", "id"),
+        Index("ix_videos_studio_duration", "studio", "duration", "id"),
+        Index("ix_videos_studio_name", "studio", "name", "id"),
+    )
 
 class Tag(Base):
     __tablename__ = "tags"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True, nullable=False)
+    pinyin = Column(String, nullable=True) # 名称的全拼和首字母 (换行分隔)，随名称一起写入，不含汉字时为空
     videos = relationship("Video", secondary=video_tags_table, back_populates="tags")
     def __repr__(self): return f"<Tag(id={self.id}, name='{self.name}')>"
 
@@ -43,5 +79,49 @@ class Person(Base):
     __tablename__ = "persons"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True, nullable=False)
+    pinyin = Column(String, nullable=True) # 名称的全拼和首字母 (换行分隔)，随名称一起写入，不含汉字时为空
     videos = relationship("Video", secondary=video_persons_table, back_populates="persons")
-    def __repr__(self): return f"<Person(id={self.id}, name='{self.name}')>"
\ No newline at end of file
+    def __repr__(self): return f"<Person(id={self.id}, name='{self.name}')>"
+
+class DirectorySnapshot(Base):
+    __tablename__ = "directory_snapshots"
+    id = Column(Integer, primary_key=True, index=True)
+    path = Column(String, unique=True, index=True, nullable=False)
+    root = Column(String, index=True, nullable=False)
+    mtime = Column(Float, nullable=False)
+    entry_count = Column(Integer, nullable=False, default=0)
+    last_scanned = Column(DateTime(timezone=True), server_default=func.now())
+    def __repr__(self): return f"<DirectorySnapshot(path='{self.path}', mtime={self.mtime}, entries={self.entry_count})>"
+
+
+class ScanFailure(Base):
+    __tablename__ = "scan_failures"
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(Integer, ForeignKey('videos.id'), unique=True, index=True, nullable=False)
+    reason = Column(String, nullable=True)
+    attempt_count = Column(Integer, nullable=False, default=1)
+    file_size = Column(Integer, nullable=True)
+    file_mtime = Column(Float, nullable=True)
+    last_attempt = Column(DateTime(timezone=True), server_default=func.now())
+    next_retry_at = Column(DateTime(timezone=True), index=True)
+    video = relationship("Video", back_populates="scan_failure")
+    def __repr__(self): return f"<ScanFailure(video_id={self.video_id}, attempts={self.attempt_count}, reason='{self.reason}')>"
+
+
+class AppMetadata(Base):
+    __tablename__ = "app_metadata"
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    def __repr__(self): return f"<AppMetadata(key='{self.key}', value='{self.value}')>"
+
+
+# 通过 ORM 修改名称时同时写入拼音列；扫描器的批量插入/更新不经过 ORM 属性，在构造行数据时自行计算
+@event.listens_for(Video.name, "set")
+def _set_video_name_pinyin(target, value, oldvalue, initiator):
+    target.name_pinyin = pinyin_text.pinyin_forms(value)
+
+@event.listens_for(Tag.name, "set")
+@event.listens_for(Person.name, "set")
+def _set_name_pinyin(target, value, oldvalue, initiator):
+    target.pinyin = pinyin_text.pinyin_forms(value)
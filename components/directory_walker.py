@@ -0,0 +1,278 @@
+import fnmatch
+import os
+import queue
+import threading
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+VIDEO_EXTENSIONS = frozenset([".mp4", ".mkv", ".avi", ".mov", ".webm", ".flv", ".ts"])
+IGNORE_FILE_NAME = ".nepentheignore"
+WALK_QUEUE_SIZE = 1000 # bounded hand-off between device walkers and the scan, so a fast disk cannot run ahead unbounded
+
+# An ignore rule is (base_dir, pattern, anchored, dir_only). Rules from a .nepentheignore apply to
+# everything below the directory that contains it:
+#   *.part          any entry named like this, at any depth
+#   /Samples        anchored to the directory of the ignore file (a pattern containing "/" is anchored too)
+#   extras/         trailing "/" only matches directories
+#   # comment       blank lines and comments are skipped
+IgnoreRule = Tuple[str, str, bool, bool]
+
+
+def is_video_file_name(file_name: str) -> bool:
+    return os.path.splitext(file_name)[1].lower() in VIDEO_EXTENSIONS
+
+
+def _read_ignore_rules(dir_path: str) -> List[IgnoreRule]:
+    try:
+        with open(os.path.join(dir_path, IGNORE_FILE_NAME), "r", encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    rules = []
+    for line in lines:
+        pattern = line.strip()
+        if not pattern or pattern.startswith("#"):
+            continue
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        if pattern:
+            rules.append((dir_path, pattern, anchored, dir_only))
+    return rules
+
+
+def _is_ignored(path: str, is_dir: bool, rules: Tuple[IgnoreRule, ...]) -> bool:
+    for base_dir, pattern, anchored, dir_only in rules:
+        if dir_only and not is_dir:
+            continue
+        if anchored:
+            candidate = os.path.relpath(path, base_dir).replace(os.sep, "/")
+        else:
+            candidate = os.path.basename(path)
+        if fnmatch.fnmatch(candidate, pattern):
+            return True
+    return False
+
+
+def _relative_parts(path: str, abs_root: str) -> List[str]:
+    relative = os.path.relpath(path, abs_root)
+    if relative == os.curdir or relative.startswith(os.pardir):
+        return []
+    return relative.split(os.sep)
+
+
+def load_inherited_ignore_rules(path: str, abs_root: str) -> Tuple[IgnoreRule, ...]:
+    """Rules from the ignore files of abs_root and every directory between it and path (excluding path itself)."""
+    rules = list(_read_ignore_rules(abs_root)) if path != abs_root else []
+    current = abs_root
+    for part in _relative_parts(path, abs_root)[:-1]:
+        current = os.path.join(current, part)
+        rules.extend(_read_ignore_rules(current))
+    return tuple(rules)
+
+
+def is_path_ignored(path: str, abs_root: str) -> bool:
+    """True when path, or one of its parent directories below abs_root, matches an ignore rule."""
+    parts = _relative_parts(path, abs_root)
+    rules = tuple(_read_ignore_rules(abs_root))
+    current = abs_root
+    for index, part in enumerate(parts):
+        current = os.path.join(current, part)
+        is_last = index == len(parts) - 1
+        if _is_ignored(current, not is_last or os.path.isdir(current), rules):
+            return True
+        if not is_last:
+            rules += tuple(_read_ignore_rules(current))
+    return False
+
+
+def walk_video_files(
+    abs_root: str,
+    previous_snapshots: Dict[str, Tuple[float, int]],
+    incremental: bool,
+    walk_state: dict,
+    seen_files: Optional[Dict[Tuple[int, int], str]] = None,
+    stop_event: Optional[threading.Event] = None,
+    inherited_rules: Tuple[IgnoreRule, ...] = ()
+) -> Iterator[str]:
+    """
+    Yields video file paths under abs_root using os.scandir. In incremental mode a directory whose
+    mtime matches its snapshot is not listed again (no entries were added, removed or renamed in it);
+    its known subdirectories are still stat'ed, because a directory mtime does not change when
+    something deeper in the tree does. Fills walk_state["visited"] with every existing directory,
+    walk_state["listed"] with {path: (mtime, entry_count)} for the directories that were listed and
+    walk_state["unreadable"] with the entries that exist but could not be stat'ed or inspected
+    (permission or network errors); callers must not conclude that anything below those is gone.
+
+    Subtrees matched by .nepentheignore rules are pruned before they are entered. Symlinked
+    directories are not followed. seen_files maps (st_dev, st_ino) to the first path yielded for
+    that file, so hard links and symlinks to a file that was already yielded are skipped; symlinked
+    files are only yielded after the rest of the tree, so the real file wins over a link to it.
+    """
+    known_children = defaultdict(list)
+    if incremental:
+        for snapshot_path in previous_snapshots:
+            if snapshot_path != abs_root:
+                known_children[os.path.dirname(snapshot_path)].append(snapshot_path)
+    if seen_files is None:
+        seen_files = {}
+
+    visited = walk_state.setdefault("visited", set())
+    listed = walk_state.setdefault("listed", {})
+    unreadable = walk_state.setdefault("unreadable", set())
+    pending_dirs = [(abs_root, inherited_rules)]
+    deferred_symlinks = []
+    while pending_dirs:
+        if stop_event is not None and stop_event.is_set():
+            walk_state["interrupted"] = True
+            return
+        dir_path, parent_rules = pending_dirs.pop()
+        try:
+            # Stat before listing so that changes racing with the listing are picked up next time.
+            dir_stat = os.stat(dir_path)
+        except FileNotFoundError:
+            continue # removed since its parent was listed
+        except OSError as e:
+            print(f"[Walker] Warning: Could not stat directory {dir_path}: {e}")
+            unreadable.add(dir_path)
+            continue
+        visited.add(dir_path)
+        rules = parent_rules + tuple(_read_ignore_rules(dir_path))
+
+        previous = previous_snapshots.get(dir_path)
+        if incremental and previous is not None and previous[0] == dir_stat.st_mtime:
+            for child_path in known_children.get(dir_path, ()):
+                if not _is_ignored(child_path, True, rules):
+                    pending_dirs.append((child_path, rules))
+            continue
+
+        entry_count = 0
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    entry_count += 1
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not _is_ignored(entry.path, True, rules):
+                                pending_dirs.append((entry.path, rules))
+                            continue
+                        if not is_video_file_name(entry.name) or _is_ignored(entry.path, False, rules):
+                            continue
+                        if entry.is_symlink():
+                            deferred_symlinks.append(entry.path)
+                        elif _claim_file(seen_files, (dir_stat.st_dev, entry.inode()), entry.path):
+                            yield entry.path
+                    except OSError as e:
+                        print(f"[Walker] Warning: Could not inspect {entry.path}: {e}")
+                        unreadable.add(entry.path)
+        except OSError as e:
+            print(f"[Walker] Warning: Could not list directory {dir_path}: {e}")
+            continue
+        listed[dir_path] = (dir_stat.st_mtime, entry_count)
+
+    for link_path in deferred_symlinks:
+        try:
+            target_stat = os.stat(link_path)
+        except OSError as e:
+            print(f"[Walker] Warning: Skipping broken link {link_path}: {e}")
+            continue
+        if _claim_file(seen_files, (target_stat.st_dev, target_stat.st_ino), link_path):
+            yield link_path
+
+
+def _claim_file(seen_files: Dict[Tuple[int, int], str], file_key: Tuple[int, int], path: str) -> bool:
+    # Some filesystems (e.g. FAT/exFAT on Windows) report no file index; never dedupe on 0.
+    if not file_key[1]:
+        return True
+    first_path = seen_files.setdefault(file_key, path)
+    if first_path != path:
+        print(f"[Walker] Skipping {path}: same file as {first_path}")
+        return False
+    return True
+
+
+def _device_key(path: str):
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return ("unknown", path)
+
+
+def _walk_device_roots(root_jobs: List[dict], out_queue: queue.Queue, stop: threading.Event):
+    # One thread per device: roots on the same (spinning) disk are walked one after another so the
+    # heads do not thrash, while different disks and network mounts are walked at the same time.
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    seen_files = {}
+    try:
+        for job in root_jobs:
+            if stop.is_set():
+                break
+            for file_path in walk_video_files(job["root"], job["snapshots"], job["incremental"], job["walk_state"], seen_files, stop):
+                if not put(("file", job["root"], file_path)):
+                    return
+            if job["walk_state"].get("interrupted") or not put(("root_done", job["root"], job["walk_state"])):
+                return
+    except Exception as e:
+        print(f"[Walker] Error while walking {[job['root'] for job in root_jobs]}: {e}")
+    finally:
+        put(("device_done", None, None))
+
+
+def walk_roots_by_device(root_jobs: List[dict], stop_event: Optional[threading.Event] = None) -> Iterator[tuple]:
+    """
+    Streams ("file", root, path) events for every root job, followed by ("root_done", root, walk_state)
+    once a root has been walked completely. Each job is {"root", "snapshots", "incremental", "walk_state"}.
+    Roots are grouped by st_dev and every device gets its own walker thread; with a single device the
+    walk runs in the calling thread. Setting stop_event (or closing the generator) stops the walkers;
+    roots that were interrupted never get a "root_done" event.
+    """
+    groups = defaultdict(list)
+    for job in root_jobs:
+        job.setdefault("walk_state", {})
+        groups[_device_key(job["root"])].append(job)
+
+    if len(groups) <= 1:
+        seen_files = {}
+        for job in root_jobs:
+            for file_path in walk_video_files(job["root"], job["snapshots"], job["incremental"], job["walk_state"], seen_files, stop_event):
+                yield ("file", job["root"], file_path)
+            if job["walk_state"].get("interrupted"):
+                return
+            yield ("root_done", job["root"], job["walk_state"])
+        return
+
+    stop = threading.Event()
+    out_queue = queue.Queue(maxsize=WALK_QUEUE_SIZE)
+    threads = [
+        threading.Thread(target=_walk_device_roots, args=(group_jobs, out_queue, stop), name="nepenthe-walk", daemon=True)
+        for group_jobs in groups.values()
+    ]
+    print(f"[Walker] Walking {len(root_jobs)} root(s) on {len(groups)} device(s) in parallel.")
+    for thread in threads:
+        thread.start()
+    running = len(threads)
+    try:
+        while running:
+            if stop_event is not None and stop_event.is_set():
+                return
+            try:
+                event = out_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if event[0] == "device_done":
+                running -= 1
+                continue
+            yield event
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=5)
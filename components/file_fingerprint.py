@@ -0,0 +1,22 @@
+import hashlib
+import os
+from typing import Optional
+
+# 指纹 = SHA-1(文件大小 + 开头 2 MiB + 结尾 2 MiB)。只读取首尾少量数据，
+# 足以在视频库内区分文件，又能在文件被移动或重命名后重新识别出它。
+FINGERPRINT_CHUNK_BYTES = 2 * 1024 * 1024
+
+def compute_file_fingerprint(file_path: str, file_size: Optional[int] = None) -> Optional[str]:
+    try:
+        with open(file_path, "rb") as f:
+            if file_size is None:
+                file_size = os.fstat(f.fileno()).st_size
+            digest = hashlib.sha1(str(file_size).encode("ascii"))
+            digest.update(f.read(FINGERPRINT_CHUNK_BYTES))
+            if file_size > FINGERPRINT_CHUNK_BYTES:
+                f.seek(max(file_size - FINGERPRINT_CHUNK_BYTES, FINGERPRINT_CHUNK_BYTES))
+                digest.update(f.read(FINGERPRINT_CHUNK_BYTES))
+        return digest.hexdigest()
+    except OSError as e:
+        print(f"[Fingerprint] Failed to fingerprint {file_path}: {e}")
+        return None
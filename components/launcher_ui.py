@@ -9,6 +9,7 @@ import urllib.request
 import urllib.error
 import json
 import threading
+import time
 
 class UIManager:
     def __init__(self, app_root):
@@ -259,6 +260,8 @@ class UIManager:
                         self.log_message(f"启动器: 后端扫描API响应: {json_response.get('message', response_data)}")
                     except json.JSONDecodeError:
                         self.log_message(f"启动器: 后端扫描API响应 (非JSON): {response_data}")
+                # 扫描在后端单独的任务中运行，按钮保持禁用直到任务结束
+                self._wait_for_scan_job(f"http://{api_host}:{api_port}/api/scan-library/status")
             except urllib.error.URLError as e:
                 self.log_message(f"启动器: 调用扫描API失败 (URLError): {e.reason}")
                 messagebox.showerror("扫描失败", f"无法连接到后端扫描API: {e.reason}")
@@ -275,6 +278,33 @@ class UIManager:
         scan_thread = threading.Thread(target=send_scan_request, daemon=True)
         scan_thread.start()
 
+    def _wait_for_scan_job(self, status_url, poll_interval=2.0, log_every=15):
+        last_phase = None
+        polls = 0
+        while backend_manager.is_running():
+            try:
+                with urllib.request.urlopen(status_url, timeout=10) as response:
+                    status = json.loads(response.read().decode('utf-8'))
+            except (urllib.error.URLError, json.JSONDecodeError, OSError) as e:
+                self.log_message(f"启动器: 获取扫描进度失败: {e}")
+                return
+            job = status.get("current_job")
+            if not status.get("running") or not job:
+                finished = status.get("last_finished_job") or {}
+                self.log_message(f"启动器: 扫描任务结束，状态: {finished.get('state', '未知')}")
+                return
+            progress = job.get("progress", {})
+            if progress.get("phase") != last_phase or polls % log_every == 0:
+                last_phase = progress.get("phase")
+                eta = job.get("eta_seconds")
+                self.log_message(
+                    f"启动器: 扫描进度 [{last_phase}] 目录 {progress.get('dirs_walked', 0)}，文件 {progress.get('files_found', 0)}，"
+                    f"已处理 {progress.get('processed', 0)}/{progress.get('to_process', 0)}，错误 {progress.get('errors', 0)}"
+                    + (f"，预计剩余 {int(eta)} 秒" if eta is not None else "")
+                )
+            polls += 1
+            time.sleep(poll_interval)
+
     def _restore_scan_button(self):
         """恢复扫描按钮的状态和文本"""
         if "scan_library_button" in self.elements:
@@ -1,8 +1,17 @@
 import os
+import time
 from sqlalchemy.orm import Session
-from sqlalchemy import not_
+from sqlalchemy import not_, or_
 from typing import List
 from components import database_models as models 
+from components import thumbnail_cache
+from components import thumbnail_storage
+from components import video_previews
+
+# Files written this shortly before the clean-up started, or while it runs, are never deleted: the
+# lazy thumbnail workers run outside the scan job manager and may commit the row that references a
+# new thumbnail only after the referenced paths were read.
+RECENT_FILE_GRACE_SECONDS = 60
 
 def clean_orphaned_videos(
     db: Session, 
@@ -31,15 +40,14 @@ def clean_orphaned_videos(
         print(f"[Cleaner] Found {len(all_videos_in_db)} video records to remove as no paths are configured.")
         for video_to_delete in all_videos_in_db:
             if video_to_delete.thumbnail_path:
-                thumb_full_path = os.path.join(thumbnails_storage_path, video_to_delete.thumbnail_path)
-                if os.path.exists(thumb_full_path):
-                    try:
-                        os.remove(thumb_full_path)
-                        print(f"[Cleaner] Deleted orphaned thumbnail: {thumb_full_path}")
-                    except OSError as e:
-                        error_msg = f"Failed to delete thumbnail {thumb_full_path}: {e}"
-                        print(f"[Cleaner] Error: {error_msg}")
-                        errors.append(error_msg)
+                error_msg = thumbnail_storage.delete_thumbnail(thumbnails_storage_path, video_to_delete.thumbnail_path)
+                if error_msg:
+                    print(f"[Cleaner] Error: {error_msg}")
+                    errors.append(error_msg)
+                else:
+                    print(f"[Cleaner] Deleted orphaned thumbnail: {video_to_delete.thumbnail_path}")
+            if video_to_delete.storyboard_path or video_to_delete.teaser_path:
+                video_previews.delete_video_previews(thumbnails_storage_path, video_to_delete.id)
             db.delete(video_to_delete)
             cleaned_count += 1
     else:
@@ -72,15 +80,14 @@ def clean_orphaned_videos(
         print(f"[Cleaner] Found {len(videos_to_delete_list)} orphaned video records to remove.")
         for video_to_delete in videos_to_delete_list:
             if video_to_delete.thumbnail_path:
-                thumb_full_path = os.path.join(thumbnails_storage_path, video_to_delete.thumbnail_path)
-                if os.path.exists(thumb_full_path):
-                    try:
-                        os.remove(thumb_full_path)
-                        print(f"[Cleaner] Deleted orphaned thumbnail: {thumb_full_path}")
-                    except OSError as e:
-                        error_msg = f"Failed to delete thumbnail {thumb_full_path}: {e}"
-                        print(f"[Cleaner] Error: {error_msg}")
-                        errors.append(error_msg)
+                error_msg = thumbnail_storage.delete_thumbnail(thumbnails_storage_path, video_to_delete.thumbnail_path)
+                if error_msg:
+                    print(f"[Cleaner] Error: {error_msg}")
+                    errors.append(error_msg)
+                else:
+                    print(f"[Cleaner] Deleted orphaned thumbnail: {video_to_delete.thumbnail_path}")
+            if video_to_delete.storyboard_path or video_to_delete.teaser_path:
+                video_previews.delete_video_previews(thumbnails_storage_path, video_to_delete.id)
             db.delete(video_to_delete)
             cleaned_count += 1
             
@@ -102,27 +109,85 @@ def clean_orphaned_videos(
 
     return {"message": result_message, "cleaned_count": cleaned_count, "errors": len(errors)}
 
+def delete_videos_by_ids(db: Session, video_ids: List[int], thumbnails_storage_path: str, chunk_size: int = 500) -> int:
+    """
+    Bulk-deletes video rows together with their tag/person links, scan failure records and
+    thumbnail and preview files, without loading ORM objects. Commits once per chunk.
+    """
+    deleted_count = 0
+    for i in range(0, len(video_ids), chunk_size):
+        chunk = video_ids[i:i + chunk_size]
+        thumbnail_paths = [
+            row[0] for row in db.query(models.Video.thumbnail_path).filter(
+                models.Video.id.in_(chunk), models.Video.thumbnail_path.isnot(None)
+            )
+        ]
+        preview_video_ids = [
+            row[0] for row in db.query(models.Video.id).filter(
+                models.Video.id.in_(chunk), or_(models.Video.storyboard_path.isnot(None), models.Video.teaser_path.isnot(None))
+            )
+        ]
+        try:
+            db.execute(models.video_tags_table.delete().where(models.video_tags_table.c.video_id.in_(chunk)))
+            db.execute(models.video_persons_table.delete().where(models.video_persons_table.c.video_id.in_(chunk)))
+            db.execute(models.ScanFailure.__table__.delete().where(models.ScanFailure.video_id.in_(chunk)))
+            result = db.execute(models.Video.__table__.delete().where(models.Video.id.in_(chunk)))
+            db.commit()
+            deleted_count += result.rowcount or 0
+        except Exception as e:
+            db.rollback()
+            print(f"[Cleaner] Error: Failed to delete {len(chunk)} video record(s): {e}")
+            continue
+        for thumbnail_path in thumbnail_paths:
+            error_msg = thumbnail_storage.delete_thumbnail(thumbnails_storage_path, thumbnail_path)
+            if error_msg:
+                print(f"[Cleaner] Error: {error_msg}")
+        for video_id in preview_video_ids:
+            video_previews.delete_video_previews(thumbnails_storage_path, video_id)
+    return deleted_count
+
 def cleanup_unreferenced_thumbnail_files(db: Session, thumbnails_storage_path: str):
     print("[Cleaner] Starting cleanup of unreferenced physical thumbnail files...")
     if not os.path.isdir(thumbnails_storage_path):
         print(f"[Cleaner] Thumbnails storage path does not exist: {thumbnails_storage_path}")
         return 0
     
-    referenced_thumbnail_filenames = set()
+    # thumbnail_path is relative to the storage root ("video_1.jpg" flat, "000/000/video_1.jpg" sharded),
+    # so files of both layouts are matched by their relative path. A size variant ("video_1_s.webp")
+    # belongs to the thumbnail it was derived from and goes away with it; storyboard and teaser files
+    # are matched against Video.storyboard_path / Video.teaser_path.
+    keep_written_after = time.time() - RECENT_FILE_GRACE_SECONDS
+    referenced_thumbnail_paths = set()
     for video_thumb_path in db.query(models.Video.thumbnail_path).filter(models.Video.thumbnail_path.isnot(None)).all():
         if video_thumb_path[0]: # video_thumb_path is a tuple
-            referenced_thumbnail_filenames.add(os.path.basename(video_thumb_path[0]))
+            referenced_thumbnail_paths.add(video_thumb_path[0].replace(os.sep, "/"))
+    for preview_column in (models.Video.storyboard_path, models.Video.teaser_path):
+        for preview_path in db.query(preview_column).filter(preview_column.isnot(None)).all():
+            referenced_thumbnail_paths.add(preview_path[0])
 
     deleted_count = 0
-    for filename in os.listdir(thumbnails_storage_path):
-        if filename.lower().endswith(".jpg"): # 或者你使用的缩略图扩展名
-            if filename not in referenced_thumbnail_filenames:
-                file_to_delete = os.path.join(thumbnails_storage_path, filename)
+    for relative_path, file_to_delete in thumbnail_storage.iter_thumbnail_files(thumbnails_storage_path):
+        owner_path = thumbnail_storage.variant_master_path(relative_path) or video_previews.preview_owner_path(relative_path)
+        if owner_path is None and relative_path.lower().endswith(".jpg"): # 或者你使用的缩略图扩展名
+            owner_path = relative_path
+        if owner_path is not None:
+            if owner_path not in referenced_thumbnail_paths:
                 try:
+                    if os.stat(file_to_delete).st_mtime >= keep_written_after:
+                        continue
                     os.remove(file_to_delete)
+                    thumbnail_cache.invalidate(relative_path)
                     print(f"[Cleaner] Deleted unreferenced thumbnail file: {file_to_delete}")
                     deleted_count += 1
                 except OSError as e:
                     print(f"[Cleaner] Error deleting unreferenced thumbnail file {file_to_delete}: {e}")
+    for packed_path in thumbnail_storage.iter_packed_thumbnail_paths(thumbnails_storage_path):
+        if (thumbnail_storage.variant_master_path(packed_path) or packed_path) not in referenced_thumbnail_paths:
+            created = thumbnail_storage.packed_thumbnail_created(thumbnails_storage_path, packed_path)
+            if created is None or created >= keep_written_after:
+                continue
+            thumbnail_storage.delete_thumbnail(thumbnails_storage_path, packed_path)
+            print(f"[Cleaner] Deleted unreferenced packed thumbnail: {packed_path}")
+            deleted_count += 1
     print(f"[Cleaner] Finished cleanup of unreferenced physical thumbnail files. Deleted: {deleted_count}")
     return deleted_count
\ No newline at end of file
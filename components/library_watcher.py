@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from components import directory_walker
+from components import scan_job_manager
+from components import video_scanner
+
+# watchdog 是可选依赖：Linux 上使用 inotify，Windows 上使用 ReadDirectoryChangesW，macOS 上使用 FSEvents。
+# 未安装时所有路径都退回到定时轮询 (基于目录快照的增量扫描，只 stat 目录)。
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+    WATCHDOG_AVAILABLE = False
+
+WATCH_MODE_OFF = "off"
+WATCH_MODE_AUTO = "auto"     # 能用系统事件的路径用事件，其余路径轮询
+WATCH_MODE_POLL = "poll"     # 全部轮询，适合网络挂载 (SMB/NFS 上的变化通常不会产生本地事件)
+WATCH_MODES = (WATCH_MODE_OFF, WATCH_MODE_AUTO, WATCH_MODE_POLL)
+
+MAX_CHANGE_BATCH_SIZE = 500       # 每个任务最多携带的变化路径数，保持批次小而快
+DISPATCH_INTERVAL_SECONDS = 0.5
+
+_lock = threading.Lock()
+_observer = None
+_stop_event = None
+_threads: List[threading.Thread] = []
+_pending_changes: Dict[str, float] = {} # 路径 -> 最近一次事件的时间
+_active_config: Optional[dict] = None
+
+
+class _VideoChangeHandler(FileSystemEventHandler):
+    """把文件系统事件归并为"需要重新检查的路径"：视频文件本身，或被创建/删除/重命名的目录。"""
+
+    def on_any_event(self, event):
+        if event.event_type in ("opened", "closed_no_write"):
+            return
+        if event.is_directory:
+            # 目录的 modified 事件只说明其中某个条目变了，具体条目会有自己的事件
+            if event.event_type == "modified":
+                return
+            candidate_paths = [event.src_path, getattr(event, "dest_path", None)]
+        else:
+            candidate_paths = []
+            for path in (event.src_path, getattr(event, "dest_path", None)):
+                if not path:
+                    continue
+                if os.path.basename(path) == directory_walker.IGNORE_FILE_NAME:
+                    # 忽略规则变了，整个目录需要重新检查
+                    candidate_paths.append(os.path.dirname(path))
+                elif video_scanner.is_supported_video_file(os.path.basename(path)):
+                    candidate_paths.append(path)
+        now = time.monotonic()
+        with _lock:
+            for path in candidate_paths:
+                if path:
+                    _pending_changes[os.path.abspath(path)] = now
+
+
+def _take_settled_changes(debounce_seconds: float) -> List[str]:
+    # 只取出在 debounce 时间内没有新事件的路径：正在下载/复制的文件会一直产生 modified 事件，等它写完再处理
+    cutoff = time.monotonic() - debounce_seconds
+    with _lock:
+        settled = [path for path, last_event in _pending_changes.items() if last_event <= cutoff]
+        settled = settled[:MAX_CHANGE_BATCH_SIZE]
+        for path in settled:
+            del _pending_changes[path]
+    return settled
+
+
+def _dispatch_loop(stop_event: threading.Event, debounce_seconds: float):
+    while not stop_event.wait(DISPATCH_INTERVAL_SECONDS):
+        changed_paths = _take_settled_changes(debounce_seconds)
+        if changed_paths:
+            submission = scan_job_manager.request_path_changes(changed_paths)
+            print(f"[Watcher] {len(changed_paths)} changed path(s) submitted, job #{submission['job_id']} ({submission['accepted']}).")
+
+
+def _poll_loop(stop_event: threading.Event, roots: List[str], interval_seconds: float):
+    while not stop_event.wait(interval_seconds):
+        submission = scan_job_manager.request_root_rescan(roots)
+        print(f"[Watcher] Polling {len(roots)} path(s), job #{submission['job_id']} ({submission['accepted']}).")
+
+
+def start_library_watcher(roots: List[str], mode: str, poll_interval_seconds: float, debounce_seconds: float) -> dict:
+    """启动监视；已在运行时先停止。返回实际使用事件监视和轮询的路径。"""
+    global _observer, _stop_event, _active_config
+    stop_library_watcher()
+    if mode not in WATCH_MODES:
+        print(f"[Watcher] Unknown watch mode '{mode}', watcher disabled.")
+        mode = WATCH_MODE_OFF
+    abs_roots = [os.path.abspath(root) for root in roots if os.path.isdir(root)]
+    status = {"mode": mode, "native_roots": [], "polled_roots": []}
+    if mode == WATCH_MODE_OFF or not abs_roots:
+        return status
+
+    polled_roots = list(abs_roots)
+    if mode == WATCH_MODE_AUTO:
+        if not WATCHDOG_AVAILABLE:
+            print("[Watcher] 'watchdog' is not installed, falling back to polling. Install it with: pip install watchdog")
+        else:
+            observer = Observer()
+            handler = _VideoChangeHandler()
+            polled_roots = []
+            for root in abs_roots:
+                try:
+                    observer.schedule(handler, root, recursive=True)
+                    status["native_roots"].append(root)
+                except OSError as e:
+                    # 例如 inotify 监视数量达到上限 (fs.inotify.max_user_watches)
+                    print(f"[Watcher] Cannot watch {root} with native events ({e}), polling it instead.")
+                    polled_roots.append(root)
+            if status["native_roots"]:
+                observer.start()
+                _observer = observer
+    status["polled_roots"] = polled_roots
+
+    _stop_event = threading.Event()
+    if status["native_roots"]:
+        _threads.append(threading.Thread(target=_dispatch_loop, args=(_stop_event, debounce_seconds), name="nepenthe-watch-dispatch", daemon=True))
+    if polled_roots:
+        _threads.append(threading.Thread(target=_poll_loop, args=(_stop_event, polled_roots, max(poll_interval_seconds, 5)), name="nepenthe-watch-poll", daemon=True))
+    for thread in _threads:
+        thread.start()
+    _active_config = {"roots": list(roots), "mode": mode, "poll_interval_seconds": poll_interval_seconds, "debounce_seconds": debounce_seconds}
+    print(f"[Watcher] Watching {len(status['native_roots'])} path(s) with native events, polling {len(polled_roots)} path(s) every {max(poll_interval_seconds, 5)}s.")
+    return status
+
+
+def stop_library_watcher():
+    global _observer, _stop_event, _active_config
+    if _stop_event is not None:
+        _stop_event.set()
+    if _observer is not None:
+        _observer.stop()
+        _observer.join(timeout=5)
+    for thread in _threads:
+        thread.join(timeout=5)
+    _threads.clear()
+    with _lock:
+        _pending_changes.clear()
+    _observer, _stop_event, _active_config = None, None, None
+
+
+def update_watched_roots(roots: List[str]):
+    """媒体库路径变化时用新的路径重新启动监视 (未启用监视时什么也不做)。"""
+    if _active_config is None:
+        return
+    config = dict(_active_config)
+    start_library_watcher(roots, config["mode"], config["poll_interval_seconds"], config["debounce_seconds"])
@@ -0,0 +1,46 @@
+import re
+from functools import lru_cache
+from typing import Optional, Tuple
+
+# 中文名称的拼音检索形式：全拼 (周杰伦 -> zhoujielun) 和首字母 (zjl)。
+# 名称写入时在 Python 中计算 (见 database_models 的属性事件和扫描器的批量插入)，存入 videos.name_pinyin
+# 和 tags/persons 的 pinyin 列，全文索引的触发器只复制这些列，其它连接 (sqlite3 命令行、备份工具) 写入也不受影响。
+# pypinyin 是可选依赖，未安装时结果为 None，拼音检索不可用，其余搜索不受影响。
+try:
+    from pypinyin import lazy_pinyin
+    PYPINYIN_AVAILABLE = True
+except ImportError:
+    lazy_pinyin = None
+    PYPINYIN_AVAILABLE = False
+
+_CJK_PATTERN = re.compile(r"[㐀-䶿一-鿿]")
+_NON_CJK_MARK = "\0"
+
+
+@lru_cache(maxsize=65536) # 标签、人物名称在大量视频中重复出现
+def _line_forms(line: str) -> Tuple[str, str]:
+    # 一次转换同时得到全拼和首字母：非汉字片段带上标记，首字母只取汉字音节的第一个字母
+    syllables = lazy_pinyin(line, errors=lambda chunk: [_NON_CJK_MARK + chunk])
+    full = "".join(syllable.lstrip(_NON_CJK_MARK) for syllable in syllables)
+    initials = "".join(
+        syllable[1:] if syllable.startswith(_NON_CJK_MARK) else syllable[:1] for syllable in syllables
+    )
+    return full.lower(), initials.lower()
+
+
+def pinyin_forms(*values: Optional[str]) -> Optional[str]:
+    """
+    每个含汉字的值 (多个名称可用换行分隔) 生成 "全拼\\n首字母" 两行，非汉字部分原样保留并转为小写。
+    没有汉字或 pypinyin 不可用时返回 None。
+    """
+    if not PYPINYIN_AVAILABLE:
+        return None
+    forms = []
+    for value in values:
+        if not value:
+            continue
+        for line in value.split("\n"):
+            if not _CJK_PATTERN.search(line):
+                continue
+            forms.extend(_line_forms(line))
+    return "\n".join(forms) if forms else None
@@ -0,0 +1,361 @@
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from components import database_models as models
+from components import library_cleaner
+from components import search_index
+from components import thumbnail_queue
+from components import thumbnail_storage
+from components import thumbnail_variants
+from components import video_previews
+from components import video_scanner
+from config.backend_settings import settings
+from tools.db_utils import SessionLocal, analyze_database
+
+# Single-flight coordinator for library scans and path clean-ups. At most one job runs at a time on
+# a dedicated thread; requests that arrive while it runs are merged into one pending follow-up job,
+# so repeated clicks never start overlapping scans that fight over SQLite writes and ffmpeg.
+# The library watcher submits its change batches and polling rescans through the same queue, and
+# maintenance tasks (e.g. thumbnail migration) run here too so they never race with a scan or clean-up.
+
+JOB_KIND_SCAN = "scan"
+JOB_KIND_CLEANUP = "cleanup"
+JOB_KIND_RESCAN = "rescan"
+JOB_KIND_CHANGES = "changes"
+JOB_KIND_MAINTENANCE = "maintenance"
+MAINTENANCE_MIGRATE_THUMBNAILS = "migrate_thumbnails"
+MAINTENANCE_COMPACT_THUMBNAIL_PACK = "compact_thumbnail_pack"
+MAINTENANCE_BACKFILL_PLACEHOLDERS = "backfill_thumbnail_placeholders"
+MAINTENANCE_GENERATE_STORYBOARDS = "generate_storyboards"
+MAINTENANCE_GENERATE_TEASERS = "generate_teasers"
+MAINTENANCE_REBUILD_SEARCH_INDEX = "rebuild_search_index"
+LAST_SCAN_COMPLETED_KEY = "last_scan_completed_at"
+
+# Maintenance tasks take (db, thumbnails_storage_path, cancel_event) and return a result dict.
+MAINTENANCE_TASKS = {
+    MAINTENANCE_MIGRATE_THUMBNAILS: lambda db, thumbnails_path, cancel_event: thumbnail_storage.migrate_thumbnails_to_sharded_layout(
+        db, thumbnails_path, stop_event=cancel_event
+    ),
+    MAINTENANCE_COMPACT_THUMBNAIL_PACK: lambda db, thumbnails_path, cancel_event: thumbnail_storage.compact_thumbnail_pack(thumbnails_path),
+    MAINTENANCE_BACKFILL_PLACEHOLDERS: lambda db, thumbnails_path, cancel_event: thumbnail_variants.backfill_thumbnail_placeholders(
+        db, thumbnails_path, stop_event=cancel_event
+    ),
+    MAINTENANCE_REBUILD_SEARCH_INDEX: lambda db, thumbnails_path, cancel_event: search_index.rebuild_search_index(db),
+    # Long-running: hand over to a waiting scan between batches and are re-queued after it (see _run_job).
+    MAINTENANCE_GENERATE_STORYBOARDS: lambda db, thumbnails_path, cancel_event: video_previews.generate_missing_previews(
+        video_previews.PREVIEW_KIND_STORYBOARD, db, thumbnails_path, stop_event=cancel_event, should_yield=_has_pending_job
+    ),
+    MAINTENANCE_GENERATE_TEASERS: lambda db, thumbnails_path, cancel_event: video_previews.generate_missing_previews(
+        video_previews.PREVIEW_KIND_TEASER, db, thumbnails_path, stop_event=cancel_event, should_yield=_has_pending_job
+    ),
+}
+
+_lock = threading.Lock()
+_current_job = None
+_pending_job = None
+_last_finished_job = None
+_next_job_id = 1
+
+
+def _has_pending_job() -> bool:
+    with _lock:
+        return _pending_job is not None
+
+
+def _new_job(run_scan: bool, run_cleanup: bool, paths: Optional[List[str]], full_scan: bool) -> dict:
+    global _next_job_id
+    job = {
+        "id": _next_job_id,
+        "run_scan": run_scan,
+        "run_cleanup": run_cleanup,
+        "paths": list(paths) if paths is not None else None,
+        "full_scan": full_scan,
+        "rescan_roots": set(),
+        "changed_paths": set(),
+        "maintenance_tasks": set(),
+        "state": "queued",
+        "requested_at": datetime.now(timezone.utc),
+        "started_at": None,
+        "finished_at": None,
+        "merged_requests": 0,
+        "progress": video_scanner.new_scan_progress(),
+        "result": None,
+        "error": None,
+        "cancel_event": threading.Event(),
+    }
+    _next_job_id += 1
+    return job
+
+
+def _job_kind(job: dict) -> str:
+    if job["run_scan"]:
+        return JOB_KIND_SCAN
+    if job["run_cleanup"]:
+        return JOB_KIND_CLEANUP
+    if job["rescan_roots"]:
+        return JOB_KIND_RESCAN
+    return JOB_KIND_CHANGES if job["changed_paths"] else JOB_KIND_MAINTENANCE
+
+
+def _merge_into_pending(run_scan: bool, run_cleanup: bool, paths: Optional[List[str]], full_scan: bool, rescan_roots, changed_paths, maintenance_tasks):
+    _pending_job["run_scan"] = _pending_job["run_scan"] or run_scan
+    _pending_job["full_scan"] = _pending_job["full_scan"] or full_scan
+    if run_scan or run_cleanup:
+        # The latest scan/clean-up request carries the latest configured paths, so its path list wins.
+        _pending_job["run_cleanup"] = _pending_job["run_cleanup"] or run_cleanup
+        _pending_job["paths"] = list(paths) if paths is not None else None
+    _pending_job["rescan_roots"].update(rescan_roots)
+    _pending_job["changed_paths"].update(changed_paths)
+    _pending_job["maintenance_tasks"].update(maintenance_tasks)
+    _pending_job["merged_requests"] += 1
+
+
+def _submit(run_scan: bool, run_cleanup: bool, paths: Optional[List[str]], full_scan: bool, rescan_roots=(), changed_paths=(), maintenance_tasks=()) -> dict:
+    global _current_job, _pending_job
+    with _lock:
+        current = _current_job
+        if current is None:
+            _current_job = _new_job(run_scan, run_cleanup, paths, full_scan)
+            _current_job["rescan_roots"].update(rescan_roots)
+            _current_job["changed_paths"].update(changed_paths)
+            _current_job["maintenance_tasks"].update(maintenance_tasks)
+            _current_job["state"] = "running"
+            _current_job["started_at"] = datetime.now(timezone.utc)
+            threading.Thread(target=_worker_loop, name="nepenthe-scan-job", daemon=True).start()
+            return {"accepted": "started", "job_id": _current_job["id"]}
+
+        requested_paths = list(paths) if paths is not None else None
+        still_walking = current["progress"]["phase"] in ("pending", "walking")
+        if (
+            run_scan
+            and _pending_job is None
+            and not current["cancel_event"].is_set()
+            and still_walking
+            and current["paths"] == requested_paths
+            and current["run_scan"]
+            and current["run_cleanup"] >= run_cleanup
+            and current["full_scan"] >= full_scan
+        ):
+            # The running job has not finished walking yet, so it will still see anything this request would.
+            current["merged_requests"] += 1
+            return {"accepted": "joined_running", "job_id": current["id"]}
+
+        if _pending_job is not None:
+            _merge_into_pending(run_scan, run_cleanup, paths, full_scan, rescan_roots, changed_paths, maintenance_tasks)
+            return {"accepted": "merged_into_pending", "job_id": _pending_job["id"]}
+
+        _pending_job = _new_job(run_scan, run_cleanup, paths, full_scan)
+        _pending_job["rescan_roots"].update(rescan_roots)
+        _pending_job["changed_paths"].update(changed_paths)
+        _pending_job["maintenance_tasks"].update(maintenance_tasks)
+        return {"accepted": "queued", "job_id": _pending_job["id"]}
+
+
+def request_scan(paths: Optional[List[str]] = None, full_scan: bool = False) -> dict:
+    """paths=None means settings.video_paths at the time the job starts. Post-scan clean-up is included."""
+    return _submit(True, True, paths, full_scan)
+
+
+def request_cleanup(paths: List[str]) -> dict:
+    return _submit(False, True, paths, False)
+
+
+def request_root_rescan(roots: List[str]) -> dict:
+    """Incremental scan of some roots without the orphan clean-up (which needs the full list of configured paths)."""
+    return _submit(False, False, None, False, rescan_roots=roots)
+
+
+def request_path_changes(changed_paths: List[str]) -> dict:
+    """Applies a batch of changed files/directories reported by the library watcher."""
+    return _submit(False, False, None, False, changed_paths=changed_paths)
+
+
+def request_maintenance(task: str) -> dict:
+    """Queues one of MAINTENANCE_TASKS; it runs after any scan/clean-up work of the same job."""
+    if task not in MAINTENANCE_TASKS:
+        raise ValueError(f"Unknown maintenance task: {task}")
+    return _submit(False, False, None, False, maintenance_tasks=[task])
+
+
+def cancel_current_job() -> dict:
+    """Cancels the running job cooperatively and drops the pending follow-up, if any."""
+    global _pending_job
+    with _lock:
+        dropped_pending = _pending_job is not None
+        _pending_job = None
+        if _current_job is None:
+            return {"cancelled": False, "dropped_pending": dropped_pending}
+        _current_job["cancel_event"].set()
+        return {"cancelled": True, "job_id": _current_job["id"], "dropped_pending": dropped_pending}
+
+
+def _worker_loop():
+    global _current_job, _pending_job, _last_finished_job
+    while True:
+        with _lock:
+            job = _current_job
+        _run_job(job)
+        with _lock:
+            _last_finished_job = job
+            if _pending_job is None:
+                _current_job = None
+                return
+            _current_job = _pending_job
+            _pending_job = None
+            _current_job["state"] = "running"
+            _current_job["started_at"] = datetime.now(timezone.utc)
+
+
+def _run_job(job: dict):
+    db = SessionLocal()
+    try:
+        paths = job["paths"] if job["paths"] is not None else settings.video_paths
+        thumbnails_path = settings.thumbnails_storage_path
+        print(f"[ScanJob #{job['id']}] Starting {_job_kind(job)} job for paths: {paths}")
+        cancelled = False
+        scan_kwargs = {
+            "current_thumbnails_storage_path": thumbnails_path,
+            "worker_count": settings.scan_worker_count,
+            "progress": job["progress"],
+            "cancel_event": job["cancel_event"],
+        }
+        if job["run_scan"]:
+            scan_mode = video_scanner.SCAN_MODE_FULL if job["full_scan"] else video_scanner.SCAN_MODE_INCREMENTAL
+            job["result"] = video_scanner.scan_video_folders_and_save(
+                db,
+                video_paths_to_scan=paths,
+                process_existing_missing_metadata=True,
+                scan_mode=scan_mode,
+                missing_file_grace_days=settings.missing_file_grace_days,
+                **scan_kwargs
+            )
+            cancelled = job["result"].get("cancelled", False)
+            print(f"[ScanJob #{job['id']}] Scan result: {job['result'].get('message')} Pipeline: {job['result'].get('pipeline')}")
+
+        if job["run_cleanup"] and not cancelled and not job["cancel_event"].is_set():
+            # Clean-up runs after the scan: videos moved into another configured path are relinked by
+            # fingerprint first instead of being deleted because their old path disappeared.
+            cleanup_result = library_cleaner.clean_orphaned_videos(db, paths, thumbnails_path)
+            print(f"[ScanJob #{job['id']}] Cleanup result: {cleanup_result.get('message')}")
+            if job["run_scan"]:
+                library_cleaner.cleanup_unreferenced_thumbnail_files(db, thumbnails_path)
+                # Periodic pack compaction: only once enough of the pack belongs to deleted/replaced thumbnails.
+                thumbnail_storage.compact_thumbnail_pack(thumbnails_path, thumbnail_storage.PACK_COMPACTION_MIN_DEAD_RATIO)
+                _set_metadata_value(db, LAST_SCAN_COMPLETED_KEY, datetime.now(timezone.utc).isoformat())
+
+        if job["rescan_roots"] and not job["cancel_event"].is_set():
+            job["result"] = video_scanner.scan_video_folders_and_save(
+                db,
+                video_paths_to_scan=sorted(job["rescan_roots"]),
+                scan_mode=video_scanner.SCAN_MODE_INCREMENTAL,
+                missing_file_grace_days=settings.missing_file_grace_days,
+                **scan_kwargs
+            )
+
+        if job["changed_paths"] and not job["cancel_event"].is_set():
+            job["result"] = video_scanner.apply_path_changes(
+                db, paths, sorted(job["changed_paths"]), **scan_kwargs
+            )
+
+        if (job["run_scan"] or job["run_cleanup"]) and not job["cancel_event"].is_set():
+            # Keep the planner statistics in step with the library, so list queries keep using the sort indexes.
+            analyze_database()
+
+        if job["run_scan"] or job["rescan_roots"] or job["changed_paths"]:
+            # previews for new/changed videos
+            if settings.generate_storyboards:
+                job["maintenance_tasks"].add(MAINTENANCE_GENERATE_STORYBOARDS)
+            if settings.generate_teasers:
+                job["maintenance_tasks"].add(MAINTENANCE_GENERATE_TEASERS)
+
+        for task in sorted(job["maintenance_tasks"]):
+            if job["cancel_event"].is_set():
+                break
+            print(f"[ScanJob #{job['id']}] Running maintenance task: {task}")
+            task_result = MAINTENANCE_TASKS[task](db, thumbnails_path, job["cancel_event"])
+            job["result"] = {**(job["result"] or {}), task: task_result}
+            if isinstance(task_result, dict) and task_result.get("yielded"):
+                request_maintenance(task) # continue after the job that is waiting
+
+        if thumbnail_queue.is_lazy_mode() and (job["run_scan"] or job["rescan_roots"] or job["changed_paths"]):
+            thumbnail_queue.resume_background() # new videos without thumbnails are picked up by the background pass
+
+        job["state"] = "cancelled" if cancelled or job["cancel_event"].is_set() else "finished"
+    except Exception as e:
+        job["state"] = "failed"
+        job["error"] = str(e)
+        print(f"[ScanJob #{job['id']}] Error during {_job_kind(job)} job: {e}")
+        traceback.print_exc()
+    finally:
+        job["finished_at"] = datetime.now(timezone.utc)
+        db.close()
+        print(f"[ScanJob #{job['id']}] Job {job['state']}.")
+
+
+def _set_metadata_value(db: Session, key: str, value: str):
+    entry = db.query(models.AppMetadata).filter(models.AppMetadata.key == key).first()
+    if entry is None:
+        db.add(models.AppMetadata(key=key, value=value))
+    else:
+        entry.value = value
+    db.commit()
+
+
+def get_last_scan_completed_at(db: Session) -> Optional[datetime]:
+    value = db.query(models.AppMetadata.value).filter(models.AppMetadata.key == LAST_SCAN_COMPLETED_KEY).scalar()
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _estimate_remaining_seconds(progress: dict) -> Optional[float]:
+    # Only Phase 2 has a known amount of work; the walk cannot be estimated before it has finished.
+    if progress["phase"] != "processing" or not progress["processed"]:
+        return None
+    elapsed = time.time() - progress["phase_started_at"]
+    remaining = max(progress["to_process"] - progress["processed"], 0)
+    return round(elapsed / progress["processed"] * remaining, 1)
+
+
+def _describe_job(job: Optional[dict]) -> Optional[dict]:
+    if job is None:
+        return None
+    progress = dict(job["progress"])
+    progress.pop("phase_started_at", None)
+    return {
+        "id": job["id"],
+        "kind": _job_kind(job),
+        "state": job["state"],
+        "paths": job["paths"],
+        "full_scan": job["full_scan"],
+        "rescan_roots": sorted(job["rescan_roots"]),
+        "changed_path_count": len(job["changed_paths"]),
+        "maintenance_tasks": sorted(job["maintenance_tasks"]),
+        "requested_at": job["requested_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "merged_requests": job["merged_requests"],
+        "cancel_requested": job["cancel_event"].is_set(),
+        "progress": progress,
+        "eta_seconds": _estimate_remaining_seconds(job["progress"]) if job["state"] == "running" else None,
+        "result": job["result"],
+        "error": job["error"],
+    }
+
+
+def get_status() -> dict:
+    with _lock:
+        return {
+            "running": _current_job is not None,
+            "current_job": _describe_job(_current_job),
+            "pending_job": _describe_job(_pending_job),
+            "last_finished_job": _describe_job(_last_finished_job),
+        }
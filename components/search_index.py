@@ -0,0 +1,222 @@
+import re
+import time
+from typing import Optional, Tuple
+
+from sqlalchemy import Float, Integer, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Subquery
+
+from components import database_models as models
+from components import pinyin_text
+
+# Full-text search over video name, studio, tag names and person names, backed by an SQLite FTS5 table
+# with the trigram tokenizer (any substring of three or more characters matches, so Chinese titles
+# work without word segmentation). The table is keyed by video id (rowid) and kept current by
+# triggers on videos, video_tags, video_persons, tags and persons, so every writer - scanner, API,
+# clean-up - maintains it without knowing about it. rebuild_search_index() repopulates it from scratch.
+#
+# Search terms are split on whitespace and every word must match. Words shorter than three characters
+# cannot use the trigram index and are matched with LIKE against the indexed text instead (one
+# table, no per-row subqueries). When SQLite lacks FTS5 or the trigram tokenizer (before 3.34), or
+# while a new index is still being filled, is_available() is False and callers keep their LIKE-based
+# search.
+#
+# The pinyin column holds the full pinyin and initials of the Chinese name, tags and persons
+# (see pinyin_text), so "zjl" or "zhoujielun" finds 周杰伦. Pinyin is computed in Python when a name
+# is written (videos.name_pinyin, tags.pinyin, persons.pinyin) and the triggers only copy those
+# columns: they use plain SQL, so writes from any connection (the sqlite3 shell, backup tools)
+# keep working.
+
+SEARCH_TABLE = "video_search"
+# bump when the table or trigger definitions change: the index is recreated. Whether pypinyin is
+# installed is part of the version, so installing it later fills the pinyin columns.
+SEARCH_INDEX_VERSION = "3" + ("+pinyin" if pinyin_text.PYPINYIN_AVAILABLE else "")
+SEARCH_INDEX_VERSION_KEY = "search_index_version"
+MIN_TRIGRAM_LENGTH = 3
+# bm25 column weights: name, studio, tags, persons, pinyin
+RANK_WEIGHTS = (10.0, 2.0, 4.0, 4.0, 3.0)
+SEARCH_COLUMNS = ("name", "studio", "tags", "persons", "pinyin")
+PINYIN_BATCH_SIZE = 1000
+
+_VALUE_SEPARATOR = "char(10)" # joins tag/person names; no search word contains it, so matches never span two names
+_supported: Optional[bool] = None # SQLite has FTS5 with the trigram tokenizer
+_ready = False # the index has been filled; until then callers keep their LIKE-based search
+# Triggers created by earlier index versions that no longer exist; dropped when the index is recreated.
+_OBSOLETE_TRIGGERS = ("tag_pinyin_insert", "person_pinyin_insert")
+
+
+def _insert_rows(video_id_condition: str) -> str:
+    # group_concat skips NULLs, so names without Chinese characters add nothing to the pinyin column
+    return f"""INSERT INTO {SEARCH_TABLE}(rowid, {', '.join(SEARCH_COLUMNS)})
+SELECT id, name, studio, tags, persons,
+    nullif(trim(coalesce(name_pinyin, '') || {_VALUE_SEPARATOR} || coalesce(tags_pinyin, '') || {_VALUE_SEPARATOR} || coalesce(persons_pinyin, ''), {_VALUE_SEPARATOR}), '')
+FROM (
+    SELECT v.id AS id, v.name AS name, v.studio AS studio, v.name_pinyin AS name_pinyin,
+        (SELECT group_concat(t.name, {_VALUE_SEPARATOR}) FROM video_tags vt JOIN tags t ON t.id = vt.tag_id WHERE vt.video_id = v.id) AS tags,
+        (SELECT group_concat(t.pinyin, {_VALUE_SEPARATOR}) FROM video_tags vt JOIN tags t ON t.id = vt.tag_id WHERE vt.video_id = v.id) AS tags_pinyin,
+        (SELECT group_concat(p.name, {_VALUE_SEPARATOR}) FROM video_persons vp JOIN persons p ON p.id = vp.person_id WHERE vp.video_id = v.id) AS persons,
+        (SELECT group_concat(p.pinyin, {_VALUE_SEPARATOR}) FROM video_persons vp JOIN persons p ON p.id = vp.person_id WHERE vp.video_id = v.id) AS persons_pinyin
+    FROM videos v WHERE {video_id_condition}
+)"""
+
+
+def _refresh_statements(video_id_condition: str) -> str:
+    return (
+        f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT v.id FROM videos v WHERE {video_id_condition}); "
+        f"{_insert_rows(video_id_condition)};"
+    )
+
+
+_TRIGGERS = {
+    "video_search_video_insert": f"AFTER INSERT ON videos BEGIN {_refresh_statements('v.id = NEW.id')} END",
+    # name_pinyin is written in the same statement as name; rebuild_search_index() updating only the
+    # pinyin columns must not fire the refresh triggers.
+    "video_search_video_update": f"AFTER UPDATE OF name, studio ON videos BEGIN {_refresh_statements('v.id = NEW.id')} END",
+    "video_search_video_delete": f"AFTER DELETE ON videos BEGIN DELETE FROM {SEARCH_TABLE} WHERE rowid = OLD.id; END",
+    "video_search_tag_link": f"AFTER INSERT ON video_tags BEGIN {_refresh_statements('v.id = NEW.video_id')} END",
+    "video_search_tag_unlink": f"AFTER DELETE ON video_tags BEGIN {_refresh_statements('v.id = OLD.video_id')} END",
+    "video_search_person_link": f"AFTER INSERT ON video_persons BEGIN {_refresh_statements('v.id = NEW.video_id')} END",
+    "video_search_person_unlink": f"AFTER DELETE ON video_persons BEGIN {_refresh_statements('v.id = OLD.video_id')} END",
+    "video_search_tag_rename": (
+        f"AFTER UPDATE OF name ON tags BEGIN "
+        f"{_refresh_statements('v.id IN (SELECT video_id FROM video_tags WHERE tag_id = NEW.id)')} END"
+    ),
+    "video_search_person_rename": (
+        f"AFTER UPDATE OF name ON persons BEGIN "
+        f"{_refresh_statements('v.id IN (SELECT video_id FROM video_persons WHERE person_id = NEW.id)')} END"
+    ),
+}
+
+
+def is_supported() -> bool:
+    return bool(_supported)
+
+
+def is_available() -> bool:
+    return bool(_supported) and _ready
+
+
+def _get_version(db: Session) -> Optional[str]:
+    return db.query(models.AppMetadata.value).filter(models.AppMetadata.key == SEARCH_INDEX_VERSION_KEY).scalar()
+
+
+def _set_version(db: Session, version: str):
+    entry = db.query(models.AppMetadata).filter(models.AppMetadata.key == SEARCH_INDEX_VERSION_KEY).first()
+    if entry is None:
+        db.add(models.AppMetadata(key=SEARCH_INDEX_VERSION_KEY, value=version))
+    else:
+        entry.value = version
+
+
+def _drop_search_index(db: Session):
+    for trigger_name in (*_TRIGGERS, *_OBSOLETE_TRIGGERS):
+        db.execute(text(f"DROP TRIGGER IF EXISTS {trigger_name}"))
+    db.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
+def ensure_search_index(db: Session) -> bool:
+    """
+    Creates the FTS table and its triggers if needed (called at startup, after the regular tables
+    exist). Returns True when the table is new or its definition changed and it must be filled by
+    rebuild_search_index() - a background task, as computing pinyin for a large library takes a while.
+    """
+    global _supported, _ready
+    try:
+        table_exists = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": SEARCH_TABLE}
+        ).first() is not None
+        if table_exists and _get_version(db) != SEARCH_INDEX_VERSION:
+            _drop_search_index(db)
+            table_exists = False
+        db.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5({', '.join(SEARCH_COLUMNS)}, tokenize = 'trigram')"
+        ))
+        for trigger_name, body in _TRIGGERS.items():
+            db.execute(text(f"CREATE TRIGGER IF NOT EXISTS {trigger_name} {body}"))
+        db.commit()
+    except OperationalError as e:
+        db.rollback()
+        _supported = False
+        print(f"[SearchIndex] Warning: SQLite FTS5 with the trigram tokenizer is not available ({e}); search falls back to LIKE.")
+        return False
+    _supported = True
+    _ready = table_exists
+    return not table_exists
+
+
+def _refresh_pinyin_column(db: Session, table: str, name_column: str, pinyin_column: str):
+    # Recomputes the pinyin of every row in id batches and writes only the values that changed.
+    last_id = 0
+    while True:
+        rows = db.execute(
+            text(f"SELECT id, {name_column}, {pinyin_column} FROM {table} WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": PINYIN_BATCH_SIZE}
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        changed = []
+        for row_id, name, pinyin in rows:
+            new_pinyin = pinyin_text.pinyin_forms(name)
+            if new_pinyin != pinyin:
+                changed.append({"id": row_id, "pinyin": new_pinyin})
+        if changed:
+            db.execute(text(f"UPDATE {table} SET {pinyin_column} = :pinyin WHERE id = :id"), changed)
+
+
+def rebuild_search_index(db: Session) -> dict:
+    """Repopulates the whole index (and the video/tag/person pinyin columns) from the videos table in one transaction."""
+    global _ready
+    if not _supported:
+        return {"indexed": 0, "available": False}
+    started = time.time()
+    try:
+        db.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+        _refresh_pinyin_column(db, "videos", "name", "name_pinyin")
+        for table in ("tags", "persons"):
+            _refresh_pinyin_column(db, table, "name", "pinyin")
+        db.execute(text(_insert_rows("1")))
+        db.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"))
+        _set_version(db, SEARCH_INDEX_VERSION)
+        db.commit()
+        _ready = True
+    except Exception as e:
+        db.rollback()
+        print(f"[SearchIndex] Error: Rebuild failed: {e}")
+        raise
+    indexed = db.execute(text(f"SELECT count(*) FROM {SEARCH_TABLE}")).scalar()
+    print(f"[SearchIndex] Rebuilt search index for {indexed} video(s) in {time.time() - started:.2f}s.")
+    return {"indexed": indexed, "available": True}
+
+
+def _escape_like(word: str) -> str:
+    return re.sub(r"([\\%_])", r"\\\1", word)
+
+
+def match_subquery(search_term: str) -> Tuple[Optional[Subquery], bool]:
+    """
+    (subquery of (video_id, rank) for the videos matching every word of search_term, ranked). Lower
+    rank is more relevant (bm25); ranked is False when only short words were given and every rank
+    is 0. The subquery is None when the index is unavailable or the term has no words.
+    """
+    words = search_term.split()
+    if not is_available() or not words:
+        return None, False
+    conditions, params = [], {}
+    trigram_words = [word for word in words if len(word) >= MIN_TRIGRAM_LENGTH]
+    if trigram_words:
+        # Each word as an FTS5 string (double quotes doubled), implicitly AND-ed.
+        conditions.append(f"{SEARCH_TABLE} MATCH :match")
+        params["match"] = " ".join('"' + word.replace('"', '""') + '"' for word in trigram_words)
+    for index, word in enumerate(word for word in words if len(word) < MIN_TRIGRAM_LENGTH):
+        param = f"like_{index}"
+        params[param] = f"%{_escape_like(word)}%"
+        conditions.append("(" + " OR ".join(
+            f"{column} LIKE :{param} ESCAPE '\\'" for column in SEARCH_COLUMNS
+        ) + ")")
+    rank = f"bm25({SEARCH_TABLE}, {', '.join(str(weight) for weight in RANK_WEIGHTS)})" if trigram_words else "0.0"
+    statement = text(
+        f"SELECT rowid AS video_id, {rank} AS rank FROM {SEARCH_TABLE} WHERE {' AND '.join(conditions)}"
+    ).bindparams(**params).columns(video_id=Integer, rank=Float)
+    return statement.subquery("search_matches"), bool(trigram_words)
@@ -0,0 +1,98 @@
+import os
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Optional, Tuple
+
+# 缩略图的内存 LRU 缓存与 HTTP 校验头。
+# 缩略图文件名在生成或删除时通过 invalidate() 通知缓存，命中缓存的请求完全不访问磁盘。
+
+MAX_CACHED_FILE_BYTES = 1024 * 1024 # 单个文件超过此大小不放入内存，直接由 FileResponse 发送
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable" # URL 带版本参数，内容变化时 URL 也会变化
+REVALIDATE_CACHE_CONTROL = "public, no-cache" # 没有版本参数的旧 URL：浏览器每次用 ETag 校验，未变化时返回 304
+
+_lock = threading.Lock()
+_entries: "OrderedDict[str, Tuple[bytes, dict]]" = OrderedDict() # 文件名 -> (内容, 校验头)
+_total_bytes = 0
+_max_total_bytes = 64 * 1024 * 1024
+
+
+def configure(max_total_bytes: int):
+    global _max_total_bytes
+    with _lock:
+        _max_total_bytes = max(max_total_bytes, 0)
+        _evict_locked()
+
+
+def build_validator_headers(file_stat: os.stat_result) -> dict:
+    """强 ETag 由 mtime (纳秒) 和文件大小组成，文件被重新生成后一定变化。"""
+    return {
+        "etag": f'"{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}"',
+        "last-modified": formatdate(file_stat.st_mtime, usegmt=True),
+    }
+
+
+def build_pack_validator_headers(data_offset: int, data_length: int, created: float) -> dict:
+    """打包存储的缩略图：追加写入的位置唯一，重新生成后偏移一定变化。"""
+    return {
+        "etag": f'"p{data_offset:x}-{data_length:x}"',
+        "last-modified": formatdate(created, usegmt=True),
+    }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def get(filename: str) -> Optional[Tuple[bytes, dict]]:
+    with _lock:
+        entry = _entries.get(filename)
+        if entry is not None:
+            _entries.move_to_end(filename)
+        return entry
+
+
+def put(filename: str, content: bytes, headers: dict):
+    global _total_bytes
+    if len(content) > MAX_CACHED_FILE_BYTES:
+        return
+    with _lock:
+        previous = _entries.pop(filename, None)
+        if previous is not None:
+            _total_bytes -= len(previous[0])
+        _entries[filename] = (content, headers)
+        _total_bytes += len(content)
+        _evict_locked()
+
+
+def invalidate(filename: str):
+    global _total_bytes
+    with _lock:
+        entry = _entries.pop(filename, None)
+        if entry is not None:
+            _total_bytes -= len(entry[0])
+
+
+def clear():
+    global _total_bytes
+    with _lock:
+        _entries.clear()
+        _total_bytes = 0
+
+
+def _evict_locked():
+    global _total_bytes
+    while _entries and _total_bytes > _max_total_bytes:
+        _, (content, _) = _entries.popitem(last=False)
+        _total_bytes -= len(content)
+
+
+def get_stats() -> dict:
+    with _lock:
+        return {"entries": len(_entries), "bytes": _total_bytes, "max_bytes": _max_total_bytes}
@@ -0,0 +1,185 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+# Append-only pack file for thumbnails: one file instead of one file (inode, directory entry) per
+# thumbnail, which is much faster to copy, back up and list on NTFS/ext4 and over SMB.
+#
+# Record layout: MAGIC, key length (H), data length (I), created timestamp (d), key (utf-8), data.
+# A record with data length 0 is a tombstone for its key. The in-memory index (key -> offset, length,
+# created) is rebuilt by walking the record headers when the pack is opened; reads go through an
+# mmap of the file. Space of replaced/deleted records is reclaimed by compact().
+
+PACK_FILE_NAME = "thumbnails.pack"
+MAGIC = b"NPTH"
+_HEADER = struct.Struct(">4sHId")
+
+_packs: Dict[str, "ThumbnailPack"] = {}
+_packs_lock = threading.Lock()
+
+
+class ThumbnailPack:
+
+    def __init__(self, pack_path: str):
+        self.pack_path = pack_path
+        self._lock = threading.RLock()
+        self._index: Dict[str, Tuple[int, int, float]] = {}
+        self._dead_bytes = 0
+        self._file = None
+        self._map = None
+        self._map_size = 0
+        self._open()
+
+    def _open(self):
+        self._file = open(self.pack_path, "a+b")
+        self._file.seek(0, os.SEEK_END)
+        self._index, self._dead_bytes = {}, 0
+        self._remap()
+        valid_end = self._load_index()
+        if valid_end < self._file_size():
+            # A record was cut short (crash while appending): drop the incomplete tail.
+            print(f"[ThumbnailPack] Truncating incomplete record at offset {valid_end} in {self.pack_path}")
+            self._close_map()
+            self._file.truncate(valid_end)
+            self._remap()
+
+    def _file_size(self) -> int:
+        return os.fstat(self._file.fileno()).st_size
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+        self._map, self._map_size = None, 0
+
+    def _remap(self):
+        self._close_map()
+        size = self._file_size()
+        if size:
+            self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+            self._map_size = size
+
+    def _load_index(self) -> int:
+        offset = 0
+        while offset + _HEADER.size <= self._map_size:
+            magic, key_length, data_length, created = _HEADER.unpack_from(self._map, offset)
+            record_end = offset + _HEADER.size + key_length + data_length
+            if magic != MAGIC or record_end > self._map_size:
+                break
+            key = self._map[offset + _HEADER.size:offset + _HEADER.size + key_length].decode("utf-8")
+            previous = self._index.pop(key, None)
+            if previous is not None:
+                self._dead_bytes += _HEADER.size + len(key.encode("utf-8")) + previous[1]
+            if data_length:
+                self._index[key] = (offset + _HEADER.size + key_length, data_length, created)
+            else:
+                self._dead_bytes += record_end - offset
+            offset = record_end
+        return offset
+
+    def _append(self, key: str, data: bytes) -> Tuple[int, float]:
+        encoded_key = key.encode("utf-8")
+        created = time.time()
+        self._file.seek(0, os.SEEK_END)
+        record_start = self._file.tell()
+        self._file.write(_HEADER.pack(MAGIC, len(encoded_key), len(data), created) + encoded_key + data)
+        self._file.flush()
+        previous = self._index.pop(key, None)
+        if previous is not None:
+            self._dead_bytes += _HEADER.size + len(encoded_key) + previous[1]
+        return record_start + _HEADER.size + len(encoded_key), created
+
+    def put(self, key: str, data: bytes):
+        if not data:
+            raise ValueError("Cannot store an empty thumbnail")
+        with self._lock:
+            data_offset, created = self._append(key, data)
+            self._index[key] = (data_offset, len(data), created)
+
+    def get(self, key: str) -> Optional[Tuple[bytes, int, float]]:
+        """Returns (data, data offset, created timestamp) or None."""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            data_offset, data_length, created = entry
+            if data_offset + data_length > self._map_size:
+                self._remap()
+            return self._map[data_offset:data_offset + data_length], data_offset, created
+
+    def entry(self, key: str) -> Optional[Tuple[int, int, float]]:
+        """Returns (data offset, data length, created timestamp) from the index without reading the data, or None."""
+        with self._lock:
+            return self._index.get(key)
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._index:
+                return False
+            self._append(key, b"")
+            self._dead_bytes += _HEADER.size + len(key.encode("utf-8"))
+            return True
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._index
+
+    def keys(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._index))
+
+    def stats(self) -> dict:
+        with self._lock:
+            total_bytes = self._file_size()
+            return {
+                "entries": len(self._index),
+                "file_bytes": total_bytes,
+                "dead_bytes": self._dead_bytes,
+                "dead_ratio": round(self._dead_bytes / total_bytes, 3) if total_bytes else 0.0,
+            }
+
+    def compact(self) -> dict:
+        """Rewrites the live records into a new file and swaps it in; readers wait on the lock meanwhile."""
+        with self._lock:
+            before = self._file_size()
+            temp_path = self.pack_path + ".compact"
+            with open(temp_path, "wb") as out:
+                for key, (data_offset, data_length, created) in self._index.items():
+                    encoded_key = key.encode("utf-8")
+                    out.write(_HEADER.pack(MAGIC, len(encoded_key), data_length, created) + encoded_key)
+                    out.write(self._map[data_offset:data_offset + data_length])
+                out.flush()
+                os.fsync(out.fileno())
+            # The mapping and handle must be closed before the file can be replaced on Windows.
+            self._close_map()
+            self._file.close()
+            os.replace(temp_path, self.pack_path)
+            self._open()
+            after = self._file_size()
+        print(f"[ThumbnailPack] Compacted {self.pack_path}: {before} -> {after} bytes, {len(self._index)} thumbnail(s).")
+        return {"bytes_before": before, "bytes_after": after, "entries": len(self._index)}
+
+    def close(self):
+        with self._lock:
+            self._close_map()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def get_thumbnail_pack(thumbnails_storage_path: str) -> ThumbnailPack:
+    pack_path = os.path.join(os.path.abspath(thumbnails_storage_path), PACK_FILE_NAME)
+    with _packs_lock:
+        pack = _packs.get(pack_path)
+        if pack is None:
+            pack = _packs[pack_path] = ThumbnailPack(pack_path)
+        return pack
+
+
+def close_all_packs():
+    with _packs_lock:
+        for pack in _packs.values():
+            pack.close()
+        _packs.clear()
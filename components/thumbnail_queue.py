@@ -0,0 +1,243 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from components import database_models as models
+from components import thumbnail_storage
+from components import video_metadata_extractor
+from tools.db_utils import SessionLocal
+
+# Lazy thumbnail generation. Instead of rendering every thumbnail during Phase 2 of a scan, thumbnails
+# are rendered by a few worker threads on demand: videos the UI is showing are queued at visible
+# priority (most recently requested first), and whenever nothing is requested the workers page
+# through the remaining videos without a thumbnail in id order. A freshly imported library is
+# browsable right after the (metadata-only) scan.
+
+PRIORITY_VISIBLE = 0
+PRIORITY_BACKGROUND = 10
+BACKGROUND_BATCH_SIZE = 200
+FAILED_RETRY_SECONDS = 3600 # a video whose thumbnail failed is not retried in the background for this long
+
+_cond = threading.Condition()
+_heap: List[tuple] = []                     # (priority, -sequence, video_id)
+_queued: Dict[int, int] = {}                # video_id -> best priority currently queued
+_in_progress: Dict[int, threading.Event] = {}
+_waiters: Dict[int, threading.Event] = {}
+_failed_at: Dict[int, float] = {}
+_sequence = itertools.count()
+_background_ids: List[int] = []
+_background_after_id = 0
+_background_exhausted = False
+_background_refilling = False
+_workers: List[threading.Thread] = []
+_stop_event: Optional[threading.Event] = None
+_thumbnails_storage_path: Optional[str] = None
+
+
+def is_lazy_mode() -> bool:
+    return _stop_event is not None and not _stop_event.is_set()
+
+
+def start_thumbnail_queue(thumbnails_storage_path: str, worker_count: int):
+    global _stop_event, _thumbnails_storage_path
+    stop_thumbnail_queue()
+    _thumbnails_storage_path = thumbnails_storage_path
+    _stop_event = threading.Event()
+    resume_background()
+    for index in range(max(worker_count, 1)):
+        thread = threading.Thread(target=_worker_loop, args=(_stop_event,), name=f"nepenthe-thumb-{index}", daemon=True)
+        _workers.append(thread)
+        thread.start()
+    print(f"[ThumbQueue] Lazy thumbnail generation started with {len(_workers)} worker(s).")
+
+
+def stop_thumbnail_queue():
+    global _stop_event
+    if _stop_event is None:
+        return
+    _stop_event.set()
+    with _cond:
+        _cond.notify_all()
+    for thread in _workers:
+        thread.join(timeout=5)
+    _workers.clear()
+    with _cond:
+        _heap.clear()
+        _queued.clear()
+        for event in _waiters.values():
+            event.set()
+        _waiters.clear()
+    _stop_event = None
+
+
+def request_thumbnails(video_ids: Iterable[int], priority: int = PRIORITY_VISIBLE) -> Dict[int, threading.Event]:
+    """
+    Queues the videos (or raises their priority) and returns an event per video that is set once its
+    thumbnail has been attempted. Later requests at the same priority are served first, so the page
+    the user has just scrolled to wins over pages already scrolled past.
+    """
+    events = {}
+    with _cond:
+        for video_id in video_ids:
+            events[video_id] = _waiters.setdefault(video_id, _in_progress.get(video_id) or threading.Event())
+            if video_id in _in_progress:
+                continue
+            if priority == PRIORITY_VISIBLE:
+                _failed_at.pop(video_id, None) # the user is looking at it: try again now
+            current = _queued.get(video_id)
+            if current is None or priority <= current:
+                _queued[video_id] = priority
+                heapq.heappush(_heap, (priority, -next(_sequence), video_id))
+        _cond.notify_all()
+    return events
+
+
+def resume_background():
+    """Restarts the background pass from the lowest id, e.g. after a scan added new videos."""
+    global _background_after_id, _background_exhausted
+    with _cond:
+        _background_after_id, _background_exhausted = 0, False
+        _background_ids.clear()
+        _cond.notify_all()
+
+
+def get_status() -> dict:
+    with _cond:
+        return {
+            "lazy": is_lazy_mode(),
+            "queued_visible": sum(1 for priority in _queued.values() if priority == PRIORITY_VISIBLE),
+            "queued_background": sum(1 for priority in _queued.values() if priority != PRIORITY_VISIBLE) + len(_background_ids),
+            "in_progress": len(_in_progress),
+            "background_done": _background_exhausted,
+            "recently_failed": len(_failed_at),
+        }
+
+
+def _claim_background_refill_locked() -> Optional[int]:
+    # The id to continue the background pass after, when this worker should fetch the next batch;
+    # None when the pass is finished or another worker is already fetching.
+    global _background_refilling
+    if _background_exhausted or _background_refilling:
+        return None
+    _background_refilling = True
+    return _background_after_id
+
+
+def _query_background_batch(after_id: int) -> List[int]:
+    # Runs without _cond held, so request_thumbnails() never waits for the database.
+    from components.video_scanner import not_quarantined_filter # video_scanner imports this module
+    db = SessionLocal()
+    try:
+        rows = db.query(models.Video.id).filter(
+            models.Video.id > after_id,
+            models.Video.thumbnail_path.is_(None),
+            models.Video.missing_since.is_(None),
+            not_quarantined_filter()
+        ).order_by(models.Video.id).limit(BACKGROUND_BATCH_SIZE).all()
+    finally:
+        db.close()
+    return [row[0] for row in rows]
+
+
+def _extend_background_locked(after_id: int, video_ids: Optional[List[int]]):
+    global _background_after_id, _background_exhausted, _background_refilling
+    _background_refilling = False
+    if video_ids is None or after_id != _background_after_id:
+        return # the query failed, or resume_background() restarted the pass meanwhile
+    if not video_ids:
+        _background_exhausted = True
+        print("[ThumbQueue] Background pass finished: every video has a thumbnail or is waiting for a retry.")
+        return
+    _background_after_id = video_ids[-1]
+    now = time.time()
+    _background_ids.extend(video_id for video_id in video_ids if now - _failed_at.get(video_id, 0) >= FAILED_RETRY_SECONDS)
+
+
+def _take_next_locked() -> Optional[int]:
+    while _heap:
+        priority, _, video_id = heapq.heappop(_heap)
+        if _queued.get(video_id) != priority:
+            continue # superseded by a higher-priority entry for the same video
+        del _queued[video_id]
+        return video_id
+    while _background_ids:
+        video_id = _background_ids.pop(0)
+        if video_id not in _in_progress:
+            return video_id
+    return None
+
+
+def _worker_loop(stop_event: threading.Event):
+    while not stop_event.is_set():
+        refill_after_id = None
+        with _cond:
+            video_id = _take_next_locked()
+            if video_id is None:
+                refill_after_id = _claim_background_refill_locked()
+                if refill_after_id is None:
+                    _cond.wait(timeout=5)
+                    continue
+            else:
+                _in_progress[video_id] = _waiters.setdefault(video_id, threading.Event())
+        if video_id is None:
+            video_ids = None
+            try:
+                video_ids = _query_background_batch(refill_after_id)
+            except Exception as e:
+                print(f"[ThumbQueue] Error while loading the next background batch: {e}")
+            with _cond:
+                _extend_background_locked(refill_after_id, video_ids)
+                _cond.notify_all()
+            if video_ids is None:
+                stop_event.wait(5)
+            continue
+        try:
+            _generate_thumbnail(video_id)
+        except Exception as e:
+            print(f"[ThumbQueue] Error while generating thumbnail for video {video_id}: {e}")
+            _failed_at[video_id] = time.time()
+        finally:
+            with _cond:
+                event = _in_progress.pop(video_id)
+                _waiters.pop(video_id, None)
+            event.set()
+
+
+def _generate_thumbnail(video_id: int):
+    db = SessionLocal()
+    try:
+        from components.video_scanner import record_scan_failures # video_scanner imports this module
+        row = db.query(
+            models.Video.path, models.Video.thumbnail_path, models.Video.file_size, models.Video.file_mtime
+        ).filter(models.Video.id == video_id).first()
+        if row is None or row[1]:
+            return
+        thumbnail_path, placeholder, error = video_metadata_extractor.render_thumbnail(row[0], video_id, _thumbnails_storage_path)
+        if not thumbnail_path:
+            print(f"[ThumbQueue] Thumbnail for video {video_id} failed: {error}")
+            _failed_at[video_id] = time.time()
+            # Same quarantine as Phase 2: the background pass skips the video until its retry time,
+            # also after a restart, and the backoff grows while the file stays unchanged.
+            record_scan_failures(db, [{
+                "id": video_id, "error": f"thumbnail: {error}", "file_size": row[2], "file_mtime": row[3]
+            }])
+            db.commit()
+            return
+        _failed_at.pop(video_id, None)
+        db.execute(models.ScanFailure.__table__.delete().where(models.ScanFailure.video_id == video_id))
+        db.query(models.Video).filter(models.Video.id == video_id).update(
+            {
+                "thumbnail_path": thumbnail_path,
+                "thumbnail_placeholder": placeholder,
+                "thumbnail_version": thumbnail_storage.new_thumbnail_version(),
+            },
+            synchronize_session=False
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,328 @@
+import mimetypes
+import os
+import re
+import threading
+import time
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from components import database_models as models
+from components import thumbnail_cache
+from components import thumbnail_pack
+
+# Thumbnails used to be stored flat as video_{id}.jpg directly in the storage directory. New ones go
+# into a two-level id-prefix fan-out, e.g. video 1234567 -> 001/234/video_1234567.jpg, so no directory
+# holds more than SHARD_FAN_OUT entries. thumbnail_path stores the relative path with "/" separators.
+# Rows still pointing at flat files keep working until the migrator has moved them.
+#
+# With THUMBNAIL_STORE = "pack" new thumbnails go into a single pack file instead (see thumbnail_pack)
+# and thumbnail_path is "pack/video_{id}.jpg". Thumbnails already stored as files keep being served.
+
+THUMBNAIL_STORE_FILES = "files"
+THUMBNAIL_STORE_PACK = "pack"
+THUMBNAIL_STORE = THUMBNAIL_STORE_FILES
+PACK_PATH_PREFIX = "pack/"
+PACK_COMPACTION_MIN_DEAD_RATIO = 0.3 # compact after a scan once this share of the pack is replaced/deleted records
+
+SHARD_FAN_OUT = 1000
+MIGRATION_BATCH_SIZE = 500
+_FLAT_THUMBNAIL_PATTERN = re.compile(r"^video_(\d+)\.jpg$")
+_VIDEO_ID_PATTERN = re.compile(r"^video_(\d+)\.")
+
+# Size variants are WebP files derived from a thumbnail and stored next to it (in the same store):
+# 000/000/video_1.jpg -> 000/000/video_1_s.webp, pack/video_1.jpg -> pack/video_1_s.webp.
+THUMBNAIL_VARIANT_WIDTHS = {"s": 160, "m": 320, "l": 640}
+_VARIANT_PATTERN = re.compile(r"^(?P<base>.*video_\d+)_(?P<size>[a-z]+)\.webp$")
+
+
+def sharded_thumbnail_path(video_id: int, extension: str = "jpg") -> str:
+    top = video_id // (SHARD_FAN_OUT * SHARD_FAN_OUT)
+    middle = video_id // SHARD_FAN_OUT % SHARD_FAN_OUT
+    return f"{top:03d}/{middle:03d}/video_{video_id}.{extension}"
+
+
+def new_thumbnail_version() -> int:
+    """Value for Video.thumbnail_version whenever a (re)generated thumbnail is recorded; the ?v= of its URLs."""
+    return time.time_ns() // 1_000_000
+
+
+def thumbnail_full_path(thumbnails_storage_path: str, relative_path: str) -> str:
+    return os.path.join(thumbnails_storage_path, *relative_path.split("/"))
+
+
+def is_flat_thumbnail_path(relative_path: str) -> bool:
+    return "/" not in relative_path
+
+
+def is_pack_thumbnail_path(relative_path: str) -> bool:
+    return relative_path.startswith(PACK_PATH_PREFIX)
+
+
+def video_id_from_thumbnail_path(relative_path: str) -> Optional[int]:
+    match = _VIDEO_ID_PATTERN.match(relative_path.rsplit("/", 1)[-1])
+    return int(match.group(1)) if match else None
+
+
+def variant_relative_path(thumbnail_path: str, size: str) -> str:
+    return f"{os.path.splitext(thumbnail_path)[0]}_{size}.webp"
+
+
+def variant_master_path(relative_path: str) -> Optional[str]:
+    """For a size variant, the thumbnail_path it was derived from (always a .jpg); None for anything else."""
+    match = _VARIANT_PATTERN.match(relative_path)
+    if not match or match.group("size") not in THUMBNAIL_VARIANT_WIDTHS:
+        return None
+    return match.group("base") + ".jpg"
+
+
+def delete_thumbnail_variants(thumbnails_storage_path: str, thumbnail_path: str):
+    for size in THUMBNAIL_VARIANT_WIDTHS:
+        _delete_stored_file(thumbnails_storage_path, variant_relative_path(thumbnail_path, size))
+
+
+def _pack_key(relative_path: str) -> str:
+    return relative_path[len(PACK_PATH_PREFIX):]
+
+
+def store_generated_thumbnail(thumbnails_storage_path: str, relative_path: str) -> str:
+    """
+    Called after ffmpeg wrote a thumbnail file. Size variants derived from an older thumbnail of the
+    same video are dropped. In pack mode the file is moved into the pack and the pack path is
+    returned; otherwise the file stays where it is.
+    """
+    delete_thumbnail_variants(thumbnails_storage_path, relative_path)
+    if THUMBNAIL_STORE != THUMBNAIL_STORE_PACK:
+        return relative_path
+    full_path = thumbnail_full_path(thumbnails_storage_path, relative_path)
+    with open(full_path, "rb") as f:
+        data = f.read()
+    pack_path = PACK_PATH_PREFIX + os.path.basename(relative_path)
+    delete_thumbnail_variants(thumbnails_storage_path, pack_path)
+    thumbnail_pack.get_thumbnail_pack(thumbnails_storage_path).put(_pack_key(pack_path), data)
+    os.remove(full_path)
+    thumbnail_cache.invalidate(pack_path)
+    return pack_path
+
+
+def store_thumbnail_data(thumbnails_storage_path: str, relative_path: str, data: bytes):
+    """Writes derived thumbnail data (e.g. a size variant) into the store that relative_path belongs to."""
+    if is_pack_thumbnail_path(relative_path):
+        thumbnail_pack.get_thumbnail_pack(thumbnails_storage_path).put(_pack_key(relative_path), data)
+    else:
+        full_path = thumbnail_full_path(thumbnails_storage_path, relative_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        temp_path = full_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, full_path)
+    thumbnail_cache.invalidate(relative_path)
+
+
+def thumbnail_exists(thumbnails_storage_path: str, relative_path: str) -> bool:
+    if is_pack_thumbnail_path(relative_path):
+        return _pack_key(relative_path) in thumbnail_pack.get_thumbnail_pack(thumbnails_storage_path)
+    return os.path.isfile(thumbnail_full_path(thumbnails_storage_path, relative_path))
+
+
+def read_pack_thumbnail(thumbnails_storage_path: str, relative_path: str) -> Optional[tuple]:
+    """(data, data offset, created timestamp) of a packed thumbnail, or None."""
+    return thumbnail_pack.get_thumbnail_pack(thumbnails_storage_path).get(_pack_key(relative_path))
+
+
+def delete_thumbnail(thumbnails_storage_path: str, relative_path: str) -> Optional[str]:
+    """Deletes a thumbnail and its size variants in whichever store holds them. Returns an error message or None."""
+    delete_thumbnail_variants(thumbnails_storage_path, relative_path)
+    return _delete_stored_file(thumbnails_storage_path, relative_path)
+
+
+def _delete_stored_file(thumbnails_storage_path: str, relative_path: str) -> Optional[str]:
+    thumbnail_cache.invalidate(relative_path)
+    if is_pack_thumbnail_path(relative_path):
+        if os.path.exists(os.path.join(thumbnails_storage_path, thumbnail_pack.PACK_FILE_NAME)):
+            thumbnail_pack.get_thumbnail_pack(thumbnails_storage_path).delete(_pack_key(relative_path))
+        return None
+    full_path = thumbnail_full_path(thumbnails_storage_path, relative_path)
+    if not os.path.exists(full_path):
+        return None
+    try:
+        os.remove(full_path)
+    except OSError as e:
+        return f"Failed to delete thumbnail {full_path}: {e}"
+    return None
+
+
+def resolve_thumbnail_file(thumbnails_storage_path: str, relative_path: str) -> Optional[str]:
+    """
+    Full path of an existing thumbnail file, or None. A flat name (an old URL, or a row the migrator
+    has not rewritten yet) falls back to its sharded location, so both layouts can be served.
+    """
+    full_path = thumbnail_full_path(thumbnails_storage_path, relative_path)
+    if os.path.isfile(full_path):
+        return full_path
+    flat_match = _FLAT_THUMBNAIL_PATTERN.match(relative_path)
+    if flat_match:
+        sharded_path = thumbnail_full_path(thumbnails_storage_path, sharded_thumbnail_path(int(flat_match.group(1))))
+        if os.path.isfile(sharded_path):
+            return sharded_path
+    return None
+
+
+def load_thumbnail_content(thumbnails_storage_path: str, relative_path: str) -> Optional[Tuple[bytes, dict]]:
+    """
+    (content, validator headers incl. content-type) of a stored thumbnail, read through the in-memory
+    cache; None when it does not exist. Reads the whole file, so only use it for thumbnail-sized data.
+    """
+    cached = thumbnail_cache.get(relative_path)
+    if cached is not None:
+        return cached
+    if is_pack_thumbnail_path(relative_path):
+        packed = read_pack_thumbnail(thumbnails_storage_path, relative_path)
+        if packed is None:
+            return None
+        content, data_offset, created = packed
+        validator_headers = thumbnail_cache.build_pack_validator_headers(data_offset, len(content), created)
+    else:
+        full_path = resolve_thumbnail_file(thumbnails_storage_path, relative_path)
+        if full_path is None:
+            return None
+        try:
+            with open(full_path, "rb") as f:
+                validator_headers = thumbnail_cache.build_validator_headers(os.fstat(f.fileno()))
+                content = f.read()
+        except OSError:
+            return None
+    validator_headers["content-type"] = mimetypes.guess_type(relative_path)[0] or "application/octet-stream"
+    thumbnail_cache.put(relative_path, content, validator_headers)
+    return content, validator_headers
+
+
+def thumbnail_validator_headers(thumbnails_storage_path: str, relative_path: str) -> Optional[dict]:
+    """
+    Validator headers (etag, last-modified) of a stored thumbnail from the cache, the pack index or a
+    stat, without reading its content; None when it does not exist.
+    """
+    cached = thumbnail_cache.get(relative_path)
+    if cached is not None:
+        return cached[1]
+    if is_pack_thumbnail_path(relative_path):
+        entry = thumbnail_pack.get_thumbnail_pack(thumbnails_storage_path).entry(_pack_key(relative_path))
+        return thumbnail_cache.build_pack_validator_headers(*entry) if entry is not None else None
+    full_path = resolve_thumbnail_file(thumbnails_storage_path, relative_path)
+    if full_path is None:
+        return None
+    try:
+        return thumbnail_cache.build_validator_headers(os.stat(full_path))
+    except OSError:
+        return None
+
+
+def find_existing_thumbnail(thumbnails_storage_path: str, video_id: int) -> Optional[str]:
+    """Relative path of a non-empty thumbnail already stored for video_id, in any layout or the pack."""
+    if THUMBNAIL_STORE == THUMBNAIL_STORE_PACK:
+        pack_path = f"{PACK_PATH_PREFIX}video_{video_id}.jpg"
+        if _pack_key(pack_path) in thumbnail_pack.get_thumbnail_pack(thumbnails_storage_path):
+            return pack_path
+    for relative_path in (sharded_thumbnail_path(video_id), f"video_{video_id}.jpg"):
+        full_path = thumbnail_full_path(thumbnails_storage_path, relative_path)
+        if os.path.isfile(full_path) and os.path.getsize(full_path) > 0:
+            return relative_path
+    return None
+
+
+def has_flat_thumbnails(db: Session) -> bool:
+    return db.query(models.Video.id).filter(
+        models.Video.thumbnail_path.isnot(None), ~models.Video.thumbnail_path.contains("/")
+    ).first() is not None
+
+
+def migrate_thumbnails_to_sharded_layout(
+    db: Session,
+    thumbnails_storage_path: str,
+    batch_size: int = MIGRATION_BATCH_SIZE,
+    stop_event: Optional[threading.Event] = None
+) -> dict:
+    """
+    Moves flat thumbnails into the sharded layout and rewrites thumbnail_path, one committed batch at
+    a time. Files are moved before the rows are updated; if the process stops in between, serving
+    falls back to the sharded file and the next run only rewrites the row. Returns counts.
+    """
+    moved, rewritten, missing = 0, 0, 0
+    last_id = 0
+    while stop_event is None or not stop_event.is_set():
+        rows = db.query(models.Video.id, models.Video.thumbnail_path).filter(
+            models.Video.id > last_id,
+            models.Video.thumbnail_path.isnot(None),
+            ~models.Video.thumbnail_path.contains("/")
+        ).order_by(models.Video.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = []
+        for video_id, flat_path in rows:
+            new_path = sharded_thumbnail_path(video_id, os.path.splitext(flat_path)[1].lstrip(".") or "jpg")
+            source = thumbnail_full_path(thumbnails_storage_path, flat_path)
+            target = thumbnail_full_path(thumbnails_storage_path, new_path)
+            try:
+                if os.path.isfile(source):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(source, target)
+                    moved += 1
+                elif not os.path.isfile(target):
+                    # Neither file exists: the next scan regenerates it under the new layout.
+                    missing += 1
+                    updates.append({"id": video_id, "thumbnail_path": None, "thumbnail_placeholder": None})
+                    continue
+            except OSError as e:
+                print(f"[Thumbnails] Warning: Could not move {source} to {target}: {e}")
+                continue
+            thumbnail_cache.invalidate(flat_path)
+            delete_thumbnail_variants(thumbnails_storage_path, flat_path) # re-derived next to the moved file on demand
+            updates.append({"id": video_id, "thumbnail_path": new_path})
+        if updates:
+            try:
+                db.bulk_update_mappings(models.Video, updates)
+                db.commit()
+                rewritten += len(updates)
+            except Exception as e:
+                db.rollback()
+                print(f"[Thumbnails] Error: Failed to rewrite thumbnail paths for {len(updates)} video(s): {e}")
+        print(f"[Thumbnails] Migration progress: {moved} moved, {rewritten} row(s) rewritten (up to id {last_id}).")
+    print(f"[Thumbnails] Migration to sharded layout finished: {moved} file(s) moved, {rewritten} row(s) rewritten, {missing} missing file(s).")
+    return {"moved": moved, "rewritten": rewritten, "missing": missing}
+
+
+def packed_thumbnail_created(thumbnails_storage_path: str, relative_path: str) -> Optional[float]:
+    """Timestamp at which a packed thumbnail was written, or None when it is not in the pack."""
+    entry = thumbnail_pack.get_thumbnail_pack(thumbnails_storage_path).entry(_pack_key(relative_path))
+    return entry[2] if entry is not None else None
+
+
+def iter_packed_thumbnail_paths(thumbnails_storage_path: str):
+    """Yields the relative path of every thumbnail in the pack (nothing when no pack file exists)."""
+    if not os.path.exists(os.path.join(thumbnails_storage_path, thumbnail_pack.PACK_FILE_NAME)):
+        return
+    for key in thumbnail_pack.get_thumbnail_pack(thumbnails_storage_path).keys():
+        yield PACK_PATH_PREFIX + key
+
+
+def compact_thumbnail_pack(thumbnails_storage_path: str, min_dead_ratio: float = 0.0) -> Optional[dict]:
+    """Compacts the pack when at least min_dead_ratio of it is garbage; returns None when skipped."""
+    if not os.path.exists(os.path.join(thumbnails_storage_path, thumbnail_pack.PACK_FILE_NAME)):
+        return None
+    pack = thumbnail_pack.get_thumbnail_pack(thumbnails_storage_path)
+    pack_stats = pack.stats()
+    if not pack_stats["dead_bytes"] or pack_stats["dead_ratio"] < min_dead_ratio:
+        return None
+    result = pack.compact()
+    thumbnail_cache.clear() # offsets changed, so ETags of packed thumbnails change too
+    return result
+
+
+def iter_thumbnail_files(thumbnails_storage_path: str):
+    """Yields (relative_path, full_path) for every file in the storage, in both layouts."""
+    for dir_path, dir_names, file_names in os.walk(thumbnails_storage_path):
+        relative_dir = os.path.relpath(dir_path, thumbnails_storage_path)
+        for file_name in file_names:
+            relative_path = file_name if relative_dir == os.curdir else "/".join(relative_dir.split(os.sep) + [file_name])
+            yield relative_path, os.path.join(dir_path, file_name)
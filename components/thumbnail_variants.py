@@ -0,0 +1,172 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from components import database_models as models
+from components import thumbnail_storage
+from components import video_metadata_extractor
+from tools.db_utils import SessionLocal
+
+# WebP size variants of the 320px JPEG thumbnail, derived on first request and then stored next to it
+# (see thumbnail_storage.variant_relative_path), so a grid of small cards does not download 320px
+# JPEGs and a large/HiDPI view does not upscale them. Sizes up to the JPEG's width are resized from
+# the JPEG; larger sizes are rendered from the video frame, falling back to the JPEG when the video
+# is unavailable.
+#
+# The tiny placeholder stored on the row (Video.thumbnail_placeholder) is normally produced by the same
+# ffmpeg call that renders the thumbnail; backfill_thumbnail_placeholders() derives it for thumbnails
+# generated before placeholders existed.
+
+THUMBNAIL_SIZES = thumbnail_storage.THUMBNAIL_VARIANT_WIDTHS
+MASTER_THUMBNAIL_WIDTH = 320 # width of the JPEG rendered by video_metadata_extractor
+WEBP_QUALITY = 75
+PLACEHOLDER_BACKFILL_BATCH_SIZE = 200
+PLACEHOLDER_BACKFILL_WORKERS = 4
+
+_locks_lock = threading.Lock()
+_variant_locks: Dict[str, threading.Lock] = {}
+
+
+def _variant_lock(variant_path: str) -> threading.Lock:
+    with _locks_lock:
+        return _variant_locks.setdefault(variant_path, threading.Lock())
+
+
+def _resolve_master(thumbnails_storage_path: str, thumbnail_path: str) -> Optional[str]:
+    """Relative path of the stored master thumbnail (a flat name may have been migrated), or None."""
+    if thumbnail_storage.is_pack_thumbnail_path(thumbnail_path):
+        return thumbnail_path if thumbnail_storage.thumbnail_exists(thumbnails_storage_path, thumbnail_path) else None
+    full_path = thumbnail_storage.resolve_thumbnail_file(thumbnails_storage_path, thumbnail_path)
+    if full_path is None:
+        return None
+    return os.path.relpath(full_path, thumbnails_storage_path).replace(os.sep, "/")
+
+
+def _read_master(thumbnails_storage_path: str, master_path: str) -> Optional[bytes]:
+    if thumbnail_storage.is_pack_thumbnail_path(master_path):
+        entry = thumbnail_storage.read_pack_thumbnail(thumbnails_storage_path, master_path)
+        return bytes(entry[0]) if entry else None
+    try:
+        with open(thumbnail_storage.thumbnail_full_path(thumbnails_storage_path, master_path), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _video_path_for(master_path: str) -> Optional[str]:
+    video_id = thumbnail_storage.video_id_from_thumbnail_path(master_path)
+    if video_id is None:
+        return None
+    db = SessionLocal()
+    try:
+        row = db.query(models.Video.path).filter(models.Video.id == video_id, models.Video.missing_since.is_(None)).first()
+        return row[0] if row else None
+    finally:
+        db.close()
+
+
+def ensure_variant(thumbnails_storage_path: str, thumbnail_path: str, size: str) -> Optional[str]:
+    """
+    Relative path of the size variant of a thumbnail, rendering and storing it first if needed.
+    Returns None when the size is unknown or the variant cannot be produced (callers then serve the
+    original thumbnail).
+    """
+    width = THUMBNAIL_SIZES.get(size)
+    if width is None or thumbnail_storage.variant_master_path(thumbnail_path):
+        return None
+    master_path = _resolve_master(thumbnails_storage_path, thumbnail_path)
+    if master_path is None:
+        return None
+    variant_path = thumbnail_storage.variant_relative_path(master_path, size)
+    try:
+        with _variant_lock(variant_path):
+            if thumbnail_storage.thumbnail_exists(thumbnails_storage_path, variant_path):
+                return variant_path
+            return _render_variant(thumbnails_storage_path, master_path, variant_path, size, width)
+    finally:
+        with _locks_lock:
+            _variant_locks.pop(variant_path, None)
+
+
+def _render_variant(thumbnails_storage_path: str, master_path: str, variant_path: str, size: str, width: int) -> Optional[str]:
+    data, error = None, None
+    if width > MASTER_THUMBNAIL_WIDTH:
+        video_path = _video_path_for(master_path)
+        if video_path:
+            data, error = video_metadata_extractor.render_webp_variant(width, video_path=video_path, quality=WEBP_QUALITY)
+    if data is None:
+        master_data = _read_master(thumbnails_storage_path, master_path)
+        if master_data is None:
+            return None
+        data, error = video_metadata_extractor.render_webp_variant(width, image_data=master_data, quality=WEBP_QUALITY)
+    if data is None:
+        print(f"[Thumbnails] Could not render {size} variant of {master_path}: {error}")
+        return None
+    try:
+        thumbnail_storage.store_thumbnail_data(thumbnails_storage_path, variant_path, data)
+    except (OSError, ValueError) as e:
+        print(f"[Thumbnails] Could not store {variant_path}: {e}")
+        return None
+    return variant_path
+
+
+def has_missing_placeholders(db: Session) -> bool:
+    return db.query(models.Video.id).filter(
+        models.Video.thumbnail_path.isnot(None), models.Video.thumbnail_placeholder.is_(None)
+    ).first() is not None
+
+
+def _placeholder_for(thumbnails_storage_path: str, thumbnail_path: str) -> Optional[str]:
+    master_path = _resolve_master(thumbnails_storage_path, thumbnail_path)
+    master_data = _read_master(thumbnails_storage_path, master_path) if master_path else None
+    if master_data is None:
+        return None
+    placeholder, error = video_metadata_extractor.render_thumbnail_placeholder(master_data)
+    if placeholder is None:
+        print(f"[Thumbnails] Could not render placeholder for {thumbnail_path}: {error}")
+    return placeholder
+
+
+def backfill_thumbnail_placeholders(
+    db: Session,
+    thumbnails_storage_path: str,
+    batch_size: int = PLACEHOLDER_BACKFILL_BATCH_SIZE,
+    worker_count: int = PLACEHOLDER_BACKFILL_WORKERS,
+    stop_event: Optional[threading.Event] = None
+) -> dict:
+    """
+    Derives the placeholder of every video that has a thumbnail but no placeholder, committing one
+    batch at a time. Thumbnails that cannot be read are skipped (the next backfill tries again).
+    """
+    filled, skipped = 0, 0
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=max(worker_count, 1), thread_name_prefix="nepenthe-placeholder") as executor:
+        while stop_event is None or not stop_event.is_set():
+            rows = db.query(models.Video.id, models.Video.thumbnail_path).filter(
+                models.Video.id > last_id,
+                models.Video.thumbnail_path.isnot(None),
+                models.Video.thumbnail_placeholder.is_(None)
+            ).order_by(models.Video.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            placeholders = executor.map(lambda row: _placeholder_for(thumbnails_storage_path, row[1]), rows)
+            updates = [
+                {"id": video_id, "thumbnail_placeholder": placeholder}
+                for (video_id, _), placeholder in zip(rows, placeholders) if placeholder
+            ]
+            skipped += len(rows) - len(updates)
+            if updates:
+                try:
+                    db.bulk_update_mappings(models.Video, updates)
+                    db.commit()
+                    filled += len(updates)
+                except Exception as e:
+                    db.rollback()
+                    print(f"[Thumbnails] Error: Failed to save placeholders for {len(updates)} video(s): {e}")
+            print(f"[Thumbnails] Placeholder backfill progress: {filled} filled, {skipped} skipped (up to id {last_id}).")
+    print(f"[Thumbnails] Placeholder backfill finished: {filled} filled, {skipped} skipped.")
+    return {"filled": filled, "skipped": skipped}
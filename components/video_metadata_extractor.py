@@ -1,33 +1,102 @@
 import subprocess
+import base64
 import json
 import os
-from typing import Optional
+import re
+from typing import Optional, Tuple
+from components import container_header_parser
+from components import thumbnail_cache
+from components import thumbnail_storage
 
 # --- !!! 重要：将下面的路径替换为你系统中 ffmpeg.exe 和 ffprobe.exe 的实际完整路径 !!! ---
 FFPROBE_PATH = r"E:\SF\ffmpeg\bin\ffprobe.exe"  # 请替换为你的实际路径
 FFMPEG_PATH = r"E:\SF\ffmpeg\bin\ffmpeg.exe"    # 请替换为你的实际路径
 # --- ------------------------------------------------------------------------------------ ---
 
-def get_video_metadata(video_path: str) -> Optional[dict]:
-    command = [
+# single_pass: ffprobe 只请求需要的字段，且需要缩略图时由一次 ffmpeg 调用同时得到元数据和缩略图
+# legacy: 完整的 -show_format -show_streams 探测 + 单独的 ffmpeg 缩略图调用
+EXTRACTION_MODE_SINGLE_PASS = "single_pass"
+EXTRACTION_MODE_LEGACY = "legacy"
+EXTRACTION_MODE = EXTRACTION_MODE_SINGLE_PASS
+
+# 限制探测读取量，避免大体积 MKV/TS 文件被完整分析 (analyzeduration 单位为微秒)
+PROBE_SIZE = "5000000"
+ANALYZE_DURATION = "5000000"
+# 不再用 -select_streams v:0：音轨数量也要统计，封面图 (attached_pic) 通过 disposition 排除
+TRIMMED_PROBE_ENTRIES = (
+    "format=duration,bit_rate:stream=codec_type,codec_name,width,height,avg_frame_rate,r_frame_rate"
+    ":stream_disposition=attached_pic"
+)
+
+# 列表接口内嵌的低清占位图 (LQIP)：宽 16 像素的 WebP，编码为 data URI 后约 200 字节
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_QUALITY = 30
+_placeholder_output_enabled = True # 缩略图命令是否附带 WebP 占位图输出；ffmpeg 缺少 WebP 编码器时自动关闭
+# ffmpeg 找不到 -c:v 指定的编码器时的报错 (不同版本措辞不同)
+_MISSING_ENCODER_PATTERN = re.compile(r"Unknown encoder|Encoder not found|Error selecting an encoder", re.IGNORECASE)
+
+_FFMPEG_DURATION_PATTERN = re.compile(r"Duration:\s*(\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+_FFMPEG_BITRATE_PATTERN = re.compile(r"Duration:.*?bitrate:\s*(\d+) kb/s")
+_FFMPEG_VIDEO_STREAM_PATTERN = re.compile(r"Stream #\d+:\d+.*?: Video: .*?, (\d{2,5})x(\d{2,5})\b")
+_FFMPEG_VIDEO_CODEC_PATTERN = re.compile(r": Video: ([\w-]+)")
+_FFMPEG_FRAME_RATE_PATTERN = re.compile(r", (\d+(?:\.\d+)?) fps\b")
+_FFMPEG_AUDIO_STREAM_PATTERN = re.compile(r"Stream #\d+:\d+.*?: Audio: ")
+
+def _parse_frame_rate(rate_text) -> Optional[float]:
+    """ffprobe 的帧率是 "30000/1001" 这样的分数，"0/0" 表示未知。"""
+    if not rate_text:
+        return None
+    try:
+        numerator, _, denominator = str(rate_text).partition("/")
+        value = float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return round(value, 3) if value > 0 else None
+
+def _build_ffprobe_command(video_path: str, full_probe: bool) -> list:
+    if full_probe:
+        return [
+            FFPROBE_PATH, "-v", "quiet", "-print_format", "json",
+            "-show_format", "-show_streams", video_path
+        ]
+    return [
         FFPROBE_PATH, "-v", "quiet", "-print_format", "json",
-        "-show_format", "-show_streams", video_path
+        "-probesize", PROBE_SIZE, "-analyzeduration", ANALYZE_DURATION,
+        "-show_entries", TRIMMED_PROBE_ENTRIES, video_path
     ]
+
+def probe_video_metadata(video_path: str, full_probe: Optional[bool] = None) -> Tuple[Optional[dict], Optional[str]]:
+    """返回 (元数据字典或 None, 失败原因或 None)。"""
+    if full_probe is None:
+        full_probe = EXTRACTION_MODE == EXTRACTION_MODE_LEGACY
+    if not full_probe and container_header_parser.can_parse(video_path):
+        # MP4/MOV/MKV/WebM 优先直接读取容器头部，只需几 KB 读取且不启动子进程；解析不到再用 ffprobe
+        header_metadata = container_header_parser.parse_container_metadata(video_path)
+        if header_metadata:
+            print(f"[METADATA_EXTRACTOR] 从容器头部读取元数据 for '{video_path}': {header_metadata}")
+            return header_metadata, None
+    command = _build_ffprobe_command(video_path, full_probe)
     print(f"[METADATA_EXTRACTOR] 执行 ffprobe: {' '.join(command)}")
     try:
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate(timeout=60)
+        # subprocess.run 超时时会结束子进程，卡住的 ffprobe 不会残留
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60)
+        stdout, stderr = process.stdout, process.stderr
         if process.returncode != 0:
             error_message = stderr.decode('utf-8', errors='replace').strip()
             print(f"ffprobe 执行失败 for '{video_path}'. 返回码: {process.returncode}. 错误: {error_message}")
-            return None
+            return None, f"ffprobe exited with code {process.returncode}: {error_message[-300:]}"
         try:
             metadata_json = json.loads(stdout)
         except json.JSONDecodeError as e:
             print(f"ffprobe 输出 JSON 解析失败 for '{video_path}': {e}")
             print(f"ffprobe stdout: {stdout.decode('utf-8', errors='replace')[:500]}...")
-            return None
+            return None, f"ffprobe output is not valid JSON: {e}"
         duration, width, height = None, None, None
+        video_codec, bitrate, frame_rate, audio_track_count = None, None, None, 0
+        try:
+            if metadata_json.get('format', {}).get('bit_rate') is not None: bitrate = int(metadata_json['format']['bit_rate'])
+        except (ValueError, TypeError):
+            pass
         if 'format' in metadata_json and 'duration' in metadata_json['format']:
             try:
                 duration_str = metadata_json['format']['duration']
@@ -36,55 +105,273 @@ def get_video_metadata(video_path: str) -> Optional[dict]:
                 print(f"解析时长失败 for '{video_path}': {e}. Duration: {metadata_json['format'].get('duration')}")
         if 'streams' in metadata_json:
             for stream in metadata_json['streams']:
-                if stream.get('codec_type') == 'video':
+                if stream.get('codec_type') == 'audio':
+                    audio_track_count += 1
+                elif stream.get('codec_type') == 'video' and width is None and not stream.get('disposition', {}).get('attached_pic'):
                     try:
                         w_str, h_str = stream.get('width'), stream.get('height')
                         if w_str is not None: width = int(w_str)
                         if h_str is not None: height = int(h_str)
-                        break
+                        video_codec = stream.get('codec_name')
+                        frame_rate = _parse_frame_rate(stream.get('avg_frame_rate')) or _parse_frame_rate(stream.get('r_frame_rate'))
                     except (ValueError, TypeError) as e:
                         print(f"解析宽高失败 for '{video_path}' (stream {stream.get('index')}): {e}. W: {stream.get('width')}, H: {stream.get('height')}")
+        error = None
         if duration is None and width is None and height is None and process.returncode == 0 and not metadata_json.get('streams'):
              print(f"未能从 '{video_path}' 提取任何有效的元数据（可能是非媒体文件），但 ffprobe 执行未报错。")
+             error = "no media streams found"
         elif duration is None and width is None and height is None:
              print(f"未能从 '{video_path}' 提取任何有效的元数据。")
-        return {"duration": duration, "width": width, "height": height}
-    except subprocess.TimeoutExpired: print(f"ffprobe 执行超时 for '{video_path}'"); return None
-    except FileNotFoundError: print(f"错误: ffprobe 命令 ('{FFPROBE_PATH}') 未找到。请检查硬编码路径。"); return None
-    except Exception as e: print(f"获取视频元数据时发生未知错误 for '{video_path}': {e}"); return None
+             error = "no usable metadata in ffprobe output"
+        elif duration is None or width is None or height is None:
+             error = "incomplete metadata in ffprobe output"
+        return {
+            "duration": duration, "width": width, "height": height, "video_codec": video_codec,
+            "bitrate": bitrate, "frame_rate": frame_rate, "audio_track_count": audio_track_count,
+        }, error
+    except subprocess.TimeoutExpired: print(f"ffprobe 执行超时 for '{video_path}'"); return None, "ffprobe timed out"
+    except FileNotFoundError: print(f"错误: ffprobe 命令 ('{FFPROBE_PATH}') 未找到。请检查硬编码路径。"); return None, "ffprobe executable not found"
+    except Exception as e: print(f"获取视频元数据时发生未知错误 for '{video_path}': {e}"); return None, f"unexpected error: {e}"
 
-def generate_thumbnail(video_path: str, video_id: int, thumbnails_storage_path: str, timestamp: str = "00:00:03") -> Optional[str]:
-    if not thumbnails_storage_path or not os.path.isdir(thumbnails_storage_path):
-        print(f"错误: 无效或不存在的缩略图存储路径: '{thumbnails_storage_path}'")
-        return None
-    if not os.path.exists(video_path):
-        print(f"错误: 输入视频文件不存在: '{video_path}'")
+def get_video_metadata(video_path: str, full_probe: Optional[bool] = None) -> Optional[dict]:
+    metadata, _ = probe_video_metadata(video_path, full_probe)
+    return metadata
+
+def _parse_ffmpeg_input_info(stderr_text: str) -> dict:
+    # 只解析 "Output #0" 之前的输入信息，避免把输出的缩略图流 (320xN mjpeg) 当成源视频的宽高
+    input_section = stderr_text.split("Output #0", 1)[0].split("Stream mapping:", 1)[0]
+    duration, width, height = None, None, None
+    video_codec, bitrate, frame_rate, audio_track_count = None, None, None, 0
+    duration_match = _FFMPEG_DURATION_PATTERN.search(input_section)
+    if duration_match:
+        hours, minutes, seconds = duration_match.groups()
+        duration = int(int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+    bitrate_match = _FFMPEG_BITRATE_PATTERN.search(input_section)
+    if bitrate_match:
+        bitrate = int(bitrate_match.group(1)) * 1000
+    for line in input_section.splitlines():
+        if _FFMPEG_AUDIO_STREAM_PATTERN.search(line):
+            audio_track_count += 1
+            continue
+        if "attached pic" in line or width is not None:
+            continue
+        stream_match = _FFMPEG_VIDEO_STREAM_PATTERN.search(line)
+        if stream_match:
+            width, height = int(stream_match.group(1)), int(stream_match.group(2))
+            codec_match = _FFMPEG_VIDEO_CODEC_PATTERN.search(line)
+            video_codec = codec_match.group(1) if codec_match else None
+            frame_rate_match = _FFMPEG_FRAME_RATE_PATTERN.search(line)
+            frame_rate = float(frame_rate_match.group(1)) if frame_rate_match else None
+    return {
+        "duration": duration, "width": width, "height": height, "video_codec": video_codec,
+        "bitrate": bitrate, "frame_rate": frame_rate, "audio_track_count": audio_track_count,
+    }
+
+def _placeholder_data_uri(webp_data: Optional[bytes]) -> Optional[str]:
+    if not webp_data:
         return None
-    thumbnail_filename = f"video_{video_id}.jpg" 
-    output_full_path = os.path.join(thumbnails_storage_path, thumbnail_filename)
+    return "data:image/webp;base64," + base64.b64encode(webp_data).decode("ascii")
+
+def _build_thumbnail_command(video_path: str, output_full_path: str, timestamp: str, with_placeholder: bool) -> list:
     command = [
-        FFMPEG_PATH, "-ss", timestamp, "-i", video_path, "-vframes", "1",
+        FFMPEG_PATH, "-hide_banner", "-probesize", PROBE_SIZE, "-analyzeduration", ANALYZE_DURATION,
+        "-ss", timestamp, "-i", video_path, "-vframes", "1",
         "-vf", "scale=320:-2,format=yuvj420p", "-q:v", "3", "-y", output_full_path
     ]
-    print(f"[METADATA_EXTRACTOR] 执行 ffmpeg: {' '.join(command)}")
+    if with_placeholder:
+        command += [
+            "-vframes", "1", "-vf", f"scale={PLACEHOLDER_WIDTH}:-2", "-c:v", "libwebp", "-quality", str(PLACEHOLDER_QUALITY),
+            "-f", "image2pipe", "pipe:1"
+        ]
+    return command
+
+def _run_thumbnail_command(video_path: str, video_id: int, thumbnails_storage_path: str, timestamp: str) -> Tuple[Optional[str], Optional[str], str, Optional[str]]:
+    """
+    运行一次 ffmpeg 截图，同一帧同时输出缩略图文件和经 stdout 返回的低清占位图。
+    占位图只是锦上添花：带占位图的命令失败时改用只生成缩略图的命令重试；只有报错表明 ffmpeg 缺少 WebP 编码器
+    (未编译 libwebp) 时，本进程之后才不再附带占位图输出，单个文件的读取错误不影响后续缩略图。占位图缺失绝不会导致缩略图失败。
+    返回 (缩略图文件名或 None, 占位图 data URI 或 None, ffmpeg 的 stderr 文本, 失败原因或 None)。
+    """
+    global _placeholder_output_enabled
+    if not thumbnails_storage_path or not os.path.isdir(thumbnails_storage_path):
+        print(f"错误: 无效或不存在的缩略图存储路径: '{thumbnails_storage_path}'")
+        return None, None, "", "invalid thumbnails storage path"
+    if not os.path.exists(video_path):
+        print(f"错误: 输入视频文件不存在: '{video_path}'")
+        return None, None, "", "video file does not exist"
+    thumbnail_filename = thumbnail_storage.sharded_thumbnail_path(video_id) # 相对路径，写入 thumbnail_path
+    output_full_path = thumbnail_storage.thumbnail_full_path(thumbnails_storage_path, thumbnail_filename)
     try:
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        _, stderr_output = process.communicate(timeout=60) 
+        os.makedirs(os.path.dirname(output_full_path), exist_ok=True)
+    except OSError as e:
+        print(f"错误: 无法创建缩略图子目录 '{os.path.dirname(output_full_path)}': {e}")
+        return None, None, "", f"cannot create thumbnail directory: {e}"
+    with_placeholder = _placeholder_output_enabled
+    try:
+        command = _build_thumbnail_command(video_path, output_full_path, timestamp, with_placeholder)
+        print(f"[METADATA_EXTRACTOR] 执行 ffmpeg: {' '.join(command)}")
+        # subprocess.run 超时时会结束子进程，卡住的 ffmpeg 不会残留
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60)
+        stdout_output, stderr_output = process.stdout, process.stderr
+        if process.returncode != 0 and with_placeholder:
+            print(f"带占位图输出的 ffmpeg 失败 (返回码 {process.returncode}) for '{video_path}'，改为只生成缩略图重试。")
+            encoder_missing = _MISSING_ENCODER_PATTERN.search(stderr_output.decode('utf-8', errors='replace')) is not None
+            command = _build_thumbnail_command(video_path, output_full_path, timestamp, False)
+            process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60)
+            stdout_output, stderr_output = None, process.stderr
+            if process.returncode == 0 and encoder_missing:
+                _placeholder_output_enabled = False
+                print("警告: ffmpeg 无法输出 WebP 占位图 (可能缺少 libwebp)，之后生成的缩略图不再附带占位图。")
+        stderr_text = stderr_output.decode('utf-8', errors='replace')
         if process.returncode != 0:
-            error_message = stderr_output.decode('utf-8', errors='replace').strip()
-            print(f"ffmpeg 生成缩略图失败 for '{video_path}'. 返回码: {process.returncode}. 错误: {error_message}")
-            return None
+            print(f"ffmpeg 生成缩略图失败 for '{video_path}'. 返回码: {process.returncode}. 错误: {stderr_text.strip()[-1000:]}")
+            return None, None, stderr_text, f"ffmpeg exited with code {process.returncode}: {stderr_text.strip()[-300:]}"
         if os.path.exists(output_full_path) and os.path.getsize(output_full_path) > 0:
+            thumbnail_cache.invalidate(thumbnail_filename) # 同名文件被重新生成，内存中的旧内容作废
+            try:
+                # 打包存储模式下移入 pack 文件，返回值变为 pack/ 路径
+                thumbnail_filename = thumbnail_storage.store_generated_thumbnail(thumbnails_storage_path, thumbnail_filename)
+            except (OSError, ValueError) as e:
+                print(f"缩略图写入打包存储失败 for '{video_path}': {e}")
+                return None, None, stderr_text, f"cannot store thumbnail: {e}"
             print(f"成功生成缩略图: {output_full_path}")
-            return thumbnail_filename 
+            return thumbnail_filename, _placeholder_data_uri(stdout_output), stderr_text, None
         else:
-            error_message = stderr_output.decode('utf-8', errors='replace').strip()
-            print(f"ffmpeg 执行可能成功但未找到有效输出文件 for '{video_path}'. Stderr: {error_message}")
+            print(f"ffmpeg 执行可能成功但未找到有效输出文件 for '{video_path}'. Stderr: {stderr_text.strip()[-1000:]}")
             if os.path.exists(output_full_path) and os.path.getsize(output_full_path) == 0:
                 print(f"警告: 生成的缩略图文件 '{output_full_path}' 为空，已删除。")
                 try: os.remove(output_full_path)
                 except OSError as e_rm: print(f"删除空缩略图文件失败: {e_rm}")
-            return None
-    except subprocess.TimeoutExpired: print(f"ffmpeg 生成缩略图超时 for '{video_path}'"); return None
-    except FileNotFoundError: print(f"错误: ffmpeg 命令 ('{FFMPEG_PATH}') 未找到。请检查硬编码路径。"); return None
-    except Exception as e: print(f"生成缩略图时发生未知错误 for '{video_path}': {e}"); return None
\ No newline at end of file
+            return None, None, stderr_text, "ffmpeg produced no thumbnail frame"
+    except subprocess.TimeoutExpired: print(f"ffmpeg 生成缩略图超时 for '{video_path}'"); return None, None, "", "ffmpeg timed out"
+    except FileNotFoundError: print(f"错误: ffmpeg 命令 ('{FFMPEG_PATH}') 未找到。请检查硬编码路径。"); return None, None, "", "ffmpeg executable not found"
+    except Exception as e: print(f"生成缩略图时发生未知错误 for '{video_path}': {e}"); return None, None, "", f"unexpected error: {e}"
+
+def render_thumbnail(video_path: str, video_id: int, thumbnails_storage_path: str, timestamp: str = "00:00:03") -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """返回 (缩略图文件名或 None, 占位图 data URI 或 None, 失败原因或 None)。"""
+    thumbnail_filename, placeholder, _, error = _run_thumbnail_command(video_path, video_id, thumbnails_storage_path, timestamp)
+    return thumbnail_filename, placeholder, error
+
+def generate_thumbnail(video_path: str, video_id: int, thumbnails_storage_path: str, timestamp: str = "00:00:03") -> Optional[str]:
+    thumbnail_filename, _, _ = render_thumbnail(video_path, video_id, thumbnails_storage_path, timestamp)
+    return thumbnail_filename
+
+def render_thumbnail_placeholder(image_data: bytes) -> Tuple[Optional[str], Optional[str]]:
+    """由已有缩略图 (JPEG) 生成低清占位图，用于回填。返回 (data URI 或 None, 失败原因或 None)。"""
+    webp_data, error = render_webp_variant(PLACEHOLDER_WIDTH, image_data=image_data, quality=PLACEHOLDER_QUALITY)
+    return _placeholder_data_uri(webp_data), error
+
+def _run_ffmpeg_pipe(command: list, input_data: Optional[bytes] = None, timeout: int = 60) -> Tuple[Optional[bytes], Optional[str]]:
+    """运行一个输出到 stdout 的 ffmpeg 命令。返回 (stdout 数据或 None, 失败原因或 None)。"""
+    try:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout_output, stderr_output = process.communicate(input=input_data, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill(); process.communicate()
+        return None, "ffmpeg timed out"
+    except FileNotFoundError:
+        return None, "ffmpeg executable not found"
+    if process.returncode != 0 or not stdout_output:
+        stderr_text = stderr_output.decode('utf-8', errors='replace').strip()
+        return None, f"ffmpeg exited with code {process.returncode}: {stderr_text[-300:]}"
+    return stdout_output, None
+
+def render_webp_variant(width: int, image_data: Optional[bytes] = None, video_path: Optional[str] = None,
+                        timestamp: str = "00:00:03", quality: int = 75) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    用 ffmpeg 把缩略图 (image_data, JPEG) 或视频帧 (video_path) 缩放为指定宽度的 WebP，输入输出都走管道。
+    返回 (WebP 数据或 None, 失败原因或 None)。
+    """
+    if image_data is not None:
+        input_args = ["-f", "jpeg_pipe", "-i", "pipe:0"]
+    elif video_path and os.path.exists(video_path):
+        input_args = ["-probesize", PROBE_SIZE, "-analyzeduration", ANALYZE_DURATION, "-ss", timestamp, "-i", video_path]
+    else:
+        return None, "no source image or video file"
+    command = [
+        FFMPEG_PATH, "-hide_banner", "-loglevel", "error", *input_args, "-vframes", "1",
+        "-vf", f"scale={width}:-2", "-c:v", "libwebp", "-quality", str(quality), "-f", "image2pipe", "pipe:1"
+    ]
+    return _run_ffmpeg_pipe(command, image_data)
+
+def render_frame_strip(video_path: str, timestamps: list, tile_width: int, tile_height: int) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    在每个时间点各取一帧 (每个时间点作为一个单独输入，-ss 放在 -i 之前快速定位，不解码整段视频)，
+    缩放到 tile_width x tile_height 后横向拼成一行，以 rgb24 原始像素从 stdout 返回。
+    返回 (len(timestamps) * tile_width x tile_height 的像素数据或 None, 失败原因或 None)。
+    """
+    if not os.path.exists(video_path):
+        return None, "video file does not exist"
+    input_args, filters, labels = [], [], ""
+    for index, timestamp in enumerate(timestamps):
+        input_args += ["-probesize", PROBE_SIZE, "-analyzeduration", ANALYZE_DURATION, "-ss", f"{timestamp:.3f}", "-i", video_path]
+        filters.append(f"[{index}:v:0]trim=end_frame=1,scale={tile_width}:{tile_height},setsar=1[f{index}]")
+        labels += f"[f{index}]"
+    filter_graph = ";".join(filters) + f";{labels}concat=n={len(timestamps)}:v=1:a=0,tile={len(timestamps)}x1"
+    command = [
+        FFMPEG_PATH, "-hide_banner", "-loglevel", "error", *input_args, "-filter_complex", filter_graph,
+        "-frames:v", "1", "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"
+    ]
+    pixels, error = _run_ffmpeg_pipe(command, timeout=120)
+    if pixels is not None and len(pixels) != len(timestamps) * tile_width * tile_height * 3:
+        return None, f"unexpected frame strip size {len(pixels)}"
+    return pixels, error
+
+def encode_rgb_image_as_jpeg(pixels: bytes, width: int, height: int, quality: int = 4) -> Tuple[Optional[bytes], Optional[str]]:
+    """把 rgb24 原始像素编码为 JPEG (quality 为 ffmpeg 的 -q:v，越小越清晰)。"""
+    command = [
+        FFMPEG_PATH, "-hide_banner", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}",
+        "-i", "pipe:0", "-frames:v", "1", "-q:v", str(quality), "-f", "mjpeg", "pipe:1"
+    ]
+    return _run_ffmpeg_pipe(command, pixels)
+
+def render_teaser_clip(video_path: str, segments: list, width: int, output_full_path: str) -> Optional[str]:
+    """
+    把若干片段 [(起始秒, 长度秒), ...] 拼接成一个无声、低码率的 H.264 MP4 (悬停预览用)。
+    每个片段是一个单独输入，-ss/-t 放在 -i 之前，只读取和解码片段本身。返回失败原因或 None。
+    """
+    if not os.path.exists(video_path):
+        return "video file does not exist"
+    input_args, filters, labels = [], [], ""
+    for index, (start, length) in enumerate(segments):
+        input_args += ["-probesize", PROBE_SIZE, "-analyzeduration", ANALYZE_DURATION, "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", video_path]
+        filters.append(f"[{index}:v:0]scale={width}:-2,setsar=1[s{index}]")
+        labels += f"[s{index}]"
+    filter_graph = ";".join(filters) + f";{labels}concat=n={len(segments)}:v=1:a=0[teaser]"
+    temp_path = output_full_path + ".tmp"
+    command = [
+        FFMPEG_PATH, "-hide_banner", "-loglevel", "error", *input_args, "-filter_complex", filter_graph, "-map", "[teaser]",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "32", "-maxrate", "400k", "-bufsize", "800k", "-pix_fmt", "yuv420p",
+        "-movflags", "+faststart", "-an", "-f", "mp4", "-y", temp_path
+    ]
+    try:
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        _, stderr_output = process.communicate(timeout=300)
+    except subprocess.TimeoutExpired:
+        process.kill(); process.communicate()
+        return "ffmpeg timed out"
+    except FileNotFoundError:
+        return "ffmpeg executable not found"
+    if process.returncode != 0 or not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        stderr_text = stderr_output.decode('utf-8', errors='replace').strip()
+        return f"ffmpeg exited with code {process.returncode}: {stderr_text[-300:]}"
+    os.replace(temp_path, output_full_path)
+    return None
+
+def extract_metadata_and_thumbnail(video_path: str, video_id: int, thumbnails_storage_path: str, timestamp: str = "00:00:03") -> Tuple[Optional[dict], Optional[str], Optional[str], Optional[str]]:
+    """
+    单次 ffmpeg 调用同时生成缩略图并从其 stderr 的输入流信息中解析时长、宽高、编码、码率、帧率和音轨数，
+    每个文件只需启动一个进程。元数据不完整时回退到精简的 ffprobe。
+    返回 (元数据字典或 None, 缩略图文件名或 None, 占位图 data URI 或 None, 失败原因或 None)。
+    """
+    thumbnail_filename, placeholder, stderr_text, thumbnail_error = _run_thumbnail_command(video_path, video_id, thumbnails_storage_path, timestamp)
+    metadata = _parse_ffmpeg_input_info(stderr_text)
+    metadata_error = None
+    if metadata["duration"] is None or metadata["width"] is None or metadata["height"] is None:
+        print(f"[METADATA_EXTRACTOR] 未能从 ffmpeg 输出中解析完整元数据 for '{video_path}'，回退到 ffprobe。")
+        metadata, metadata_error = probe_video_metadata(video_path, full_probe=False)
+    errors = [f"{stage}: {error}" for stage, error in (("metadata", metadata_error), ("thumbnail", thumbnail_error)) if error]
+    return metadata, thumbnail_filename, placeholder, "; ".join(errors) or None
@@ -0,0 +1,279 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from components import database_models as models
+from components import thumbnail_cache
+from components import thumbnail_storage
+from components import video_metadata_extractor
+
+# Preview assets generated ahead of time and stored next to the video's thumbnail, so the UI does not
+# have to range-read (and decode) the source file for previews:
+#
+# Seek-bar storyboards: a sprite of evenly spaced frames tiled STORYBOARD_COLUMNS wide, plus a JSON
+# index describing the grid:
+#   001/234/video_1234567_storyboard.jpg   (Video.storyboard_path)
+#   001/234/video_1234567_storyboard.json
+# The player fetches the sprite once (served by the static thumbnail route) and the WebVTT built from
+# the index maps hover positions to tiles.
+#
+# Hover teasers: a few short segments sampled across the video, stitched into one small muted MP4:
+#   001/234/video_1234567_teaser.mp4       (Video.teaser_path)
+#
+# Both are generated by maintenance tasks of the scan job manager, a batch at a time.
+
+STORYBOARD_COLUMNS = 10
+STORYBOARD_MAX_ROWS = 10
+STORYBOARD_MIN_INTERVAL_SECONDS = 2.0
+STORYBOARD_TILE_WIDTH = 160
+STORYBOARD_JPEG_QUALITY = 5 # ffmpeg -q:v
+STORYBOARD_INDEX_VERSION = 1
+TEASER_SEGMENT_COUNT = 5
+TEASER_SEGMENT_SECONDS = 2.0
+TEASER_WIDTH = 320
+PREVIEW_BATCH_SIZE = 20
+PREVIEW_WORKERS = 2
+FAILED_RETRY_SECONDS = 24 * 3600
+
+PREVIEW_KIND_STORYBOARD = "storyboard"
+PREVIEW_KIND_TEASER = "teaser"
+_PREVIEW_FILE_PATTERN = re.compile(r"^(?P<base>.*video_\d+_(?:storyboard|teaser))\.(?P<ext>jpg|json|mp4)$")
+
+_failed_lock = threading.Lock()
+_failed_at: Dict[Tuple[str, int], float] = {} # (preview kind, video id) -> time of the last failed attempt
+
+
+def storyboard_sprite_path(video_id: int) -> str:
+    return os.path.splitext(thumbnail_storage.sharded_thumbnail_path(video_id))[0] + "_storyboard.jpg"
+
+
+def teaser_path(video_id: int) -> str:
+    return os.path.splitext(thumbnail_storage.sharded_thumbnail_path(video_id))[0] + "_teaser.mp4"
+
+
+def storyboard_index_path(sprite_path: str) -> str:
+    return os.path.splitext(sprite_path)[0] + ".json"
+
+
+def preview_owner_path(relative_path: str) -> Optional[str]:
+    """For a preview file, the path stored on the row (storyboard sprite or teaser); None for anything else."""
+    match = _PREVIEW_FILE_PATTERN.match(relative_path)
+    if not match:
+        return None
+    return match.group("base") + (".mp4" if match.group("base").endswith("_teaser") else ".jpg")
+
+
+def plan_storyboard(duration: Optional[float], width: Optional[int], height: Optional[int]) -> Optional[dict]:
+    """Grid layout for a video: at most one frame every STORYBOARD_MIN_INTERVAL_SECONDS, whole rows only."""
+    if not duration or duration <= 0 or not width or not height:
+        return None
+    frame_count = int(duration // STORYBOARD_MIN_INTERVAL_SECONDS) // STORYBOARD_COLUMNS * STORYBOARD_COLUMNS
+    frame_count = min(max(frame_count, STORYBOARD_COLUMNS), STORYBOARD_COLUMNS * STORYBOARD_MAX_ROWS)
+    return {
+        "version": STORYBOARD_INDEX_VERSION,
+        "duration": duration,
+        "interval": duration / frame_count,
+        "frame_count": frame_count,
+        "columns": STORYBOARD_COLUMNS,
+        "rows": frame_count // STORYBOARD_COLUMNS,
+        "tile_width": STORYBOARD_TILE_WIDTH,
+        "tile_height": max(2, round(STORYBOARD_TILE_WIDTH * height / width / 2) * 2),
+    }
+
+
+def _write_file_atomically(full_path: str, data: bytes):
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    temp_path = full_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, full_path)
+
+
+def generate_storyboard(thumbnails_storage_path: str, video_id: int, video_path: str,
+                        duration: float, width: int, height: int) -> Tuple[Optional[str], Optional[str]]:
+    """Renders the sprite row by row (one ffmpeg per row keeps the number of open decoders small). Returns (sprite path, error)."""
+    plan = plan_storyboard(duration, width, height)
+    if plan is None:
+        return None, "duration or dimensions unknown"
+    tile_width, tile_height, columns = plan["tile_width"], plan["tile_height"], plan["columns"]
+    strips = []
+    for row in range(plan["rows"]):
+        # Sample the middle of each interval, so the first tile is not a black intro frame and the last is not past the end.
+        timestamps = [(row * columns + column + 0.5) * plan["interval"] for column in range(columns)]
+        pixels, error = video_metadata_extractor.render_frame_strip(video_path, timestamps, tile_width, tile_height)
+        if pixels is None:
+            return None, f"row {row}: {error}"
+        strips.append(pixels)
+    # Raw rows of equal width stack vertically by plain concatenation.
+    sprite, error = video_metadata_extractor.encode_rgb_image_as_jpeg(
+        b"".join(strips), columns * tile_width, plan["rows"] * tile_height, STORYBOARD_JPEG_QUALITY
+    )
+    if sprite is None:
+        return None, error
+    sprite_path = storyboard_sprite_path(video_id)
+    index = {**plan, "sprite": sprite_path}
+    try:
+        _write_file_atomically(thumbnail_storage.thumbnail_full_path(thumbnails_storage_path, sprite_path), sprite)
+        _write_file_atomically(
+            thumbnail_storage.thumbnail_full_path(thumbnails_storage_path, storyboard_index_path(sprite_path)),
+            json.dumps(index).encode("utf-8")
+        )
+    except OSError as e:
+        return None, f"cannot store storyboard: {e}"
+    thumbnail_cache.invalidate(sprite_path)
+    return sprite_path, None
+
+
+def load_storyboard_index(thumbnails_storage_path: str, sprite_path: str) -> Optional[Tuple[dict, os.stat_result]]:
+    """(index, stat of the index file) or None when it is missing or unreadable."""
+    index_full_path = thumbnail_storage.thumbnail_full_path(thumbnails_storage_path, storyboard_index_path(sprite_path))
+    try:
+        with open(index_full_path, "rb") as f:
+            index_stat = os.fstat(f.fileno())
+            return json.loads(f.read()), index_stat
+    except (OSError, ValueError):
+        return None
+
+
+def _format_vtt_timestamp(seconds: float) -> str:
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    return f"{hours:02d}:{minutes:02d}:{milliseconds // 1000:02d}.{milliseconds % 1000:03d}"
+
+
+def build_storyboard_vtt(index: dict, sprite_url: str) -> str:
+    """WebVTT thumbnail track: one cue per tile, pointing at the sprite with a #xywh media fragment."""
+    lines = ["WEBVTT", ""]
+    interval, tile_width, tile_height = index["interval"], index["tile_width"], index["tile_height"]
+    for frame in range(index["frame_count"]):
+        row, column = divmod(frame, index["columns"])
+        start, end = frame * interval, min((frame + 1) * interval, index["duration"])
+        lines.append(f"{_format_vtt_timestamp(start)} --> {_format_vtt_timestamp(end)}")
+        lines.append(f"{sprite_url}#xywh={column * tile_width},{row * tile_height},{tile_width},{tile_height}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def plan_teaser_segments(duration: Optional[float]) -> Optional[list]:
+    """[(start, length), ...]: the middle of TEASER_SEGMENT_COUNT equal parts, or the whole video when it is short."""
+    if not duration or duration <= 0:
+        return None
+    if duration <= TEASER_SEGMENT_COUNT * TEASER_SEGMENT_SECONDS * 2:
+        return [(0.0, min(duration, TEASER_SEGMENT_COUNT * TEASER_SEGMENT_SECONDS))]
+    part = duration / TEASER_SEGMENT_COUNT
+    return [(index * part + (part - TEASER_SEGMENT_SECONDS) / 2, TEASER_SEGMENT_SECONDS) for index in range(TEASER_SEGMENT_COUNT)]
+
+
+def generate_teaser(thumbnails_storage_path: str, video_id: int, video_path: str,
+                    duration: float, width: int, height: int) -> Tuple[Optional[str], Optional[str]]:
+    """Returns (teaser path, error)."""
+    segments = plan_teaser_segments(duration)
+    if segments is None:
+        return None, "duration unknown"
+    relative_path = teaser_path(video_id)
+    full_path = thumbnail_storage.thumbnail_full_path(thumbnails_storage_path, relative_path)
+    try:
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    except OSError as e:
+        return None, f"cannot create directory: {e}"
+    error = video_metadata_extractor.render_teaser_clip(video_path, segments, min(TEASER_WIDTH, width // 2 * 2), full_path)
+    return (None, error) if error else (relative_path, None)
+
+
+def delete_video_previews(thumbnails_storage_path: str, video_id: int):
+    """Removes every preview file of a video (called when the video row is deleted)."""
+    sprite_path = storyboard_sprite_path(video_id)
+    for relative_path in (sprite_path, storyboard_index_path(sprite_path), teaser_path(video_id)):
+        thumbnail_cache.invalidate(relative_path)
+        try:
+            os.remove(thumbnail_storage.thumbnail_full_path(thumbnails_storage_path, relative_path))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[Previews] Warning: Could not delete {relative_path}: {e}")
+
+
+_PREVIEW_GENERATORS = {
+    # kind: (Video column holding the stored path, generator)
+    PREVIEW_KIND_STORYBOARD: (models.Video.storyboard_path, generate_storyboard),
+    PREVIEW_KIND_TEASER: (models.Video.teaser_path, generate_teaser),
+}
+
+
+def _recently_failed(kind: str, video_id: int, now: float) -> bool:
+    with _failed_lock:
+        return now - _failed_at.get((kind, video_id), 0) < FAILED_RETRY_SECONDS
+
+
+def _generate_for_row(kind: str, thumbnails_storage_path: str, row) -> Optional[str]:
+    video_id, path, duration, width, height = row
+    relative_path, error = _PREVIEW_GENERATORS[kind][1](thumbnails_storage_path, video_id, path, duration, width, height)
+    with _failed_lock:
+        if relative_path is None:
+            _failed_at[(kind, video_id)] = time.time()
+        else:
+            _failed_at.pop((kind, video_id), None)
+    if relative_path is None:
+        print(f"[Previews] {kind.capitalize()} for video {video_id} failed: {error}")
+    return relative_path
+
+
+def generate_missing_previews(
+    kind: str,
+    db: Session,
+    thumbnails_storage_path: str,
+    batch_size: int = PREVIEW_BATCH_SIZE,
+    worker_count: int = PREVIEW_WORKERS,
+    stop_event: Optional[threading.Event] = None,
+    should_yield: Optional[Callable[[], bool]] = None
+) -> dict:
+    """
+    Generates previews of one kind for present videos with known duration/dimensions that have none,
+    one committed batch at a time. Videos that failed are skipped for FAILED_RETRY_SECONDS. Stops
+    early (result "yielded": True) when should_yield() reports that other work is waiting.
+    """
+    column = _PREVIEW_GENERATORS[kind][0]
+    generated, failed = 0, 0
+    yielded = False
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=max(worker_count, 1), thread_name_prefix="nepenthe-preview") as executor:
+        while stop_event is None or not stop_event.is_set():
+            if should_yield is not None and should_yield():
+                yielded = True
+                break
+            rows = db.query(
+                models.Video.id, models.Video.path, models.Video.duration, models.Video.width, models.Video.height
+            ).filter(
+                models.Video.id > last_id,
+                column.is_(None),
+                models.Video.missing_since.is_(None),
+                models.Video.duration > 0,
+                models.Video.width.isnot(None),
+                models.Video.height.isnot(None)
+            ).order_by(models.Video.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            now = time.time()
+            rows = [row for row in rows if not _recently_failed(kind, row[0], now)]
+            relative_paths = list(executor.map(lambda row: _generate_for_row(kind, thumbnails_storage_path, row), rows))
+            updates = [{"id": row[0], column.key: relative_path} for row, relative_path in zip(rows, relative_paths) if relative_path]
+            failed += len(rows) - len(updates)
+            if updates:
+                try:
+                    db.bulk_update_mappings(models.Video, updates)
+                    db.commit()
+                    generated += len(updates)
+                except Exception as e:
+                    db.rollback()
+                    print(f"[Previews] Error: Failed to save {kind} paths for {len(updates)} video(s): {e}")
+            print(f"[Previews] {kind.capitalize()} progress: {generated} generated, {failed} failed (up to id {last_id}).")
+    print(f"[Previews] {kind.capitalize()} generation {'paused for other work' if yielded else 'finished'}: {generated} generated, {failed} failed.")
+    return {"generated": generated, "failed": failed, "yielded": yielded}
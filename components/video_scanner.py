@@ -1,72 +1,765 @@
 import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_, and_, desc 
+from sqlalchemy import func, or_, and_, desc, exists
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from components import database_models as models
+from components import library_cleaner
 from . import video_metadata_extractor 
-from typing import List 
-
-SUPPORTED_VIDEO_EXTENSIONS = [".mp4", ".mkv", ".avi", ".mov", ".webm", ".flv", ".ts"] 
-
-def _process_video_metadata_and_thumbnail(db: Session, video: models.Video, current_thumbnails_storage_path: str):
-    if not video.id:
-        print(f"[Scanner ProcessMeta] Error: Video {video.name} (Path: {video.path}) has no ID. Cannot process metadata/thumbnail.")
-        return False 
-
-    needs_db_update = False 
-
-    if video.duration is None or video.width is None or video.height is None:
-        print(f"[Scanner ProcessMeta] Extracting metadata for video: {video.path}")
-        metadata = video_metadata_extractor.get_video_metadata(video.path)
-        if metadata:
-            if metadata.get("duration") is not None and video.duration != metadata["duration"]:
-                video.duration = metadata["duration"]
-                needs_db_update = True
-            if metadata.get("width") is not None and video.width != metadata["width"]:
-                video.width = metadata["width"]
-                needs_db_update = True
-            if metadata.get("height") is not None and video.height != metadata["height"]:
-                video.height = metadata["height"]
-                needs_db_update = True
-            if needs_db_update:
-                print(f"[Scanner ProcessMeta] Video {video.name} metadata prepared for update.")
-        else:
-            print(f"[Scanner ProcessMeta] Failed to get metadata for video {video.name}.")
+from . import file_fingerprint
+from . import directory_walker
+from . import thumbnail_storage
+from . import thumbnail_queue
+from . import pinyin_text
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+SUPPORTED_VIDEO_EXTENSIONS = sorted(directory_walker.VIDEO_EXTENSIONS)
+
+SCAN_MODE_FULL = "full"
+SCAN_MODE_INCREMENTAL = "incremental"
+SNAPSHOT_WRITE_CHUNK_SIZE = 500
+NEW_VIDEO_INSERT_CHUNK_SIZE = 500 # new rows are inserted and committed in chunks of this size
+PHASE2_BATCH_SIZE = 200
+PIPELINE_WRITE_BATCH_SIZE = 50 # metadata/thumbnail updates are written by the single DB writer in batches of this size
+DEFAULT_MAX_PIPELINE_WORKERS = 8
+# Files that fail extraction are quarantined and retried after 1h, 2h, 4h, ... capped at 30 days,
+# or on the next scan after their size/mtime changes.
+SCAN_FAILURE_BASE_RETRY_SECONDS = 3600
+SCAN_FAILURE_MAX_RETRY_SECONDS = 30 * 24 * 3600
+# Rows whose file disappeared are first marked with missing_since and only deleted after this many days,
+# so a temporarily moved folder or a half-finished copy does not lose tags, persons and ratings.
+DEFAULT_MISSING_FILE_GRACE_DAYS = 7
+MISSING_FILE_WRITE_CHUNK_SIZE = 500
+WATCHED_ID_CHUNK_SIZE = 1000
+FILE_CHANGE_CHECK_CHUNK_SIZE = 500 # known files found by a walk are compared against their stored size/mtime in chunks of this size
+# Stream attributes stored on the row. A probe that succeeds without reporting a codec stores
+# UNKNOWN_VIDEO_CODEC, so the row is not picked up for re-probing on every scan.
+STREAM_ATTRIBUTE_FIELDS = ("video_codec", "bitrate", "frame_rate", "audio_track_count")
+UNKNOWN_VIDEO_CODEC = "unknown"
+_VIDEO_JOB_FIELDS = (
+    "id", "name", "path", "duration", "width", "height", "thumbnail_path", "fingerprint",
+    "file_size", "file_mtime", "video_codec"
+)
+
+def is_supported_video_file(file_name: str) -> bool:
+    return directory_walker.is_video_file_name(file_name)
+
+
+def _apply_metadata_updates(job: dict, metadata: Optional[dict], updates: dict):
+    if metadata:
+        for field in ("duration", "width", "height") + STREAM_ATTRIBUTE_FIELDS:
+            if metadata.get(field) is not None and job.get(field) != metadata[field]:
+                updates[field] = metadata[field]
+        if job["video_codec"] is None and not metadata.get("video_codec") and all(
+            metadata.get(field) is not None for field in ("duration", "width", "height")
+        ):
+            updates["video_codec"] = UNKNOWN_VIDEO_CODEC
+        if updates:
+            print(f"[Scanner ProcessMeta] Video {job['name']} metadata prepared for update.")
+    else:
+        print(f"[Scanner ProcessMeta] Failed to get metadata for video {job['name']}.")
+
+
+def _process_video_job(job: dict, current_thumbnails_storage_path: str) -> dict:
+    """
+    Runs in a pipeline worker thread. Works on a plain dict snapshot of the row (never on a Session
+    or ORM object) and returns the column updates for the DB writer plus per-stage timings. "error"
+    is set when something the row still needed could not be produced, so the writer can quarantine it.
+    """
+    updates = {}
+    result = {
+        "id": job["id"], "updates": updates, "error": None, "file_size": None, "file_mtime": None,
+        "probe_seconds": None, "thumbnail_seconds": None, "single_pass_seconds": None
+    }
+    needs_metadata = job["duration"] is None or job["width"] is None or job["height"] is None or job["video_codec"] is None
+    # In lazy mode thumbnails are rendered on demand by thumbnail_queue, so the scan only probes metadata.
+    needs_thumbnail = job["thumbnail_path"] is None and not job.get("lazy_thumbnails")
+    errors = []
 
-    if video.thumbnail_path is None:
-        print(f"[Scanner ProcessMeta] Checking/generating thumbnail for video: {video.name} (ID: {video.id})")
-        expected_thumbnail_filename = f"video_{video.id}.jpg"
-        expected_thumbnail_fullpath = os.path.join(current_thumbnails_storage_path, expected_thumbnail_filename)
+    try:
+        file_stat = os.stat(job["path"])
+        result["file_size"], result["file_mtime"] = file_stat.st_size, file_stat.st_mtime
+    except OSError as e:
+        result["error"] = f"file not accessible: {e}"
+        print(f"[Scanner ProcessMeta] Video file {job['path']} is not accessible: {e}")
+        return result
+    # Stats and sorting read these columns instead of stat'ing the files, so keep them current.
+    if job["file_size"] != file_stat.st_size or job["file_mtime"] != file_stat.st_mtime:
+        updates.update({"file_size": file_stat.st_size, "file_mtime": file_stat.st_mtime})
 
-        if os.path.exists(expected_thumbnail_fullpath) and os.path.getsize(expected_thumbnail_fullpath) > 0:
-            print(f"[Scanner ProcessMeta] Thumbnail file '{expected_thumbnail_filename}' for video {video.name} already exists. Updating database record.")
-            video.thumbnail_path = expected_thumbnail_filename
-            needs_db_update = True
+    if job["fingerprint"] is None:
+        fingerprint = file_fingerprint.compute_file_fingerprint(job["path"], file_stat.st_size)
+        if fingerprint:
+            updates["fingerprint"] = fingerprint
+
+    if needs_thumbnail:
+        existing_thumbnail_path = thumbnail_storage.find_existing_thumbnail(current_thumbnails_storage_path, job["id"])
+        if existing_thumbnail_path:
+            print(f"[Scanner ProcessMeta] Thumbnail file '{existing_thumbnail_path}' for video {job['name']} already exists. Updating database record.")
+            updates["thumbnail_path"] = existing_thumbnail_path
+            needs_thumbnail = False
+
+    if needs_metadata and needs_thumbnail and video_metadata_extractor.EXTRACTION_MODE == video_metadata_extractor.EXTRACTION_MODE_SINGLE_PASS:
+        print(f"[Scanner ProcessMeta] Extracting metadata and thumbnail in one pass for video: {job['path']} (ID: {job['id']})")
+        started = time.perf_counter()
+        metadata, generated_filename, placeholder, error = video_metadata_extractor.extract_metadata_and_thumbnail(
+            video_path=job["path"],
+            video_id=job["id"],
+            thumbnails_storage_path=current_thumbnails_storage_path
+        )
+        result["single_pass_seconds"] = time.perf_counter() - started
+        _apply_metadata_updates(job, metadata, updates)
+        if generated_filename:
+            updates["thumbnail_path"] = generated_filename
+            updates["thumbnail_placeholder"] = placeholder
+            print(f"[Scanner ProcessMeta] Thumbnail for video {job['name']} generated and recorded.")
         else:
-            print(f"[Scanner ProcessMeta] Thumbnail file '{expected_thumbnail_filename}' not found for {video.name}. Attempting to generate...")
-            generated_filename = video_metadata_extractor.generate_thumbnail(
-                video_path=video.path, 
-                video_id=video.id,
+            print(f"[Scanner ProcessMeta] Failed to generate thumbnail for video {job['name']}.")
+        if error:
+            errors.append(error)
+    else:
+        if needs_metadata:
+            print(f"[Scanner ProcessMeta] Extracting metadata for video: {job['path']}")
+            started = time.perf_counter()
+            metadata, error = video_metadata_extractor.probe_video_metadata(job["path"])
+            result["probe_seconds"] = time.perf_counter() - started
+            _apply_metadata_updates(job, metadata, updates)
+            if error:
+                errors.append(f"metadata: {error}")
+
+        if needs_thumbnail:
+            print(f"[Scanner ProcessMeta] Generating thumbnail for video: {job['name']} (ID: {job['id']})")
+            started = time.perf_counter()
+            generated_filename, placeholder, error = video_metadata_extractor.render_thumbnail(
+                video_path=job["path"], 
+                video_id=job["id"],
                 thumbnails_storage_path=current_thumbnails_storage_path
             )
+            result["thumbnail_seconds"] = time.perf_counter() - started
             if generated_filename:
-                video.thumbnail_path = generated_filename
-                needs_db_update = True
-                print(f"[Scanner ProcessMeta] Thumbnail for video {video.name} generated and recorded.")
+                updates["thumbnail_path"] = generated_filename
+                updates["thumbnail_placeholder"] = placeholder
+                print(f"[Scanner ProcessMeta] Thumbnail for video {job['name']} generated and recorded.")
             else:
-                print(f"[Scanner ProcessMeta] Failed to generate thumbnail for video {video.name}.")
-    
-    if needs_db_update:
-        db.add(video) 
-    return needs_db_update
+                print(f"[Scanner ProcessMeta] Failed to generate thumbnail for video {job['name']}.")
+            if error:
+                errors.append(f"thumbnail: {error}")
+
+    if "thumbnail_path" in updates:
+        updates["thumbnail_version"] = thumbnail_storage.new_thumbnail_version()
+
+    required_fields = ("duration", "width", "height") if job.get("lazy_thumbnails") else ("duration", "width", "height", "thumbnail_path")
+    still_missing = [field for field in required_fields if job[field] is None and updates.get(field) is None]
+    if still_missing:
+        result["error"] = "; ".join(errors) or f"missing after extraction: {', '.join(still_missing)}"
+    return result
+
+
+class _PipelineStats:
+    """Throughput counters for Phase 2, reported once at the end of a scan."""
+
+    def __init__(self, worker_count: int):
+        self.worker_count = worker_count
+        self.started = time.perf_counter()
+        self.processed = 0
+        self.updated = 0
+        self.failed = 0
+        self.stage_totals = {"probe": 0.0, "thumbnail": 0.0, "single_pass": 0.0, "db_write": 0.0}
+        self.stage_counts = {"probe": 0, "thumbnail": 0, "single_pass": 0, "db_write": 0}
+
+    def add_stage(self, stage: str, seconds: Optional[float]):
+        if seconds is not None:
+            self.stage_totals[stage] += seconds
+            self.stage_counts[stage] += 1
+
+    def summary(self) -> dict:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "workers": self.worker_count,
+            "videos_processed": self.processed,
+            "videos_updated": self.updated,
+            "videos_failed": self.failed,
+            "elapsed_seconds": round(elapsed, 2),
+            "videos_per_second": round(self.processed / elapsed, 2),
+            "avg_stage_seconds": {
+                stage: round(self.stage_totals[stage] / self.stage_counts[stage], 3) if self.stage_counts[stage] else None
+                for stage in self.stage_totals
+            },
+        }
+
+
+def _resolve_worker_count(worker_count: Optional[int]) -> int:
+    if worker_count and worker_count > 0:
+        return worker_count
+    return max(1, min(DEFAULT_MAX_PIPELINE_WORKERS, os.cpu_count() or 1))
+
+
+def _failure_retry_delay_seconds(attempt_count: int) -> int:
+    return min(SCAN_FAILURE_BASE_RETRY_SECONDS * (2 ** max(attempt_count - 1, 0)), SCAN_FAILURE_MAX_RETRY_SECONDS)
+
+
+def record_scan_failures(db: Session, failed_results: List[dict]):
+    """Upserts one quarantine row per failed video with exponential backoff on the retry time."""
+    if not failed_results:
+        return
+    now = datetime.now(timezone.utc)
+    video_ids = [result["id"] for result in failed_results]
+    previous = {
+        row[0]: (row[1], row[2], row[3])
+        for row in db.query(
+            models.ScanFailure.video_id, models.ScanFailure.attempt_count,
+            models.ScanFailure.file_size, models.ScanFailure.file_mtime
+        ).filter(models.ScanFailure.video_id.in_(video_ids))
+    }
+    rows = []
+    for result in failed_results:
+        attempt_count = 1
+        previous_failure = previous.get(result["id"])
+        # A file that changed since the last failure starts a fresh backoff sequence.
+        if previous_failure and previous_failure[1] == result["file_size"] and previous_failure[2] == result["file_mtime"]:
+            attempt_count = previous_failure[0] + 1
+        rows.append({
+            "video_id": result["id"],
+            "reason": (result["error"] or "")[:1000],
+            "attempt_count": attempt_count,
+            "file_size": result["file_size"],
+            "file_mtime": result["file_mtime"],
+            "last_attempt": now,
+            "next_retry_at": now + timedelta(seconds=_failure_retry_delay_seconds(attempt_count)),
+        })
+    table = models.ScanFailure.__table__
+    upsert = sqlite_insert(table)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[table.c.video_id],
+        set_={column: upsert.excluded[column] for column in ("reason", "attempt_count", "file_size", "file_mtime", "last_attempt", "next_retry_at")}
+    )
+    db.execute(upsert, rows)
+
+
+def _flush_pipeline_results(db: Session, pending_results: List[dict], stats: _PipelineStats):
+    if not pending_results:
+        return
+    started = time.perf_counter()
+    updates = [{"id": result["id"], **result["updates"]} for result in pending_results if result["updates"]]
+    failed_results = [result for result in pending_results if result["error"]]
+    recovered_ids = [result["id"] for result in pending_results if not result["error"]]
+    try:
+        if updates:
+            db.bulk_update_mappings(models.Video, updates)
+        record_scan_failures(db, failed_results)
+        if recovered_ids:
+            db.execute(models.ScanFailure.__table__.delete().where(models.ScanFailure.video_id.in_(recovered_ids)))
+        db.commit()
+        stats.updated += len(updates)
+        stats.failed += len(failed_results)
+    except Exception as e:
+        db.rollback()
+        print(f"[Scanner] Phase 2 Error: Failed to save metadata/thumbnail updates for {len(pending_results)} video(s): {e}")
+    stats.add_stage("db_write", time.perf_counter() - started)
+    pending_results.clear()
+
+
+def _release_changed_quarantined_videos(db: Session) -> int:
+    """
+    Quarantined videos are retried early when the file on disk changed since the failure was
+    recorded (e.g. a download finished). Only quarantined rows are stat'ed, not the whole library.
+    """
+    now = datetime.now(timezone.utc)
+    quarantined = db.query(
+        models.ScanFailure.video_id, models.Video.path, models.ScanFailure.file_size, models.ScanFailure.file_mtime
+    ).join(models.Video, models.Video.id == models.ScanFailure.video_id).filter(models.ScanFailure.next_retry_at > now).all()
+    changed_ids = []
+    for video_id, path, file_size, file_mtime in quarantined:
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            continue
+        if file_stat.st_size != file_size or file_stat.st_mtime != file_mtime:
+            changed_ids.append(video_id)
+    if changed_ids:
+        table = models.ScanFailure.__table__
+        db.execute(table.update().where(table.c.video_id.in_(changed_ids)).values(next_retry_at=now))
+        db.commit()
+    print(f"[Scanner] Quarantine: {len(quarantined)} video(s) waiting for retry, {len(changed_ids)} released because the file changed.")
+    return len(quarantined) - len(changed_ids)
+
+
+def not_quarantined_filter():
+    return ~exists().where(and_(
+        models.ScanFailure.video_id == models.Video.id,
+        models.ScanFailure.next_retry_at > datetime.now(timezone.utc)
+    ))
+
+
+def _missing_data_filter():
+    conditions = [
+        models.Video.duration.is_(None),
+        models.Video.width.is_(None),
+        models.Video.height.is_(None),
+        models.Video.fingerprint.is_(None),
+        models.Video.video_codec.is_(None)
+    ]
+    if not thumbnail_queue.is_lazy_mode():
+        conditions.append(models.Video.thumbnail_path.is_(None))
+    return or_(*conditions)
+
+
+def _is_cancelled(cancel_event: Optional[threading.Event]) -> bool:
+    return cancel_event is not None and cancel_event.is_set()
+
+
+def _run_metadata_pipeline(
+    db: Session,
+    criteria,
+    current_thumbnails_storage_path: str,
+    worker_count: int,
+    progress: dict,
+    cancel_event: Optional[threading.Event] = None,
+    stats: Optional[_PipelineStats] = None
+) -> _PipelineStats:
+    """
+    Phase 2 pipeline: the calling thread reads jobs from the DB and is the only DB writer; ffprobe/ffmpeg
+    jobs run on a bounded pool. At most 2 * worker_count jobs are in flight, so memory stays bounded.
+    When cancel_event is set no new jobs are submitted; jobs already running finish and are saved.
+    """
+    stats = stats or _PipelineStats(worker_count)
+    pending_results = []
+    in_flight = {} # future -> job
+    max_in_flight = worker_count * 2
+
+    def collect(done_futures):
+        for future in done_futures:
+            job = in_flight.pop(future)
+            stats.processed += 1
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[Scanner] Phase 2 Error: Worker failed for video {job['path']}: {e}")
+                # Quarantined like any other failure, so a file that crashes the worker is not retried on every scan.
+                result = {
+                    "id": job["id"], "updates": {}, "error": f"worker failed: {e}",
+                    "file_size": job["file_size"], "file_mtime": job["file_mtime"],
+                    "probe_seconds": None, "thumbnail_seconds": None, "single_pass_seconds": None
+                }
+            stats.add_stage("probe", result["probe_seconds"])
+            stats.add_stage("thumbnail", result["thumbnail_seconds"])
+            stats.add_stage("single_pass", result["single_pass_seconds"])
+            progress["processed"] += 1
+            if "duration" in result["updates"] or "width" in result["updates"] or "video_codec" in result["updates"]:
+                progress["probed"] += 1
+            if "thumbnail_path" in result["updates"]:
+                progress["thumbnailed"] += 1
+            if result["error"]:
+                progress["errors"] += 1
+            pending_results.append(result)
+        if len(pending_results) >= PIPELINE_WRITE_BATCH_SIZE:
+            _flush_pipeline_results(db, pending_results, stats)
+
+    lazy_thumbnails = thumbnail_queue.is_lazy_mode()
+    with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="nepenthe-scan") as executor:
+        for job_batch in _iter_video_job_batches(db, criteria, PHASE2_BATCH_SIZE):
+            if _is_cancelled(cancel_event):
+                break
+            for job in job_batch:
+                if _is_cancelled(cancel_event):
+                    break
+                while len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                job["lazy_thumbnails"] = lazy_thumbnails
+                in_flight[executor.submit(_process_video_job, job, current_thumbnails_storage_path)] = job
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+    _flush_pipeline_results(db, pending_results, stats)
+    return stats
+
+
+def _path_prefix_filter(column, abs_root: str):
+    # Range comparison instead of LIKE so that SQLite can use the index on the column.
+    prefix = abs_root.rstrip(os.sep) + os.sep
+    return and_(column >= prefix, column < prefix[:-1] + chr(ord(os.sep) + 1))
+
+
+def _load_known_video_paths(db: Session, abs_root: str) -> Set[str]:
+    return {row[0] for row in db.query(models.Video.path).filter(_path_prefix_filter(models.Video.path, abs_root))}
+
+
+def _relink_moved_videos(db: Session, rows: List[dict], abs_root: str) -> Tuple[List[dict], int]:
+    """
+    Matches newly found files against existing rows whose file has disappeared, by size and then
+    fingerprint, and re-points those rows at the new path so tags, persons, rating, view count and
+    thumbnail survive a move or rename. Only files whose size matches such a row are fingerprinted
+    here; everything else is fingerprinted later by the Phase 2 workers. Returns the rows that still
+    need inserting and the number of relinked videos.
+    """
+    sizes = {row["file_size"] for row in rows if row.get("file_size")}
+    if not sizes:
+        return rows, 0
+    candidates_by_key = defaultdict(list)
+    candidate_rows = db.query(
+        models.Video.id, models.Video.path, models.Video.name, models.Video.file_size, models.Video.fingerprint
+    ).filter(models.Video.file_size.in_(sizes), models.Video.fingerprint.isnot(None)).all()
+    for video_id, old_path, old_name, file_size, fingerprint in candidate_rows:
+        if not os.path.exists(old_path):
+            candidates_by_key[(file_size, fingerprint)].append((video_id, old_path, old_name))
+    if not candidates_by_key:
+        return rows, 0
+
+    candidate_sizes = {key[0] for key in candidates_by_key}
+    remaining_rows = []
+    relinked = []
+    for row in rows:
+        if row.get("file_size") not in candidate_sizes:
+            remaining_rows.append(row)
+            continue
+        fingerprint = file_fingerprint.compute_file_fingerprint(row["path"], row["file_size"])
+        matches = candidates_by_key.get((row["file_size"], fingerprint))
+        if not fingerprint or not matches:
+            row["fingerprint"] = fingerprint
+            remaining_rows.append(row)
+            continue
+        video_id, old_path, old_name = matches.pop(0)
+        update = {"id": video_id, "path": row["path"], "folder": abs_root, "file_mtime": row["file_mtime"], "missing_since": None}
+        # Keep names the user edited; only follow the rename when the name was still the old file name.
+        if old_name == os.path.basename(old_path):
+            update["name"], update["name_pinyin"] = row["name"], row["name_pinyin"]
+        relinked.append(update)
+        print(f"[Scanner] Moved/renamed video detected: {old_path} -> {row['path']} (ID: {video_id})")
+    if relinked:
+        db.bulk_update_mappings(models.Video, relinked)
+    return remaining_rows, len(relinked)
+
+
+def _new_video_row(file_path: str, abs_root: str) -> dict:
+    video_name = os.path.basename(file_path)
+    print(f"[Scanner] New video found: {video_name} at {file_path}")
+    try:
+        file_stat = os.stat(file_path)
+        file_size, file_mtime = file_stat.st_size, file_stat.st_mtime
+    except OSError:
+        file_size, file_mtime = None, None
+    return {
+        "name": video_name, "name_pinyin": pinyin_text.pinyin_forms(video_name),
+        "path": file_path, "folder": abs_root, "file_size": file_size, "file_mtime": file_mtime
+    }
+
+
+def _insert_new_video_rows(db: Session, rows: List[dict], abs_root: str) -> Tuple[int, int]:
+    # Rows may already exist under another (overlapping) root, so re-check the chunk against the unique path index.
+    chunk_paths = [row["path"] for row in rows]
+    try:
+        existing = {row[0] for row in db.query(models.Video.path).filter(models.Video.path.in_(chunk_paths))}
+        rows_to_insert = [row for row in rows if row["path"] not in existing]
+        rows_to_insert, relinked_count = _relink_moved_videos(db, rows_to_insert, abs_root)
+        if rows_to_insert:
+            for row in rows_to_insert:
+                row.setdefault("fingerprint", None)
+            db.execute(models.Video.__table__.insert(), rows_to_insert)
+        db.commit()
+        return len(rows_to_insert), relinked_count
+    except Exception as e:
+        db.rollback()
+        print(f"[Scanner] Phase 1 Error: Failed to add {len(rows)} new video(s) to database: {e}")
+        return 0, 0
+
+
+def _refresh_changed_files(db: Session, paths: List[str]) -> Tuple[int, List[str]]:
+    """
+    Compares known files against the size/mtime stored on their rows. A file that changed on disk
+    (e.g. re-encoded or a download that completed in place) gets its new size/mtime and has its
+    fingerprint, stream attributes, thumbnail and previews cleared, so Phase 2 (or the lazy
+    thumbnail queue) probes it again and renders a new thumbnail and storyboard/teaser. The old
+    thumbnail paths are returned for _delete_stale_thumbnails() once the caller has committed, so a
+    rolled-back update never leaves a row pointing at a deleted file. Rows that have no stored size
+    yet just get one. Returns (number of rows whose file content changed, stale thumbnail paths).
+    """
+    changed_count = 0
+    stale_thumbnail_paths = []
+    for i in range(0, len(paths), FILE_CHANGE_CHECK_CHUNK_SIZE):
+        rows = db.query(
+            models.Video.id, models.Video.path, models.Video.file_size, models.Video.file_mtime, models.Video.thumbnail_path
+        ).filter(models.Video.path.in_(paths[i:i + FILE_CHANGE_CHECK_CHUNK_SIZE])).all()
+        updates = []
+        for video_id, path, file_size, file_mtime, thumbnail_path in rows:
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue
+            if file_size == file_stat.st_size and file_mtime == file_stat.st_mtime:
+                continue
+            update = {"id": video_id, "file_size": file_stat.st_size, "file_mtime": file_stat.st_mtime}
+            if file_size is not None:
+                print(f"[Scanner] File changed on disk, metadata will be refreshed: {path}")
+                update.update({"fingerprint": None, "duration": None, "width": None, "height": None, "storyboard_path": None, "teaser_path": None})
+                update.update({"thumbnail_path": None, "thumbnail_placeholder": None})
+                update.update({field: None for field in STREAM_ATTRIBUTE_FIELDS})
+                if thumbnail_path:
+                    stale_thumbnail_paths.append(thumbnail_path)
+                changed_count += 1
+            updates.append(update)
+        if updates:
+            db.bulk_update_mappings(models.Video, updates)
+    return changed_count, stale_thumbnail_paths
+
+
+def _delete_stale_thumbnails(current_thumbnails_storage_path: str, thumbnail_paths: List[str]):
+    for thumbnail_path in thumbnail_paths:
+        error_msg = thumbnail_storage.delete_thumbnail(current_thumbnails_storage_path, thumbnail_path)
+        if error_msg:
+            print(f"[Scanner] Warning: {error_msg}")
+
+
+def _iter_video_job_batches(db: Session, criteria, batch_size: int) -> Iterator[List[dict]]:
+    # Keyset iteration on id keeps memory bounded by batch_size and visits every matching row once.
+    columns = tuple(getattr(models.Video, field) for field in _VIDEO_JOB_FIELDS)
+    last_id = 0
+    while True:
+        rows = db.query(*columns).filter(criteria, models.Video.id > last_id).order_by(models.Video.id).limit(batch_size).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [dict(zip(_VIDEO_JOB_FIELDS, row)) for row in rows]
+
+
+def _load_directory_snapshots(db: Session, abs_root: str) -> Dict[str, Tuple[float, int]]:
+    rows = db.query(
+        models.DirectorySnapshot.path,
+        models.DirectorySnapshot.mtime,
+        models.DirectorySnapshot.entry_count
+    ).filter(models.DirectorySnapshot.root == abs_root).all()
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+def _flush_new_video_rows(db: Session, root_state: dict):
+    if not root_state["pending_rows"]:
+        return
+    inserted, relinked = _insert_new_video_rows(db, root_state["pending_rows"], root_state["root"])
+    root_state["new"] += inserted
+    root_state["relinked"] += relinked
+    root_state["pending_rows"] = []
+
+
+def _flush_known_file_checks(db: Session, root_state: dict, current_thumbnails_storage_path: str):
+    if not root_state["pending_known"]:
+        return
+    try:
+        changed_count, stale_thumbnail_paths = _refresh_changed_files(db, root_state["pending_known"])
+        db.commit()
+        root_state["changed"] += changed_count
+        _delete_stale_thumbnails(current_thumbnails_storage_path, stale_thumbnail_paths)
+    except Exception as e:
+        db.rollback()
+        print(f"[Scanner] Phase 1 Error: Failed to refresh size/mtime of {len(root_state['pending_known'])} known video(s): {e}")
+    root_state["pending_known"] = []
+
+
+def _finish_root_walk(db: Session, root_state: dict):
+    abs_root = root_state["root"]
+    try:
+        root_state["marked"], root_state["restored"] = _reconcile_missing_videos(
+            db, abs_root, root_state["known_paths"], root_state["found_paths"], root_state["walk_state"]
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[Scanner] Phase 1 Error: Failed to reconcile missing videos for {abs_root}: {e}")
+
+    # Snapshots are only persisted after the videos found under them, otherwise a failed
+    # insert would make the next incremental scan skip directories whose files were never saved.
+    try:
+        _save_directory_snapshots(db, abs_root, root_state["snapshots"], root_state["walk_state"])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[Scanner] Phase 1 Error: Failed to save directory snapshots for {abs_root}: {e}")
+    print(
+        f"[Scanner] Finished folder {abs_root}: {root_state['new']} new video(s) added, {root_state['relinked']} moved video(s) relinked, "
+        f"{root_state['changed']} changed on disk, {root_state['marked']} marked missing, {root_state['restored']} back on disk."
+    )
+    # The path sets are only needed until the root is reconciled.
+    root_state["known_paths"], root_state["found_paths"] = set(), set()
+
+
+def _is_directory_gone(dir_path: str, walk_root: str, walk_state: dict) -> bool:
+    """
+    True only when the nearest walked ancestor of an unvisited directory was listed, i.e. the subtree
+    holding dir_path was not in that listing. An ancestor that could not be stat'ed or listed, or
+    that an incremental scan skipped, leaves the subtree unknown.
+    """
+    visited = walk_state.get("visited", set())
+    unreadable = walk_state.get("unreadable", set())
+    while dir_path not in visited:
+        if dir_path in unreadable or dir_path == walk_root:
+            return False
+        parent_dir = os.path.dirname(dir_path)
+        if parent_dir == dir_path:
+            return False
+        dir_path = parent_dir
+    return dir_path in walk_state.get("listed", {})
+
+
+def _judge_missing_paths(walk_root: str, known_paths: Set[str], found_paths: Set[str], walk_state: dict) -> List[str]:
+    """Known paths under walk_root that the walk proves to be gone: their directory was listed without them, or it is gone."""
+    listed = walk_state.get("listed", {})
+    visited = walk_state.get("visited", set())
+    unreadable = walk_state.get("unreadable", set())
+    missing_paths = []
+    for path in known_paths:
+        if path in found_paths or path in unreadable:
+            continue
+        parent_dir = os.path.dirname(path)
+        if parent_dir in listed or (parent_dir not in visited and _is_directory_gone(parent_dir, walk_root, walk_state)):
+            missing_paths.append(path)
+    return missing_paths
+
+
+def _reconcile_missing_videos(db: Session, abs_root: str, known_paths: Set[str], found_paths: Set[str], walk_state: dict) -> Tuple[int, int]:
+    """
+    One set-difference pass of the rows known under abs_root against the files the walk found.
+    Only rows in directories that were actually listed, or whose directory is known to be gone, can
+    be judged; rows in directories skipped by an incremental scan or hit by a stat/listing error are
+    left alone. Newly missing rows get missing_since, rows that were missing and are back get it
+    cleared. Returns (marked, restored).
+    """
+    missing_paths = _judge_missing_paths(abs_root, known_paths, found_paths, walk_state)
+
+    previously_missing = [
+        row[0] for row in db.query(models.Video.path).filter(
+            _path_prefix_filter(models.Video.path, abs_root), models.Video.missing_since.isnot(None)
+        )
+    ]
+    restored_paths = [path for path in previously_missing if path in found_paths]
+    return _set_videos_missing(db, missing_paths, True), _set_videos_missing(db, restored_paths, False)
+
+
+def _set_videos_missing(db: Session, paths: List[str], missing: bool) -> int:
+    """Bulk sets (or clears) missing_since for the rows at paths; returns how many rows changed state."""
+    table = models.Video.__table__
+    if missing:
+        state_filter, new_value = table.c.missing_since.is_(None), datetime.now(timezone.utc)
+    else:
+        state_filter, new_value = table.c.missing_since.isnot(None), None
+    changed = 0
+    for i in range(0, len(paths), MISSING_FILE_WRITE_CHUNK_SIZE):
+        chunk = paths[i:i + MISSING_FILE_WRITE_CHUNK_SIZE]
+        result = db.execute(table.update().where(table.c.path.in_(chunk), state_filter).values(missing_since=new_value))
+        changed += result.rowcount or 0
+    return changed
+
+
+def _purge_missing_videos(db: Session, scanned_roots: List[str], current_thumbnails_storage_path: str, grace_days: int) -> int:
+    # Only roots that were reachable in this scan are purged, so an unmounted drive never loses its rows.
+    if not scanned_roots:
+        return 0
+    cutoff = datetime.now(timezone.utc) - timedelta(days=max(grace_days, 0))
+    video_ids = [
+        row[0] for row in db.query(models.Video.id).filter(
+            models.Video.missing_since.isnot(None),
+            models.Video.missing_since <= cutoff,
+            or_(*[_path_prefix_filter(models.Video.path, root) for root in scanned_roots])
+        )
+    ]
+    if not video_ids:
+        return 0
+    print(f"[Scanner] {len(video_ids)} video(s) have been missing for more than {grace_days} day(s), removing them from the database...")
+    return library_cleaner.delete_videos_by_ids(db, video_ids, current_thumbnails_storage_path)
+
+
+def _save_directory_snapshots(
+    db: Session,
+    abs_root: str,
+    previous_snapshots: Dict[str, Tuple[float, int]],
+    walk_state: dict
+):
+    table = models.DirectorySnapshot.__table__
+    visited = walk_state.get("visited", set())
+    listed = walk_state.get("listed", {})
+    scanned_at = datetime.now(timezone.utc)
+
+    vanished_dirs = [path for path in previous_snapshots if path not in visited]
+    for i in range(0, len(vanished_dirs), SNAPSHOT_WRITE_CHUNK_SIZE):
+        chunk = vanished_dirs[i:i + SNAPSHOT_WRITE_CHUNK_SIZE]
+        db.execute(table.delete().where(table.c.path.in_(chunk)))
+
+    rows = [
+        {"path": path, "root": abs_root, "mtime": mtime, "entry_count": entry_count, "last_scanned": scanned_at}
+        for path, (mtime, entry_count) in listed.items()
+    ]
+    if rows:
+        upsert = sqlite_insert(table)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[table.c.path],
+            set_={
+                "root": upsert.excluded.root,
+                "mtime": upsert.excluded.mtime,
+                "entry_count": upsert.excluded.entry_count,
+                "last_scanned": upsert.excluded.last_scanned,
+            }
+        )
+        for i in range(0, len(rows), SNAPSHOT_WRITE_CHUNK_SIZE):
+            db.execute(upsert, rows[i:i + SNAPSHOT_WRITE_CHUNK_SIZE])
+    print(f"[Scanner] Directory snapshots for {abs_root}: {len(visited)} visited, {len(listed)} listed, {len(vanished_dirs)} vanished.")
+
+
+def new_scan_progress() -> dict:
+    return {
+        "phase": "pending", "phase_started_at": time.time(), "dirs_walked": 0, "files_found": 0, "new_videos": 0,
+        "to_process": 0, "processed": 0, "probed": 0, "thumbnailed": 0, "errors": 0,
+    }
+
+
+def _set_scan_phase(progress: dict, phase: str):
+    progress["phase"] = phase
+    progress["phase_started_at"] = time.time()
+
+
+def _cancelled_scan_result(db: Session, progress: dict, new_videos: int, relinked_videos: int, pipeline_summary: Optional[dict] = None) -> dict:
+    _set_scan_phase(progress, "cancelled")
+    total_videos_in_db = db.query(func.count(models.Video.id)).scalar() or 0
+    print(f"[Scanner] Video library scan cancelled. Total videos in database: {total_videos_in_db}")
+    return {
+        "message": "Video library scan cancelled.",
+        "total_videos_in_db": total_videos_in_db,
+        "new_videos": new_videos,
+        "relinked_videos": relinked_videos,
+        "pipeline": pipeline_summary,
+        "cancelled": True,
+    }
 
 
 def scan_video_folders_and_save(
     db: Session, 
     video_paths_to_scan: List[str],
     current_thumbnails_storage_path: str, 
-    process_existing_missing_metadata: bool = False # This flag is still useful
+    process_existing_missing_metadata: bool = False, # This flag is still useful
+    scan_mode: str = SCAN_MODE_FULL,
+    worker_count: Optional[int] = None,
+    missing_file_grace_days: int = DEFAULT_MISSING_FILE_GRACE_DAYS,
+    progress: Optional[dict] = None,
+    cancel_event: Optional[threading.Event] = None
 ):
-    print(f"[Scanner] Starting video library scan. Paths to scan: {video_paths_to_scan}, Thumbnails storage: {current_thumbnails_storage_path}")
+    """
+    scan_mode=SCAN_MODE_FULL lists every directory under every root. SCAN_MODE_INCREMENTAL only
+    lists directories whose mtime differs from the persisted directory snapshot; both modes
+    refresh the snapshots so that the next incremental scan starts from the current state.
+    Rows whose file is gone are marked missing and deleted once missing_file_grace_days have passed.
+
+    progress, if given, is a dict whose counters are updated in place while the scan runs (see
+    new_scan_progress). cancel_event stops the scan cooperatively: files found so far are still
+    saved, but a root whose walk was interrupted is neither reconciled nor snapshotted.
+    """
+    if progress is None:
+        progress = new_scan_progress()
+    if scan_mode not in (SCAN_MODE_FULL, SCAN_MODE_INCREMENTAL):
+        print(f"[Scanner] Unknown scan mode '{scan_mode}', falling back to '{SCAN_MODE_FULL}'.")
+        scan_mode = SCAN_MODE_FULL
+    incremental = scan_mode == SCAN_MODE_INCREMENTAL
+    print(f"[Scanner] Starting video library scan ({scan_mode}). Paths to scan: {video_paths_to_scan}, Thumbnails storage: {current_thumbnails_storage_path}")
     if not video_paths_to_scan:
         print("[Scanner] No video library paths provided for scanning, scan aborted.")
         return {"message": "No video library paths provided for scanning.", "total_videos_in_db": db.query(func.count(models.Video.id)).scalar() or 0}
@@ -75,93 +768,260 @@ def scan_video_folders_and_save(
     # This function now focuses only on adding/updating videos from the given paths.
 
     processed_paths_this_scan = set()
-    newly_added_videos_this_scan = []
+    scanned_roots = []
+    root_states = {}
+    root_jobs = []
+    # Every row above this id was inserted by this scan; Phase 2 uses it instead of holding ORM objects.
+    max_video_id_before_scan = db.query(func.max(models.Video.id)).scalar() or 0
     
     print("[Scanner] Phase 1: Scanning for new video files...")
+    _set_scan_phase(progress, "walking")
     for folder_path in video_paths_to_scan:
         abs_folder_path = os.path.abspath(folder_path)
         if abs_folder_path in processed_paths_this_scan: 
             print(f"[Scanner] Path {abs_folder_path} already processed in this scan, skipping.")
             continue
+        processed_paths_this_scan.add(abs_folder_path)
         if not os.path.isdir(abs_folder_path):
             print(f"[Scanner] Warning: Video folder path is invalid: {abs_folder_path}")
-            processed_paths_this_scan.add(abs_folder_path)
             continue
         
         print(f"[Scanner] Scanning folder: {abs_folder_path}")
-        processed_paths_this_scan.add(abs_folder_path)
-        for root, _, files in os.walk(abs_folder_path):
-            for file in files:
-                if any(file.lower().endswith(ext) for ext in SUPPORTED_VIDEO_EXTENSIONS):
-                    file_path = os.path.join(root, file)
-                    existing_video = db.query(models.Video).filter(models.Video.path == file_path).first()
-                    if not existing_video:
-                        video_name = os.path.basename(file_path)
-                        print(f"[Scanner] New video found: {video_name} at {file_path}")
-                        video = models.Video(name=video_name, path=file_path, folder=abs_folder_path)
-                        db.add(video) 
-                        newly_added_videos_this_scan.append(video)
-    
-    if newly_added_videos_this_scan:
-        try:
-            db.commit()
-            print(f"[Scanner] Phase 1 complete: {len(newly_added_videos_this_scan)} new video(s) initially added to database and received IDs.")
-            for video_obj in newly_added_videos_this_scan:
-                if not video_obj.id: 
-                    db.refresh(video_obj) 
-        except Exception as e:
-            db.rollback()
-            print(f"[Scanner] Phase 1 Error: Failed to add new videos to database: {e}")
-            newly_added_videos_this_scan = [] 
-    else:
-        print("[Scanner] Phase 1 complete: No new video files found to add.")
+        scanned_roots.append(abs_folder_path)
+        root_state = {
+            "root": abs_folder_path,
+            "snapshots": _load_directory_snapshots(db, abs_folder_path),
+            "known_paths": _load_known_video_paths(db, abs_folder_path),
+            "found_paths": set(),
+            "pending_rows": [],
+            "pending_known": [],
+            "new": 0, "relinked": 0, "changed": 0, "marked": 0, "restored": 0,
+            "walk_state": {},
+        }
+        print(f"[Scanner] {len(root_state['known_paths'])} video(s) already known under {abs_folder_path}.")
+        root_states[abs_folder_path] = root_state
+        root_jobs.append({
+            "root": abs_folder_path, "snapshots": root_state["snapshots"],
+            "incremental": incremental, "walk_state": root_state["walk_state"]
+        })
 
+    # Roots on different devices are walked in parallel; this thread stays the only DB writer.
+    finished_roots = set()
+    walk_events = directory_walker.walk_roots_by_device(root_jobs, cancel_event)
+    try:
+        for event, abs_folder_path, payload in walk_events:
+            root_state = root_states[abs_folder_path]
+            if event == "root_done":
+                _flush_new_video_rows(db, root_state)
+                _flush_known_file_checks(db, root_state, current_thumbnails_storage_path)
+                _finish_root_walk(db, root_state)
+                finished_roots.add(abs_folder_path)
+                continue
+            root_state["found_paths"].add(payload)
+            progress["files_found"] += 1
+            progress["dirs_walked"] = sum(len(state["walk_state"].get("visited", ())) for state in root_states.values())
+            if payload in root_state["known_paths"]:
+                # Only files in directories that were listed are yielded, so an incremental scan checks
+                # the changed directories and a full scan checks every file.
+                root_state["pending_known"].append(payload)
+                if len(root_state["pending_known"]) >= FILE_CHANGE_CHECK_CHUNK_SIZE:
+                    _flush_known_file_checks(db, root_state, current_thumbnails_storage_path)
+                continue
+            root_state["known_paths"].add(payload)
+            root_state["pending_rows"].append(_new_video_row(payload, abs_folder_path))
+            if len(root_state["pending_rows"]) >= NEW_VIDEO_INSERT_CHUNK_SIZE:
+                _flush_new_video_rows(db, root_state)
+    finally:
+        walk_events.close()
+    progress["dirs_walked"] = sum(len(state["walk_state"].get("visited", ())) for state in root_states.values())
+    for abs_folder_path, root_state in root_states.items():
+        if abs_folder_path not in finished_roots:
+            # Interrupted walk: keep what was found, but the partial file set cannot be used to judge missing files.
+            _flush_new_video_rows(db, root_state)
+            _flush_known_file_checks(db, root_state, current_thumbnails_storage_path)
+            print(f"[Scanner] Scan cancelled while walking {abs_folder_path}: {root_state['new']} new video(s) saved, reconciliation skipped.")
 
-    videos_to_process_queue = []
-    for new_video in newly_added_videos_this_scan:
-        if new_video.id:
-            videos_to_process_queue.append(new_video)
-        else:
-            print(f"[Scanner] Warning: Newly added video {new_video.name} still has no valid ID after commit/refresh, skipping metadata processing.")
+    total_new_videos = sum(state["new"] for state in root_states.values())
+    total_relinked_videos = sum(state["relinked"] for state in root_states.values())
+    total_marked_missing = sum(state["marked"] for state in root_states.values())
+    total_restored = sum(state["restored"] for state in root_states.values())
+    total_changed = sum(state["changed"] for state in root_states.values())
+    progress["new_videos"] += total_new_videos
+
+    if total_new_videos or total_relinked_videos:
+        print(f"[Scanner] Phase 1 complete: {total_new_videos} new video(s) added to database, {total_relinked_videos} moved video(s) relinked.")
+    else:
+        print("[Scanner] Phase 1 complete: No new video files found to add.")
+    if _is_cancelled(cancel_event):
+        return _cancelled_scan_result(db, progress, total_new_videos, total_relinked_videos)
+    purged_missing_count = _purge_missing_videos(db, scanned_roots, current_thumbnails_storage_path, missing_file_grace_days)
 
+    missing_data_filter = _missing_data_filter()
     if process_existing_missing_metadata:
         print("[Scanner] Checking database for existing videos missing metadata/thumbnails...")
-        existing_videos_missing_data = db.query(models.Video).filter(
-            or_(
-                models.Video.duration.is_(None),
-                models.Video.width.is_(None),
-                models.Video.height.is_(None),
-                models.Video.thumbnail_path.is_(None)
-            )
-        ).all()
-        
-        existing_video_ids_in_queue = {v.id for v in videos_to_process_queue if v.id}
-        added_from_existing = 0
-        for ev in existing_videos_missing_data:
-            if ev.id not in existing_video_ids_in_queue:
-                videos_to_process_queue.append(ev)
-                added_from_existing +=1
-        print(f"[Scanner] Found {len(existing_videos_missing_data)} existing videos potentially needing updates. Added {added_from_existing} of them to process queue (Total to process: {len(videos_to_process_queue)}).")
-
-    if videos_to_process_queue:
-        print(f"[Scanner] Phase 2: Starting metadata extraction and thumbnail generation for {len(videos_to_process_queue)} video(s)...")
-        any_video_updated_in_stage2 = False
-        for video_obj in videos_to_process_queue:
-            if _process_video_metadata_and_thumbnail(db, video_obj, current_thumbnails_storage_path):
-                any_video_updated_in_stage2 = True
+        phase2_filter = missing_data_filter
+    else:
+        phase2_filter = and_(models.Video.id > max_video_id_before_scan, missing_data_filter)
+    quarantined_count = _release_changed_quarantined_videos(db)
+    phase2_filter = and_(phase2_filter, models.Video.missing_since.is_(None), not_quarantined_filter())
+    videos_to_process_count = db.query(func.count(models.Video.id)).filter(phase2_filter).scalar() or 0
+    _set_scan_phase(progress, "processing")
+    progress["to_process"] = videos_to_process_count
+
+    pipeline_summary = None
+    if videos_to_process_count:
+        resolved_worker_count = _resolve_worker_count(worker_count)
+        print(f"[Scanner] Phase 2: Starting metadata extraction and thumbnail generation for {videos_to_process_count} video(s) with {resolved_worker_count} worker(s)...")
+        pipeline_stats = _run_metadata_pipeline(
+            db, phase2_filter, current_thumbnails_storage_path, resolved_worker_count, progress, cancel_event
+        )
+        pipeline_summary = pipeline_stats.summary()
         
-        if any_video_updated_in_stage2:
-            try:
-                db.commit()
-                print(f"[Scanner] Phase 2 complete: Metadata/thumbnail information for some/all processed videos updated and saved.")
-            except Exception as e:
-                db.rollback()
-                print(f"[Scanner] Phase 2 Error: Failed to save metadata/thumbnail updates: {e}")
+        if pipeline_stats.failed:
+            print(f"[Scanner] Phase 2: {pipeline_stats.failed} video(s) failed and were quarantined for a later retry.")
+        if pipeline_stats.updated:
+            print(f"[Scanner] Phase 2 complete: Metadata/thumbnail information for {pipeline_stats.updated} video(s) updated and saved.")
         else:
             print("[Scanner] Phase 2 complete: No metadata/thumbnails were updated for the processed videos.")
+        print(
+            f"[Scanner] Phase 2 throughput: {pipeline_summary['videos_processed']} video(s) in {pipeline_summary['elapsed_seconds']}s "
+            f"({pipeline_summary['videos_per_second']} videos/s, {resolved_worker_count} worker(s)). "
+            f"Avg stage latency (s): {pipeline_summary['avg_stage_seconds']}"
+        )
     else:
         print("[Scanner] Phase 2: No videos in queue for metadata or thumbnail processing.")
 
+    if _is_cancelled(cancel_event):
+        return _cancelled_scan_result(db, progress, total_new_videos, total_relinked_videos, pipeline_summary)
+
+    _set_scan_phase(progress, "finished")
     total_videos_in_db = db.query(func.count(models.Video.id)).scalar() or 0
     print(f"[Scanner] Video library scan and processing finished. Total videos in database: {total_videos_in_db}")
-    return {"message": "Video library scan finished.", "total_videos_in_db": total_videos_in_db}
\ No newline at end of file
+    return {
+        "message": "Video library scan finished.",
+        "total_videos_in_db": total_videos_in_db,
+        "new_videos": total_new_videos,
+        "relinked_videos": total_relinked_videos,
+        "changed_videos": total_changed,
+        "missing_videos_marked": total_marked_missing,
+        "missing_videos_restored": total_restored,
+        "missing_videos_purged": purged_missing_count,
+        "pipeline": pipeline_summary,
+        "quarantined_videos": quarantined_count,
+        "cancelled": False,
+    }
+
+def apply_path_changes(
+    db: Session,
+    video_roots: List[str],
+    changed_paths: List[str],
+    current_thumbnails_storage_path: str,
+    worker_count: Optional[int] = None,
+    progress: Optional[dict] = None,
+    cancel_event: Optional[threading.Event] = None
+) -> dict:
+    """
+    Applies a batch of changed paths reported by the library watcher without walking whole roots.
+    Each path may be a video file or a directory that was created, deleted or renamed: files found
+    there are added (or relinked when they were moved), rows whose file is gone are marked missing,
+    and the affected rows that still lack metadata/thumbnails go through the normal Phase 2 pipeline.
+    """
+    if progress is None:
+        progress = new_scan_progress()
+    abs_roots = sorted({os.path.abspath(root) for root in video_roots}, key=len, reverse=True)
+    _set_scan_phase(progress, "walking")
+    new_videos, relinked_videos, changed_videos, marked_missing, restored = 0, 0, 0, 0, 0
+    touched_paths = set()
+
+    for changed_path in sorted({os.path.abspath(path) for path in changed_paths}):
+        if _is_cancelled(cancel_event):
+            break
+        abs_root = next((root for root in abs_roots if changed_path == root or changed_path.startswith(root.rstrip(os.sep) + os.sep)), None)
+        if abs_root is None:
+            continue
+        walk_state = None # only set when changed_path is a directory that was walked
+        if directory_walker.is_path_ignored(changed_path, abs_root):
+            found_paths = set()
+        elif os.path.isdir(changed_path):
+            walk_state = {}
+            found_paths = set(directory_walker.walk_video_files(
+                changed_path, {}, False, walk_state,
+                inherited_rules=directory_walker.load_inherited_ignore_rules(changed_path, abs_root)
+            ))
+            progress["dirs_walked"] += len(walk_state.get("visited", ()))
+        elif os.path.isfile(changed_path) and is_supported_video_file(changed_path):
+            found_paths = {changed_path}
+        else:
+            found_paths = set()
+        progress["files_found"] += len(found_paths)
+
+        known_rows = db.query(models.Video.path, models.Video.missing_since).filter(or_(
+            models.Video.path == changed_path, _path_prefix_filter(models.Video.path, changed_path)
+        )).all()
+        known_paths = {row[0] for row in known_rows}
+        new_rows = [_new_video_row(path, abs_root) for path in sorted(found_paths - known_paths)]
+        try:
+            for i in range(0, len(new_rows), NEW_VIDEO_INSERT_CHUNK_SIZE):
+                inserted, relinked = _insert_new_video_rows(db, new_rows[i:i + NEW_VIDEO_INSERT_CHUNK_SIZE], abs_root)
+                new_videos += inserted
+                relinked_videos += relinked
+            changed_count, stale_thumbnail_paths = _refresh_changed_files(db, sorted(found_paths & known_paths))
+            changed_videos += changed_count
+            if walk_state is not None:
+                missing_paths = _judge_missing_paths(changed_path, known_paths, found_paths, walk_state)
+            else:
+                missing_paths = [path for path in known_paths if path not in found_paths]
+            marked_missing += _set_videos_missing(db, missing_paths, True)
+            restored += _set_videos_missing(db, [row[0] for row in known_rows if row[1] is not None and row[0] in found_paths], False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[Scanner] Watch Error: Failed to apply changes under {changed_path}: {e}")
+            continue
+        _delete_stale_thumbnails(current_thumbnails_storage_path, stale_thumbnail_paths)
+        touched_paths |= found_paths
+    progress["new_videos"] += new_videos
+    print(
+        f"[Scanner] Applied {len(changed_paths)} watched change(s): {new_videos} new, {relinked_videos} relinked, "
+        f"{changed_videos} changed on disk, {marked_missing} marked missing, {restored} back on disk."
+    )
+
+    pipeline_summary = None
+    if touched_paths and not _is_cancelled(cancel_event):
+        _release_changed_quarantined_videos(db)
+        touched_list = sorted(touched_paths)
+        video_ids = []
+        for i in range(0, len(touched_list), MISSING_FILE_WRITE_CHUNK_SIZE):
+            video_ids.extend(row[0] for row in db.query(models.Video.id).filter(
+                models.Video.path.in_(touched_list[i:i + MISSING_FILE_WRITE_CHUNK_SIZE]),
+                models.Video.missing_since.is_(None),
+                _missing_data_filter(),
+                not_quarantined_filter()
+            ))
+        if video_ids:
+            _set_scan_phase(progress, "processing")
+            progress["to_process"] = len(video_ids)
+            resolved_worker_count = _resolve_worker_count(worker_count)
+            print(f"[Scanner] Processing metadata/thumbnails for {len(video_ids)} watched video(s) with {resolved_worker_count} worker(s)...")
+            pipeline_stats = _PipelineStats(resolved_worker_count)
+            # The id list is split so that the IN clause stays well below SQLite's bound-parameter limit.
+            for i in range(0, len(video_ids), WATCHED_ID_CHUNK_SIZE):
+                _run_metadata_pipeline(
+                    db, models.Video.id.in_(video_ids[i:i + WATCHED_ID_CHUNK_SIZE]), current_thumbnails_storage_path,
+                    resolved_worker_count, progress, cancel_event, pipeline_stats
+                )
+                if _is_cancelled(cancel_event):
+                    break
+            pipeline_summary = pipeline_stats.summary()
+
+    _set_scan_phase(progress, "cancelled" if _is_cancelled(cancel_event) else "finished")
+    return {
+        "message": "Watched changes applied.",
+        "new_videos": new_videos,
+        "relinked_videos": relinked_videos,
+        "changed_videos": changed_videos,
+        "missing_videos_marked": marked_missing,
+        "missing_videos_restored": restored,
+        "pipeline": pipeline_summary,
+        "cancelled": _is_cancelled(cancel_event),
+    }
@@ -19,6 +19,18 @@ class Settings(BaseSettings):
     ffmpeg_path_override: Optional[str] = None
     ffprobe_path_override: Optional[str] = None
     thumbnails_base_url: str = "/static/thumbnails"
+    extraction_mode: str = "single_pass" # single_pass: 精简 ffprobe + 单次 ffmpeg 同时取元数据和缩略图; legacy: 完整探测 + 单独截图
+    missing_file_grace_days: int = 7 # 磁盘上已不存在的视频先标记为缺失，超过该天数仍未出现才从数据库删除
+    scan_worker_count: int = 0 # 扫描时并发执行 ffprobe/ffmpeg 的线程数，0 表示自动 (CPU 核数，上限 8)
+    watch_mode: str = "off" # off: 只手动扫描; auto: 监听文件系统事件 (需要 watchdog)，不可用时轮询; poll: 定时增量扫描 (网络挂载)
+    watch_poll_interval_seconds: int = 60
+    watch_debounce_seconds: float = 2.0 # 文件在这段时间内没有新事件才会被处理，避免处理还在写入的下载
+    thumbnail_cache_max_mb: int = 64 # 内存中缓存最常访问的缩略图，0 表示不缓存
+    thumbnail_generation: str = "scan" # scan: 扫描时生成全部缩略图; lazy: 扫描只读取元数据，缩略图按浏览顺序优先生成，其余在后台补齐
+    lazy_thumbnail_workers: int = 2
+    thumbnail_store: str = "files" # files: 每个缩略图一个文件 (分片目录); pack: 追加写入单个 thumbnails.pack 文件，便于备份/复制
+    generate_storyboards: bool = False # 扫描后在后台为视频生成进度条预览雪碧图 (WebVTT 索引)
+    generate_teasers: bool = False # 扫描后在后台为视频生成悬停预览短片，悬停时不再读取原视频
 
     @property
     def database_url(self) -> str:
@@ -83,6 +95,22 @@ def update_settings_from_args(args):
         settings.ffmpeg_path_override = args.ffmpeg_path
     if hasattr(args, 'ffprobe_path') and args.ffprobe_path:
         settings.ffprobe_path_override = args.ffprobe_path
+    if hasattr(args, 'extraction_mode') and args.extraction_mode:
+        settings.extraction_mode = args.extraction_mode
+    if hasattr(args, 'scan_workers') and args.scan_workers is not None:
+        settings.scan_worker_count = args.scan_workers
+    if hasattr(args, 'watch_mode') and args.watch_mode:
+        settings.watch_mode = args.watch_mode
+    if hasattr(args, 'watch_poll_interval') and args.watch_poll_interval is not None:
+        settings.watch_poll_interval_seconds = args.watch_poll_interval
+    if hasattr(args, 'thumbnail_generation') and args.thumbnail_generation:
+        settings.thumbnail_generation = args.thumbnail_generation
+    if hasattr(args, 'thumbnail_store') and args.thumbnail_store:
+        settings.thumbnail_store = args.thumbnail_store
+    if hasattr(args, 'generate_storyboards') and args.generate_storyboards:
+        settings.generate_storyboards = True
+    if hasattr(args, 'generate_teasers') and args.generate_teasers:
+        settings.generate_teasers = True
     
     final_db_url = settings.database_url # 触发 @property getter
     final_thumb_path = settings.thumbnails_storage_path # 触发 @property getter
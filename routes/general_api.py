@@ -1,22 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session, selectinload
-from sqlalchemy import func, or_, and_, desc
-from typing import List, Optional
-from datetime import datetime
+from sqlalchemy import func, or_, and_, desc, case, literal, type_coerce, String
+from typing import List, Optional, Tuple
+from datetime import datetime, timezone
 from pydantic import BaseModel, Field, ConfigDict
 
 from components import database_models as models
 from tools.db_utils import get_db
-from components import video_scanner
 from config.backend_settings import settings
-from components import library_cleaner
-import threading
-import sys
+from components import scan_job_manager
+from components import library_watcher
+from components import thumbnail_queue
+from components import thumbnail_storage
+from components import thumbnail_cache
+from components import thumbnail_variants
+from components import video_previews
+from components import search_index
 import os
 import mimetypes
 import socket
 import asyncio
-from fastapi.responses import StreamingResponse, JSONResponse
+import hashlib
+import posixpath
+import json
+import base64
+from fastapi.responses import StreamingResponse, JSONResponse, RedirectResponse
 import send2trash
 import traceback
 
@@ -44,12 +53,25 @@ class VideoBase(BaseModel):
     added_date: Optional[datetime] = None
     rating: Optional[float] = Field(None, ge=0, le=5)
     studio: Optional[str] = Field(None, max_length=100)
+    missing_since: Optional[datetime] = None
+    file_size: Optional[int] = None; file_mtime: Optional[float] = None
+    video_codec: Optional[str] = None; bitrate: Optional[int] = None
+    frame_rate: Optional[float] = None; audio_track_count: Optional[int] = None
+    thumbnail_placeholder: Optional[str] = None # 低清占位图 data URI，缩略图加载完成前可直接作为 <img> 的 src
     model_config = ConfigDict(from_attributes=True)
 
+class ThumbnailVariant(BaseModel):
+    size: str
+    width: int
+    url: str
+
 class VideoResponseWithDetails(VideoBase):
     tags: List[TagResponse] = []
     persons: List[PersonResponse] = []
     thumbnail_url: Optional[str] = None
+    thumbnail_variants: List[ThumbnailVariant] = [] # WebP 尺寸变体，可用于 <img srcset>
+    storyboard_url: Optional[str] = None # 进度条预览的 WebVTT 缩略图轨道，尚未生成时为空
+    teaser_url: Optional[str] = None # 悬停预览短片，尚未生成时为空 (前端回退到 /api/stream)
     model_config = ConfigDict(from_attributes=True)
 
 class VideoUpdate(BaseModel):
@@ -63,14 +85,35 @@ class LibraryStatsResponse(BaseModel):
     total_videos: int
     total_size_bytes: Optional[int] = None 
     last_scan_time: Optional[datetime] = None
+    videos_without_size: int = 0 # 尚未记录文件大小的视频 (下次扫描时补上)，不计入 total_size_bytes
     # 你可以根据需要添加 model_config = ConfigDict(from_attributes=True) 如果需要从 ORM 对象转换
 
+class LibraryBreakdownGroup(BaseModel):
+    key: Optional[str] = None
+    video_count: int
+    total_size_bytes: int = 0
+    total_duration_seconds: int = 0
+
+class LibraryBreakdownResponse(BaseModel):
+    by: str
+    groups: List[LibraryBreakdownGroup]
+
+class ScanFailureResponse(BaseModel):
+    video_id: int
+    video_name: Optional[str] = None
+    video_path: Optional[str] = None
+    reason: Optional[str] = None
+    attempt_count: int
+    last_attempt: Optional[datetime] = None
+    next_retry_at: Optional[datetime] = None
+
 class PathSyncRequest(BaseModel):
     # previous_paths: List[str] # 不再需要 previous_paths，清理逻辑会对比当前配置和数据库
     current_paths: List[str]
 
 class ScanRequest(BaseModel):
     paths_to_scan: Optional[List[str]] = None # 允许前端传递路径列表
+    full_scan: bool = False # 默认增量扫描（只列出 mtime 变化的目录），True 时完整遍历所有目录
 
 
 @router.get("/")
@@ -89,8 +132,12 @@ async def create_tag(tag: TagCreate, db: Session = Depends(get_db)):
     return new_tag
 
 @router.get("/tags", response_model=List[TagResponse])
-async def get_all_tags(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    tags = db.query(models.Tag).order_by(models.Tag.name).offset(skip).limit(limit).all()
+async def get_all_tags(skip: int = 0, limit: int = 100, search: Optional[str] = None, db: Session = Depends(get_db)):
+    tags_query = db.query(models.Tag)
+    if search:
+        # 名称或预先计算的拼音/首字母包含搜索词 (zjl、zhoujielun 都能找到 周杰伦)
+        tags_query = tags_query.filter(or_(models.Tag.name.ilike(f"%{search}%"), models.Tag.pinyin.ilike(f"%{search.lower()}%")))
+    tags = tags_query.order_by(models.Tag.name).offset(skip).limit(limit).all()
     return tags
 
 @router.post("/persons", response_model=PersonResponse, status_code=201)
@@ -103,16 +150,47 @@ async def create_person(person: PersonCreate, db: Session = Depends(get_db)):
     return new_person
 
 @router.get("/persons", response_model=List[PersonResponse])
-async def get_all_persons(skip: int = 0, limit: int = 200, db: Session = Depends(get_db)):
-    persons = db.query(models.Person).order_by(models.Person.name).offset(skip).limit(limit).all()
+async def get_all_persons(skip: int = 0, limit: int = 200, search: Optional[str] = None, db: Session = Depends(get_db)):
+    persons_query = db.query(models.Person)
+    if search:
+        persons_query = persons_query.filter(or_(models.Person.name.ilike(f"%{search}%"), models.Person.pinyin.ilike(f"%{search.lower()}%")))
+    persons = persons_query.order_by(models.Person.name).offset(skip).limit(limit).all()
     return persons
 
+# 懒生成模式下缩略图尚未生成时返回的占位图
+LAZY_THUMBNAIL_WAIT_SECONDS = 1.5
+BATCH_THUMBNAIL_MAX_IDS = 200
+_PLACEHOLDER_THUMBNAIL_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="320" height="180" viewBox="0 0 320 180">'
+    '<rect width="320" height="180" fill="#2b2b2b"/></svg>'
+)
+
+def _thumbnail_url(thumbnail_path: str, thumbnail_version: Optional[int], size: Optional[str] = None) -> str:
+    # 版本参数只在缩略图重新生成时变化 (观看次数、评分、标签等修改不影响)，浏览器可以把缩略图当作不可变资源长期缓存
+    version = thumbnail_version or 0
+    url = f"{settings.thumbnails_base_url}/{thumbnail_path}?v={version}"
+    return f"{url}&size={size}" if size else url
+
 def _format_video_response(video_orm_obj: models.Video) -> VideoResponseWithDetails:
     video_dto = VideoResponseWithDetails.model_validate(video_orm_obj)
+    if video_orm_obj.storyboard_path:
+        video_dto.storyboard_url = f"{router.prefix}/videos/{video_dto.id}/storyboard.vtt"
+    if video_orm_obj.teaser_path:
+        video_dto.teaser_url = f"{router.prefix}/videos/{video_dto.id}/teaser"
     if video_dto.thumbnail_path:
-        video_dto.thumbnail_url = f"{settings.thumbnails_base_url}/{video_dto.thumbnail_path}"
+        video_dto.thumbnail_url = _thumbnail_url(video_dto.thumbnail_path, video_orm_obj.thumbnail_version)
+        build_variant_url = lambda size: _thumbnail_url(video_dto.thumbnail_path, video_orm_obj.thumbnail_version, size)
+    elif thumbnail_queue.is_lazy_mode():
+        # 还没有缩略图：指向按需生成的接口，请求时优先生成
+        video_dto.thumbnail_url = f"{router.prefix}/videos/{video_dto.id}/thumbnail"
+        build_variant_url = lambda size: f"{video_dto.thumbnail_url}?size={size}"
     else:
         video_dto.thumbnail_url = None
+        return video_dto
+    video_dto.thumbnail_variants = [
+        ThumbnailVariant(size=size, width=width, url=build_variant_url(size))
+        for size, width in thumbnail_storage.THUMBNAIL_VARIANT_WIDTHS.items()
+    ]
     return video_dto
 
 @router.post("/videos/{video_id}/tags/{tag_id}", response_model=VideoResponseWithDetails)
@@ -172,25 +250,102 @@ async def increment_view_count(video_id: int, db: Session = Depends(get_db)):
     except Exception as e: db.rollback(); raise HTTPException(status_code=500, detail="更新观看次数失败")
     return _format_video_response(video)
 
+UHD_MIN_HEIGHT = 2160
+
+def _as_stored_datetime(value: datetime) -> str:
+    # added_date 由数据库以 UTC 的 CURRENT_TIMESTAMP 文本写入 (不带时区和小数秒)，带时区的参数先换算为 UTC，
+    # 再按相同格式比较文本；直接绑定 datetime 会带上 ".000000"，与整秒的值比较时边界不正确
+    if value.tzinfo:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f" if value.microsecond else "%Y-%m-%d %H:%M:%S")
+
+def _encode_video_cursor(sort_key: str, sort_order: str, values: list, video_id: int) -> str:
+    payload = json.dumps({"sort": sort_key, "order": sort_order, "values": values, "id": video_id}, separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_video_cursor(cursor: str, sort_key: str, sort_order: str, value_count: int) -> dict:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        valid = isinstance(payload, dict) and isinstance(payload.get("id"), int) and isinstance(payload.get("values"), list)
+    except (ValueError, TypeError):
+        valid = False
+    if not valid:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    if payload.get("sort") != sort_key or payload.get("order") != sort_order or len(payload["values"]) != value_count:
+        raise HTTPException(status_code=400, detail="分页游标与当前排序方式不一致，请从第一页重新加载")
+    return payload
+
+def _cursor_segments(key_columns: list, key_values: list, descending: bool):
+    """
+    按页面顺序生成游标之后各段视频的过滤条件。每段是"前几列等于游标值 + 下一列单列范围"，
+    都能在 (排序列..., id) 复合索引上直接定位；不用行值比较，是因为 SQLite 只按第一列定位，
+    同值的视频很多时 (例如批量导入的日期) 仍要逐条跳过。
+    SQLite 中 NULL 最小：降序时排序列为空的视频排在最后，升序时排在最前。
+    """
+    for level in range(len(key_columns) - 1, -1, -1):
+        prefix = [
+            column.is_(None) if value is None else column == literal(value, String())
+            for column, value in zip(key_columns[:level], key_values[:level])
+        ]
+        column, value = key_columns[level], key_values[level]
+        if descending:
+            if value is None:
+                continue # 没有比 NULL 更小的值
+            yield prefix + [column < literal(value, String())]
+            if level < len(key_columns) - 1: # id 不会为空
+                yield prefix + [column.is_(None)]
+        else:
+            yield prefix + [column.isnot(None) if value is None else column > literal(value, String())]
+
+def _fetch_videos_after_cursor(base_query, sort_columns: list, descending: bool, cursor: dict, limit: int) -> list:
+    """键集分页：从游标位置开始逐段取满一页，不再跳过前面的所有行，深翻页与第一页一样快。"""
+    key_columns = sort_columns + [models.Video.id]
+    # 游标中保存的是数据库中的原始值 (日期为文本)，按原样绑定，比较结果与排序一致
+    key_values = cursor["values"] + [cursor["id"]]
+    order = [column.desc() if descending else column.asc() for column in key_columns]
+    videos_orm = []
+    for conditions in _cursor_segments(key_columns, key_values, descending):
+        videos_orm += base_query.filter(*conditions).order_by(*order).limit(limit - len(videos_orm)).all()
+        if len(videos_orm) >= limit:
+            break
+    return videos_orm
+
 @router.get("/videos", response_model=dict)
 async def get_videos_with_search_sort(
     skip: int = 0, 
     limit: int = 25, 
+    cursor: Optional[str] = None, # 上一页返回的 next_cursor，提供时忽略 skip
     search_term: Optional[str] = None,
     tags: Optional[str] = None, 
     persons_search: Optional[str] = None,
     min_rating: Optional[float] = None, 
-    sort_by: Optional[str] = "id", 
+    min_duration: Optional[float] = None, # 秒
+    max_duration: Optional[float] = None,
+    min_height: Optional[int] = None, # 例如 1080 只看 1080p 及以上
+    only_4k: bool = False, # 等同于 min_height=2160
+    added_after: Optional[datetime] = None, # 入库时间窗口，不带时区时按 UTC
+    added_before: Optional[datetime] = None,
+    studio: Optional[str] = None,
+    sort_by: Optional[str] = "id", # 另支持 relevance: 按搜索相关度排序 (需要 search_term)
     sort_order: Optional[str] = "desc",
+    include_missing: bool = False,
     db: Session = Depends(get_db)
 ):
     try:
         base_query = db.query(models.Video)
-        count_base_query = db.query(func.count(models.Video.id))
+        count_base_query = db.query(func.count(models.Video.id)).select_from(models.Video)
         
         query_filters = []
-
-        if search_term:
+        if not include_missing:
+            # 扫描时已不在磁盘上的视频（宽限期内尚未删除）默认不显示
+            query_filters.append(models.Video.missing_since.is_(None))
+
+        # 有全文索引时在索引中匹配名称、片商、标签和人物，否则回退到逐行 LIKE
+        search_matches, search_ranked = search_index.match_subquery(search_term) if search_term else (None, False)
+        if search_matches is not None:
+            base_query = base_query.join(search_matches, search_matches.c.video_id == models.Video.id)
+            count_base_query = count_base_query.join(search_matches, search_matches.c.video_id == models.Video.id)
+        elif search_term:
             search_conditions_for_term = []
             search_conditions_for_term.append(models.Video.name.ilike(f"%{search_term}%"))
             search_conditions_for_term.append(models.Video.tags.any(models.Tag.name.ilike(f"%{search_term}%")))
@@ -215,6 +370,22 @@ async def get_videos_with_search_sort(
         
         if min_rating is not None:
             query_filters.append(models.Video.rating >= min_rating)
+
+        # 范围筛选直接落在 (排序列, id) 复合索引上，片商筛选使用 (studio, 排序列, id) 索引
+        if min_duration is not None:
+            query_filters.append(models.Video.duration >= min_duration)
+        if max_duration is not None:
+            query_filters.append(models.Video.duration <= max_duration)
+        if only_4k:
+            min_height = max(min_height or 0, UHD_MIN_HEIGHT)
+        if min_height is not None:
+            query_filters.append(models.Video.height >= min_height)
+        if added_after is not None:
+            query_filters.append(type_coerce(models.Video.added_date, String) >= _as_stored_datetime(added_after))
+        if added_before is not None:
+            query_filters.append(type_coerce(models.Video.added_date, String) < _as_stored_datetime(added_before))
+        if studio:
+            query_filters.append(models.Video.studio == studio.strip())
         
         if query_filters:
             for f_filter in query_filters:
@@ -230,24 +401,227 @@ async def get_videos_with_search_sort(
             "view_count": models.Video.view_count, 
             "added_date": models.Video.added_date, 
             "rating": models.Video.rating,
-            "updated_date": models.Video.updated_date 
+            "updated_date": models.Video.updated_date,
+            "file_size": models.Video.file_size,
+            "file_mtime": models.Video.file_mtime,
+            "bitrate": models.Video.bitrate,
+            "frame_rate": models.Video.frame_rate,
+            "video_codec": models.Video.video_codec,
+            "width": models.Video.width,
+            "height": models.Video.height,
+            "resolution": models.Video.height, # 按高度排序，同高度再按宽度
+            "audio_track_count": models.Video.audio_track_count
         }
-        sort_column = sort_column_map.get(sort_by.lower(), models.Video.id)
-        
-        ordered_query = base_query.order_by(sort_column.asc() if sort_order.lower() == "asc" else sort_column.desc())
-        
-        videos_orm = ordered_query.options(
+        sort_key = sort_by.lower()
+        normalized_order = "asc" if sort_order.lower() == "asc" else "desc"
+        page_query = base_query.options(
             selectinload(models.Video.tags), 
             selectinload(models.Video.persons)
-        ).offset(skip).limit(limit).all()
+        )
+        next_cursor = None
+        if sort_key == "relevance" and search_ranked:
+            if cursor:
+                raise HTTPException(status_code=400, detail="按相关度排序不支持游标分页，请使用 skip")
+            # bm25 越小越相关，相关度相同时新视频在前
+            videos_orm = page_query.order_by(search_matches.c.rank.asc(), models.Video.id.desc()).offset(skip).limit(limit).all()
+        else:
+            if sort_key not in sort_column_map:
+                sort_key = "id"
+            sort_column = sort_column_map[sort_key]
+            # 排序列之后总以 id 兜底，相同值的视频顺序稳定，游标也能唯一定位
+            sort_columns = [] if sort_key == "id" else [sort_column, models.Video.width] if sort_key == "resolution" else [sort_column]
+            descending = normalized_order == "desc"
+            if cursor:
+                cursor_payload = _decode_video_cursor(cursor, sort_key, normalized_order, len(sort_columns))
+                videos_orm = _fetch_videos_after_cursor(page_query, sort_columns, descending, cursor_payload, limit)
+            else:
+                order = [column.desc() if descending else column.asc() for column in sort_columns + [models.Video.id]]
+                videos_orm = page_query.order_by(*order).offset(skip).limit(limit).all()
+            if videos_orm and len(videos_orm) == limit:
+                last_video_id = videos_orm[-1].id
+                # 读取末行排序列在数据库中的原始值，避免日期经过 Python 转换后与存储格式不一致
+                raw_values = list(db.query(*[type_coerce(column, String()) for column in sort_columns]).filter(
+                    models.Video.id == last_video_id
+                ).one()) if sort_columns else []
+                next_cursor = _encode_video_cursor(sort_key, normalized_order, raw_values, last_video_id)
         
+        if thumbnail_queue.is_lazy_mode():
+            # 当前页面上的视频优先生成缩略图
+            missing_thumbnail_ids = [vo.id for vo in videos_orm if not vo.thumbnail_path]
+            if missing_thumbnail_ids:
+                thumbnail_queue.request_thumbnails(missing_thumbnail_ids, thumbnail_queue.PRIORITY_VISIBLE)
         videos_data = [_format_video_response(vo).model_dump(mode='json') for vo in videos_orm]
         
-        return {"videos": videos_data, "total_count": total_count}
+        return {"videos": videos_data, "total_count": total_count, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"获取视频列表失败: {str(e)}")
     
+@router.get("/videos/{video_id}/thumbnail")
+async def get_video_thumbnail(video_id: int, size: Optional[str] = None, db: Session = Depends(get_db)):
+    """已有缩略图时重定向到静态地址；懒生成模式下优先排队生成并短暂等待，超时返回占位图。"""
+    row = db.query(models.Video.thumbnail_path, models.Video.thumbnail_version).filter(models.Video.id == video_id).first()
+    if row is None: raise HTTPException(status_code=404, detail="视频未找到")
+    if not row[0]:
+        if not thumbnail_queue.is_lazy_mode():
+            raise HTTPException(status_code=404, detail="该视频还没有缩略图")
+        event = thumbnail_queue.request_thumbnails([video_id], thumbnail_queue.PRIORITY_VISIBLE)[video_id]
+        deadline = asyncio.get_running_loop().time() + LAZY_THUMBNAIL_WAIT_SECONDS
+        while not event.is_set() and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.1)
+        db.expire_all()
+        row = db.query(models.Video.thumbnail_path, models.Video.thumbnail_version).filter(models.Video.id == video_id).first()
+        if row is None or not row[0]:
+            return Response(content=_PLACEHOLDER_THUMBNAIL_SVG, media_type="image/svg+xml", headers={"cache-control": "no-store", "retry-after": "2"})
+    if size not in thumbnail_storage.THUMBNAIL_VARIANT_WIDTHS: size = None
+    return RedirectResponse(_thumbnail_url(row[0], row[1], size), status_code=307, headers={"cache-control": "no-cache"})
+
+def _collect_batch_validators(storage_root: str, rows: list, size: Optional[str]) -> list:
+    """在线程池中运行：(需要时先生成尺寸变体) 只取每个缩略图的校验头，不读取内容，返回 [(视频 ID, 相对路径, 校验头)]。"""
+    validators = []
+    for video_id, thumbnail_path in rows:
+        relative_path = thumbnail_path
+        if size:
+            relative_path = thumbnail_variants.ensure_variant(storage_root, thumbnail_path, size) or thumbnail_path
+        validator_headers = thumbnail_storage.thumbnail_validator_headers(storage_root, relative_path)
+        if validator_headers is not None:
+            validators.append((video_id, relative_path, validator_headers))
+    return validators
+
+def _load_batch_contents(storage_root: str, validators: list) -> list:
+    """在线程池中运行：ETag 未命中时才读取各缩略图的内容，返回 [(视频 ID, 相对路径, 内容, 校验头)]。"""
+    parts = []
+    for video_id, relative_path, _ in validators:
+        loaded = thumbnail_storage.load_thumbnail_content(storage_root, relative_path)
+        if loaded is not None:
+            parts.append((video_id, relative_path, *loaded))
+    return parts
+
+def _batch_etag(entries: list) -> Tuple[str, str]:
+    # 组合 ETag 只由各缩略图的 ETag (修改时间/大小或打包记录位置) 决定，计算时无需读取内容
+    digest = hashlib.sha1()
+    for video_id, validator_headers in entries:
+        digest.update(f"{video_id}:{validator_headers['etag']};".encode())
+    return f'"b{digest.hexdigest()}"', digest.hexdigest()
+
+@router.get("/thumbnails/batch")
+async def get_thumbnail_batch(request: Request, ids: str, size: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    一次请求返回一整页视频的缩略图 (ids 为逗号分隔的视频 ID)，响应为 multipart/form-data：
+    每个部分的 name 是视频 ID，浏览器端可直接用 `await response.formData()` 解析。
+    还没有缩略图的视频不出现在响应中，并列在 X-Missing-Thumbnails 头里。
+    ETag 由各缩略图的 ETag 组合而成，重复请求同一页时先比较 ETag，命中则直接返回 304，不读取任何缩略图内容。
+    """
+    try:
+        video_ids = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids 必须是以逗号分隔的视频 ID")
+    if not video_ids or len(video_ids) > BATCH_THUMBNAIL_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"一次最多请求 {BATCH_THUMBNAIL_MAX_IDS} 个视频的缩略图")
+    if size not in thumbnail_storage.THUMBNAIL_VARIANT_WIDTHS: size = None
+    thumbnail_paths = dict(db.query(models.Video.id, models.Video.thumbnail_path).filter(models.Video.id.in_(video_ids)).all())
+    if thumbnail_queue.is_lazy_mode():
+        missing_thumbnail_ids = [video_id for video_id in video_ids if video_id in thumbnail_paths and not thumbnail_paths[video_id]]
+        if missing_thumbnail_ids:
+            thumbnail_queue.request_thumbnails(missing_thumbnail_ids, thumbnail_queue.PRIORITY_VISIBLE)
+    storage_root = os.path.realpath(settings.thumbnails_storage_path)
+    rows = [(video_id, thumbnail_paths[video_id]) for video_id in video_ids if thumbnail_paths.get(video_id)]
+    validators = await run_in_threadpool(_collect_batch_validators, storage_root, rows, size)
+
+    def build_headers(delivered: list) -> Tuple[dict, str]:
+        etag, token = _batch_etag([(entry[0], entry[-1]) for entry in delivered])
+        headers = {"etag": etag, "cache-control": thumbnail_cache.REVALIDATE_CACHE_CONTROL}
+        delivered_ids = {entry[0] for entry in delivered}
+        missing_ids = [str(video_id) for video_id in video_ids if video_id not in delivered_ids]
+        if missing_ids:
+            headers["x-missing-thumbnails"] = ",".join(missing_ids)
+        return headers, token
+
+    headers, _ = build_headers(validators)
+    if thumbnail_cache.etag_matches(request.headers.get("if-none-match"), headers["etag"]):
+        return Response(status_code=304, headers=headers)
+
+    parts = await run_in_threadpool(_load_batch_contents, storage_root, validators)
+    # 读取期间缩略图可能被重新生成或删除，按实际读到的内容重新计算 ETag
+    headers, token = build_headers(parts)
+    boundary = f"nepenthe-{token}"
+    body = bytearray()
+    for video_id, relative_path, content, validator_headers in parts:
+        body += (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{video_id}"; filename="{posixpath.basename(relative_path)}"\r\n'
+            f"Content-Type: {validator_headers['content-type']}\r\n\r\n"
+        ).encode()
+        body += content
+        body += b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return Response(content=bytes(body), media_type=f"multipart/form-data; boundary={boundary}", headers=headers)
+
+def _load_storyboard(db: Session, video_id: int):
+    storyboard_path = db.query(models.Video.storyboard_path).filter(models.Video.id == video_id).scalar()
+    loaded = video_previews.load_storyboard_index(settings.thumbnails_storage_path, storyboard_path) if storyboard_path else None
+    if loaded is None:
+        raise HTTPException(status_code=404, detail="该视频还没有进度条预览")
+    index, index_stat = loaded
+    # 雪碧图与索引同时写入，索引的修改时间作为雪碧图地址的版本参数
+    sprite_url = f"{settings.thumbnails_base_url}/{index['sprite']}?v={int(index_stat.st_mtime)}"
+    return index, sprite_url, thumbnail_cache.build_validator_headers(index_stat)
+
+@router.get("/videos/{video_id}/storyboard.vtt")
+async def get_video_storyboard_vtt(video_id: int, request: Request, db: Session = Depends(get_db)):
+    """WebVTT 缩略图轨道：每个提示指向雪碧图中的一格 (#xywh)，播放器悬停进度条时只需加载一张图片。"""
+    index, sprite_url, validator_headers = _load_storyboard(db, video_id)
+    headers = {"etag": validator_headers["etag"], "cache-control": thumbnail_cache.REVALIDATE_CACHE_CONTROL}
+    if thumbnail_cache.etag_matches(request.headers.get("if-none-match"), headers["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=video_previews.build_storyboard_vtt(index, sprite_url), media_type="text/vtt", headers=headers)
+
+@router.get("/videos/{video_id}/storyboard")
+async def get_video_storyboard(video_id: int, db: Session = Depends(get_db)):
+    """雪碧图的网格信息 (JSON)，供自行计算悬停位置的前端使用。"""
+    index, sprite_url, _ = _load_storyboard(db, video_id)
+    return {**index, "sprite_url": sprite_url, "vtt_url": f"{router.prefix}/videos/{video_id}/storyboard.vtt"}
+
+@router.get("/videos/{video_id}/teaser")
+async def get_video_teaser(video_id: int, request: Request, db: Session = Depends(get_db)):
+    """悬停预览短片，支持 Range 请求；ETag 不变时返回 304。"""
+    relative_path = db.query(models.Video.teaser_path).filter(models.Video.id == video_id).scalar()
+    file_path = thumbnail_storage.thumbnail_full_path(settings.thumbnails_storage_path, relative_path) if relative_path else None
+    try:
+        file_stat = os.stat(file_path) if file_path else None
+    except OSError:
+        file_stat = None
+    if file_stat is None:
+        raise HTTPException(status_code=404, detail="该视频还没有悬停预览短片")
+    validator_headers = thumbnail_cache.build_validator_headers(file_stat)
+    headers = {"ETag": validator_headers["etag"], "Last-Modified": validator_headers["last-modified"], "Cache-Control": thumbnail_cache.REVALIDATE_CACHE_CONTROL}
+    if thumbnail_cache.etag_matches(request.headers.get("if-none-match"), validator_headers["etag"]):
+        return Response(status_code=304, headers=headers)
+    return _ranged_file_response(file_path, request, "video/mp4", headers)
+
+@router.post("/library/teasers/generate")
+async def generate_teasers():
+    submission = scan_job_manager.request_maintenance(scan_job_manager.MAINTENANCE_GENERATE_TEASERS)
+    return {"message": "悬停预览短片生成任务已提交，将在当前扫描任务之后执行。", **submission}
+
+@router.post("/library/storyboards/generate")
+async def generate_storyboards():
+    submission = scan_job_manager.request_maintenance(scan_job_manager.MAINTENANCE_GENERATE_STORYBOARDS)
+    return {"message": "进度条预览生成任务已提交，将在当前扫描任务之后执行。", **submission}
+
+@router.post("/library/search-index/rebuild")
+async def rebuild_search_index():
+    if not search_index.is_supported():
+        raise HTTPException(status_code=400, detail="当前 SQLite 不支持 FTS5 trigram 分词，搜索使用逐行匹配，无需重建索引")
+    submission = scan_job_manager.request_maintenance(scan_job_manager.MAINTENANCE_REBUILD_SEARCH_INDEX)
+    return {"message": "搜索索引重建任务已提交，将在当前扫描任务之后执行。", **submission}
+
+@router.get("/library/thumbnails/status")
+async def get_thumbnail_queue_status():
+    return thumbnail_queue.get_status()
+
 @router.get("/videos/{video_id}", response_model=VideoResponseWithDetails)
 async def get_video_details(video_id: int, db: Session = Depends(get_db)):
     video_orm_obj = db.query(models.Video).options(selectinload(models.Video.tags), selectinload(models.Video.persons)).filter(models.Video.id == video_id).first()
@@ -307,105 +681,79 @@ async def delete_video_to_trash(video_id: int, db: Session = Depends(get_db)):
     return {"message": f"视频 '{video_name}' 已发送到回收站并从数据库移除。"}
 
 @router.post("/library/sync-and-clean", status_code=200)
-async def sync_library_paths_and_clean(
-    path_sync_request: PathSyncRequest,
-    background_tasks: BackgroundTasks, 
-):
+async def sync_library_paths_and_clean(path_sync_request: PathSyncRequest):
     """
     Endpoint to be called when library paths are saved in settings.
     It will clean orphaned videos based on the provided current_paths.
+    The clean-up goes through the scan job manager, so it never overlaps a running scan.
     Log messages will be in English.
     """
     current_configured_paths = path_sync_request.current_paths
-    
     print(f"[API /library/sync-and-clean] Received request to sync paths. Current paths: {current_configured_paths}")
-
-    def cleanup_task_with_new_session():
-        db_bg = next(get_db())
-        try:
-            # current_thumbnails_path 应该从 settings 获取最新的，因为这个任务是后台的
-            # 但由于这个API是前端保存设置时调用的，此时 settings 可能还未被后端完全重新加载（如果后端不重启）
-            # 因此，更安全的做法是，如果前端能传递 thumbnails_storage_path，或者后端能可靠地获取它
-            # 为了简单，我们假设 settings.thumbnails_storage_path 在后端是当前最新的
-            # 或者，让 library_cleaner.clean_orphaned_videos 从 settings 内部获取
-            
-            # 我们让 library_cleaner 从 settings 读取 thumbnails_storage_path
-            # 但这里为了演示，我们还是从 settings 实例获取
-            thumb_path = settings.thumbnails_storage_path 
-            
-            print(f"[API /library/sync-and-clean BG Task] Starting cleanup. Thumbnails at: {thumb_path}")
-            result = library_cleaner.clean_orphaned_videos(
-                db_bg,
-                current_configured_paths,
-                thumb_path 
-            )
-            print(f"[API /library/sync-and-clean BG Task] {result.get('message')}")
-        except Exception as e:
-            print(f"[API /library/sync-and-clean BG Task] Error during background cleanup: {e}")
-            traceback.print_exc()
-        finally:
-            db_bg.close()
-
-    background_tasks.add_task(cleanup_task_with_new_session)
-    return {"message": "Library path synchronization and cleanup task started in background."}
+    submission = scan_job_manager.request_cleanup(current_configured_paths)
+    library_watcher.update_watched_roots(current_configured_paths)
+    print(f"[API /library/sync-and-clean] Cleanup job {submission['accepted']} (job #{submission['job_id']}).")
+    return {"message": "Library path synchronization and cleanup task accepted.", **submission}
 
 @router.post("/scan-library")
-async def scan_library_api(
-    background_tasks: BackgroundTasks, 
-    scan_request: Optional[ScanRequest] = None, # 修改这里，使其能接收 ScanRequest
-):
-    def scan_in_background_with_new_session():
-        db_bg = next(get_db())
-        try:
-            paths_for_this_scan = []
-            # 优先使用从请求体传递过来的路径
-            if scan_request and scan_request.paths_to_scan is not None: 
-                paths_for_this_scan = scan_request.paths_to_scan
-                print(f"[API /scan-library BG Task] Using paths from request body: {paths_for_this_scan}")
-            else:
-                # 如果前端没有传递路径，则回退到从 settings 对象获取
-                paths_for_this_scan = settings.video_paths 
-                print(f"[API /scan-library BG Task] Using paths from settings (fallback, as request body did not provide paths): {paths_for_this_scan}")
-
-            current_thumbnails_path_from_settings = settings.thumbnails_storage_path
-
-            print(f"[API /scan-library BG Task] Starting pre-scan cleanup. Paths for cleanup: {paths_for_this_scan}, Thumbnails: {current_thumbnails_path_from_settings}")
-            cleanup_result = library_cleaner.clean_orphaned_videos(
-                db_bg,
-                paths_for_this_scan, # 使用确定的路径列表进行清理
-                current_thumbnails_path_from_settings
-            )
-            print(f"[API /scan-library BG Task] Pre-scan cleanup result: {cleanup_result.get('message')}")
-
-            print(f"[API /scan-library BG Task] Proceeding with library scan for paths: {paths_for_this_scan}")
-            scan_result = video_scanner.scan_video_folders_and_save(
-                db_bg, 
-                video_paths_to_scan=paths_for_this_scan, # 使用确定的路径列表进行扫描
-                current_thumbnails_storage_path=current_thumbnails_path_from_settings,
-                process_existing_missing_metadata=True 
-            )
-            print(f"[API /scan-library BG Task] Scan result: {scan_result.get('message')}")
-            
-            library_cleaner.cleanup_unreferenced_thumbnail_files(db_bg, current_thumbnails_path_from_settings)
-            print(f"[API /scan-library BG Task] Final cleanup of unreferenced thumbnail files performed.")
-
-        except Exception as e:
-            print(f"[API /scan-library BG Task] Error during background scan: {e}")
-            traceback.print_exc()
-        finally:
-            db_bg.close()
-    
-    background_tasks.add_task(scan_in_background_with_new_session)
-    return {"message": "Video library cleanup and scan task started in background."}
-
-@router.get("/stream/{video_id}")
-async def stream_video(video_id: int, request: Request, db: Session = Depends(get_db)):
-    video = db.query(models.Video).filter(models.Video.id == video_id).first()
-    if not video or not video.path or not os.path.exists(video.path) or not os.path.isfile(video.path):
-        print(f"[API Stream - Simpler] 视频文件未找到或路径无效 for video_id: {video_id}, path: {video.path if video else 'N/A'}")
-        raise HTTPException(status_code=404, detail="视频文件未找到或路径无效")
-
-    file_path = video.path
+async def scan_library_api(scan_request: Optional[ScanRequest] = None):
+    # 请求体未提供路径时传 None，任务开始时再从 settings 读取最新的路径
+    paths_for_this_scan = scan_request.paths_to_scan if scan_request else None
+    full_scan = bool(scan_request and scan_request.full_scan)
+    submission = scan_job_manager.request_scan(paths_for_this_scan, full_scan)
+    print(f"[API /scan-library] Scan job {submission['accepted']} (job #{submission['job_id']}), paths: {paths_for_this_scan or 'from settings'}, full_scan: {full_scan}")
+    messages = {
+        "started": "视频库扫描任务已在后台启动。",
+        "joined_running": "已有相同的扫描任务正在运行，本次请求已合并到该任务。",
+        "merged_into_pending": "已有扫描任务在运行，本次请求已合并到排队中的后续任务。",
+        "queued": "已有扫描任务在运行，本次请求将在其结束后执行。",
+    }
+    return {"message": messages[submission["accepted"]], **submission}
+
+@router.get("/scan-library/status")
+async def get_scan_library_status():
+    return scan_job_manager.get_status()
+
+@router.post("/scan-library/cancel")
+async def cancel_scan_library():
+    result = scan_job_manager.cancel_current_job()
+    if not result["cancelled"]:
+        return {"message": "当前没有正在运行的扫描任务。", **result}
+    return {"message": "已请求取消扫描任务，正在处理的文件完成后停止。", **result}
+
+@router.post("/library/thumbnails/compact")
+async def compact_thumbnail_pack():
+    submission = scan_job_manager.request_maintenance(scan_job_manager.MAINTENANCE_COMPACT_THUMBNAIL_PACK)
+    return {"message": "缩略图打包文件整理任务已提交，将在当前扫描任务之后执行。", **submission}
+
+@router.post("/library/thumbnails/placeholders/backfill")
+async def backfill_thumbnail_placeholders():
+    submission = scan_job_manager.request_maintenance(scan_job_manager.MAINTENANCE_BACKFILL_PLACEHOLDERS)
+    return {"message": "缩略图占位图补齐任务已提交，将在当前扫描任务之后执行。", **submission}
+
+@router.get("/library/scan-failures", response_model=List[ScanFailureResponse])
+async def get_scan_failures(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    rows = db.query(models.ScanFailure, models.Video.name, models.Video.path).join(
+        models.Video, models.Video.id == models.ScanFailure.video_id
+    ).order_by(desc(models.ScanFailure.last_attempt)).offset(skip).limit(limit).all()
+    return [
+        ScanFailureResponse(
+            video_id=failure.video_id, video_name=video_name, video_path=video_path, reason=failure.reason,
+            attempt_count=failure.attempt_count, last_attempt=failure.last_attempt, next_retry_at=failure.next_retry_at
+        )
+        for failure, video_name, video_path in rows
+    ]
+
+@router.delete("/library/scan-failures/{video_id}", status_code=200)
+async def clear_scan_failure(video_id: int, db: Session = Depends(get_db)):
+    failure = db.query(models.ScanFailure).filter(models.ScanFailure.video_id == video_id).first()
+    if not failure: raise HTTPException(status_code=404, detail="该视频没有失败记录")
+    try: db.delete(failure); db.commit()
+    except Exception as e: db.rollback(); raise HTTPException(status_code=500, detail=f"清除失败记录失败: {str(e)}")
+    return {"message": f"视频 {video_id} 的失败记录已清除，下次扫描时将重新处理。"}
+
+def _ranged_file_response(file_path: str, request: Request, content_type: str, extra_headers: Optional[dict] = None) -> Response:
+    """按 Range 请求头返回文件的一段 (206) 或整个文件 (200)，原视频和预告片共用。"""
     try:
         file_size = os.stat(file_path).st_size
     except Exception as e:
@@ -413,18 +761,12 @@ async def stream_video(video_id: int, request: Request, db: Session = Depends(ge
         raise HTTPException(status_code=500, detail="无法获取文件信息")
 
     range_header = request.headers.get("range")
-    
-    content_type, _ = mimetypes.guess_type(file_path)
-    file_ext = os.path.splitext(file_path)[1].lower()
-    if file_ext == ".mp4": content_type = "video/mp4"
-    elif file_ext == ".webm": content_type = "video/webm"
-    # ... (可以根据需要添加更多MIME类型判断) ...
-    if content_type is None: content_type = "application/octet-stream"
 
     headers = {
         "Content-Type": content_type,
         "Accept-Ranges": "bytes",
         "Connection": "keep-alive",
+        **(extra_headers or {}),
     }
 
     if range_header:
@@ -503,37 +845,82 @@ async def stream_video(video_id: int, request: Request, db: Session = Depends(ge
 
         return StreamingResponse(full_iterfile_sync(), status_code=status_code, headers=headers, media_type=content_type)
     
+@router.get("/stream/{video_id}")
+async def stream_video(video_id: int, request: Request, db: Session = Depends(get_db)):
+    video = db.query(models.Video).filter(models.Video.id == video_id).first()
+    if not video or not video.path or not os.path.exists(video.path) or not os.path.isfile(video.path):
+        print(f"[API Stream - Simpler] 视频文件未找到或路径无效 for video_id: {video_id}, path: {video.path if video else 'N/A'}")
+        raise HTTPException(status_code=404, detail="视频文件未找到或路径无效")
+
+    file_path = video.path
+    content_type, _ = mimetypes.guess_type(file_path)
+    file_ext = os.path.splitext(file_path)[1].lower()
+    if file_ext == ".mp4": content_type = "video/mp4"
+    elif file_ext == ".webm": content_type = "video/webm"
+    # ... (可以根据需要添加更多MIME类型判断) ...
+    if content_type is None: content_type = "application/octet-stream"
+    return _ranged_file_response(file_path, request, content_type)
+
 @router.get("/library/stats", response_model=LibraryStatsResponse)
 async def get_library_stats(db: Session = Depends(get_db)):
     try:
-        total_videos = db.query(func.count(models.Video.id)).scalar()
-        
-        # 获取上次扫描时间：
-        # 这需要你有一个地方存储这个信息。
-        # 方案1: 查找最新添加的视频的 added_date (不完全准确，但简单)
-        last_added_video = db.query(models.Video).order_by(desc(models.Video.added_date)).first()
-        last_scan_approx = last_added_video.added_date if last_added_video else None
+        total_videos = db.query(func.count(models.Video.id)).filter(models.Video.missing_since.is_(None)).scalar()
         
-        # 方案2: (更好) 在数据库中创建一个专门的表或键值存储来记录上次扫描完成时间。
-        # 例如，一个简单的 'app_metadata' 表，有一行记录 'last_scan_completed_at'.
-        # 这里我们先用方案1的近似值。
-
-        # 计算总大小 (可选，可能非常耗时)
-        total_size = 0
-        all_videos_for_size = db.query(models.Video.path).all()
-        for video_row in all_videos_for_size:
-            if video_row.path and os.path.exists(video_row.path):
-                try:
-                    total_size += os.path.getsize(video_row.path)
-                except OSError:
-                    pass #忽略无法访问的文件
+        # 上次扫描完成时间由扫描任务管理器写入 app_metadata；从未完整扫描过时回退到最新添加视频的时间
+        last_scan_time = scan_job_manager.get_last_scan_completed_at(db)
+        if last_scan_time is None:
+            last_added_video = db.query(models.Video.added_date).order_by(desc(models.Video.added_date)).first()
+            last_scan_time = last_added_video[0] if last_added_video else None
+
+        # 总大小直接汇总扫描时记录的 file_size，不再逐个访问磁盘上的文件
+        total_size, videos_without_size = db.query(
+            func.coalesce(func.sum(models.Video.file_size), 0),
+            func.count(models.Video.id).filter(models.Video.file_size.is_(None))
+        ).filter(models.Video.missing_since.is_(None)).one()
 
         return LibraryStatsResponse(
             total_videos=total_videos or 0,
-            total_size_bytes=total_size, # 如果计算了总大小
-            last_scan_time=last_scan_approx
+            total_size_bytes=total_size,
+            last_scan_time=last_scan_time,
+            videos_without_size=videos_without_size or 0
         )
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"获取媒体库统计信息失败: {str(e)}")
     
+
+# 分辨率按高度归档，竖屏视频按短边计算
+_RESOLUTION_BUCKET = case(
+    (models.Video.height.is_(None), None),
+    (func.min(models.Video.width, models.Video.height) >= 2160, "2160p"),
+    (func.min(models.Video.width, models.Video.height) >= 1440, "1440p"),
+    (func.min(models.Video.width, models.Video.height) >= 1080, "1080p"),
+    (func.min(models.Video.width, models.Video.height) >= 720, "720p"),
+    (func.min(models.Video.width, models.Video.height) >= 480, "480p"),
+    else_="SD"
+)
+
+@router.get("/library/stats/breakdown", response_model=LibraryBreakdownResponse)
+async def get_library_stats_breakdown(by: str = "folder", db: Session = Depends(get_db)):
+    group_columns = {
+        "folder": models.Video.folder,
+        "codec": models.Video.video_codec,
+        "resolution": _RESOLUTION_BUCKET,
+    }
+    group_column = group_columns.get(by.lower())
+    if group_column is None:
+        raise HTTPException(status_code=400, detail=f"不支持的分组方式: {by}，可选: {', '.join(group_columns)}")
+    try:
+        rows = db.query(
+            group_column.label("key"),
+            func.count(models.Video.id),
+            func.coalesce(func.sum(models.Video.file_size), 0),
+            func.coalesce(func.sum(models.Video.duration), 0)
+        ).filter(models.Video.missing_since.is_(None)).group_by("key").order_by(func.count(models.Video.id).desc()).all()
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"获取媒体库分组统计失败: {str(e)}")
+    return LibraryBreakdownResponse(by=by.lower(), groups=[
+        LibraryBreakdownGroup(key=key, video_count=count, total_size_bytes=size, total_duration_seconds=duration)
+        for key, count, size, duration in rows
+    ])
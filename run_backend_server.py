@@ -25,6 +25,14 @@ if __name__ == "__main__":
     parser.add_argument("--thumbnails-storage-path", default=None, help="Full path to the thumbnails storage directory")
     parser.add_argument("--ffmpeg-path", default=None, help="Full path to ffmpeg executable")
     parser.add_argument("--ffprobe-path", default=None, help="Full path to ffprobe executable")
+    parser.add_argument("--extraction-mode", default=None, choices=["single_pass", "legacy"], help="Metadata/thumbnail extraction mode")
+    parser.add_argument("--scan-workers", type=int, default=None, help="Number of concurrent ffprobe/ffmpeg workers during scans (0 = auto)")
+    parser.add_argument("--watch-mode", default=None, choices=["off", "auto", "poll"], help="Watch library paths for changes (auto = native events with polling fallback)")
+    parser.add_argument("--watch-poll-interval", type=int, default=None, help="Seconds between polling rescans for paths without native events")
+    parser.add_argument("--thumbnail-generation", default=None, choices=["scan", "lazy"], help="Render thumbnails during scans or lazily on demand")
+    parser.add_argument("--thumbnail-store", default=None, choices=["files", "pack"], help="Store thumbnails as individual files or in a single pack file")
+    parser.add_argument("--generate-storyboards", action="store_true", default=None, help="Generate seek-bar storyboard sprites in the background after scans")
+    parser.add_argument("--generate-teasers", action="store_true", default=None, help="Generate short hover-preview teaser clips in the background after scans")
 
     args = None
     try:
@@ -100,6 +108,12 @@ if __name__ == "__main__":
     print(f"  Thumbnails Path: {settings.thumbnails_storage_path}", flush=True)
     print(f"  FFmpeg: {settings.ffmpeg_path}", flush=True)
     print(f"  FFprobe: {settings.ffprobe_path}", flush=True)
+    print(f"  Scan Workers: {settings.scan_worker_count or 'auto'}", flush=True)
+    print(f"  Watch Mode: {settings.watch_mode}", flush=True)
+    print(f"  Thumbnail Generation: {settings.thumbnail_generation}", flush=True)
+    print(f"  Thumbnail Store: {settings.thumbnail_store}", flush=True)
+    print(f"  Generate Storyboards: {settings.generate_storyboards}", flush=True)
+    print(f"  Generate Teasers: {settings.generate_teasers}", flush=True)
 
     try:
         from apps.backend_fastapi_app import app 
@@ -127,6 +141,20 @@ if __name__ == "__main__":
         except Exception as e_ffprobe_set:
             print(f"Warning: Could not set FFPROBE_PATH: {e_ffprobe_set}", flush=True)
 
+    try:
+        from components import video_metadata_extractor
+        video_metadata_extractor.EXTRACTION_MODE = settings.extraction_mode
+        print(f"Set video_metadata_extractor.EXTRACTION_MODE: {settings.extraction_mode}", flush=True)
+    except Exception as e_mode_set:
+        print(f"Warning: Could not set EXTRACTION_MODE: {e_mode_set}", flush=True)
+
+    try:
+        from components import thumbnail_storage
+        thumbnail_storage.THUMBNAIL_STORE = settings.thumbnail_store
+        print(f"Set thumbnail_storage.THUMBNAIL_STORE: {settings.thumbnail_store}", flush=True)
+    except Exception as e_store_set:
+        print(f"Warning: Could not set THUMBNAIL_STORE: {e_store_set}", flush=True)
+
     print(f"Starting Uvicorn server on host={settings.api_host}, port={settings.api_port}", flush=True)
 
     try:
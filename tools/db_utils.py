@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config.backend_settings import settings 
@@ -19,15 +19,122 @@ Base = declarative_base()
 
 def create_db_and_tables():
     """
-    在数据库中创建所有定义的表（如果它们尚不存在）。
+    在数据库中创建所有定义的表（如果它们尚不存在），再执行尚未执行的结构迁移。
     这个函数应该在应用启动时被调用一次。
     """
     try:
+        is_new_database = not inspect(engine).has_table("videos")
         Base.metadata.create_all(bind=engine)
+        _run_schema_migrations(is_new_database)
         print("数据库表已成功检查/创建。") 
     except Exception as e:
         print(f"创建数据库表失败: {e}") 
-        
+
+def _add_columns(connection, table_name: str, columns: tuple):
+    """补上已存在的表缺少的列 (ALTER TABLE ... ADD COLUMN，新列必须可为空)，columns 为 (列名, SQL 类型)。"""
+    existing_columns = {column["name"] for column in inspect(connection).get_columns(table_name)}
+    for column_name, column_type in columns:
+        if column_name in existing_columns:
+            continue
+        connection.exec_driver_sql(f'ALTER TABLE "{table_name}" ADD COLUMN "{column_name}" {column_type}')
+        print(f"数据库升级: 已为表 {table_name} 添加列 {column_name}")
+
+def _create_indexes(connection, table_name: str, indexes: tuple):
+    """创建缺少的索引，indexes 为 (索引名, (列名, ...))。名称与模型中的定义一致。"""
+    for index_name, column_names in indexes:
+        connection.exec_driver_sql(
+            f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ({", ".join(column_names)})'
+        )
+
+# 版本化的结构迁移：PRAGMA user_version 记录数据库已执行到的版本，启动时按顺序执行更高版本的迁移。
+# 修改模型的列或索引时在末尾追加一项，写明这一版新增的列和索引 (不读取模型，模型以后再变化时
+# 已有的迁移保持不变)。新表由 create_all 创建，不需要迁移。迁移必须可以重复执行 (先检查列是否存在 /
+# IF NOT EXISTS)，因为 SQLite 的 DDL 不一定处于事务中，中途退出后下次启动会重新执行同一版本；
+# 引入版本号之前的旧数据库 (user_version 为 0) 从第 1 版开始执行，已有的列和索引会被跳过。
+# 新建的数据库由 create_all 直接按当前模型建好，只记录最新版本号。
+SCHEMA_MIGRATIONS = [
+    (1, "文件大小、修改时间和内容指纹 (识别移动/重命名的文件)", lambda connection: (
+        _add_columns(connection, "videos", (("file_size", "BIGINT"), ("file_mtime", "FLOAT"), ("fingerprint", "VARCHAR"))),
+        _create_indexes(connection, "videos", (("ix_videos_file_size", ("file_size",)), ("ix_videos_fingerprint", ("fingerprint",)))),
+    )),
+    (2, "文件从磁盘上消失的时间", lambda connection: (
+        _add_columns(connection, "videos", (("missing_since", "DATETIME"),)),
+        _create_indexes(connection, "videos", (("ix_videos_missing_since", ("missing_since",)),)),
+    )),
+    (3, "扫描时写入的流信息", lambda connection: (
+        _add_columns(connection, "videos", (
+            ("video_codec", "VARCHAR"), ("bitrate", "INTEGER"), ("frame_rate", "FLOAT"), ("audio_track_count", "INTEGER")
+        )),
+        _create_indexes(connection, "videos", (
+            ("ix_videos_height", ("height",)), ("ix_videos_file_mtime", ("file_mtime",)),
+            ("ix_videos_video_codec", ("video_codec",)), ("ix_videos_bitrate", ("bitrate",)),
+        )),
+    )),
+    (4, "缩略图占位图、进度条预览和悬停预览", lambda connection: _add_columns(connection, "videos", (
+        ("thumbnail_placeholder", "VARCHAR"), ("storyboard_path", "VARCHAR"), ("teaser_path", "VARCHAR")
+    ))),
+    (5, "标签和人物名称的拼音", lambda connection: (
+        _add_columns(connection, "tags", (("pinyin", "VARCHAR"),)),
+        _add_columns(connection, "persons", (("pinyin", "VARCHAR"),)),
+    )),
+    (6, "视频列表各排序方式的复合索引 (游标分页)", lambda connection: _create_indexes(connection, "videos", (
+        ("ix_videos_sort_duration", ("duration", "id")),
+        ("ix_videos_sort_view_count", ("view_count", "id")),
+        ("ix_videos_sort_added_date", ("added_date", "id")),
+        ("ix_videos_sort_updated_date", ("updated_date", "id")),
+        ("ix_videos_sort_rating", ("rating", "id")),
+        ("ix_videos_sort_width", ("width", "id")),
+        ("ix_videos_sort_resolution", ("height", "width", "id")),
+        ("ix_videos_sort_frame_rate", ("frame_rate", "id")),
+        ("ix_videos_sort_audio_track_count", ("audio_track_count", "id")),
+    ))),
+    (7, "视频列表按片商筛选并排序的复合索引", lambda connection: _create_indexes(connection, "videos", (
+        ("ix_videos_studio_added_date", ("studio", "added_date", "id")),
+        ("ix_videos_studio_rating", ("studio", "rating", "id")),
+        ("ix_videos_studio_duration", ("studio", "duration", "id")),
+        ("ix_videos_studio_name", ("studio", "name", "id")),
+    ))),
+    (8, "缩略图版本号 (缩略图地址的版本参数)", lambda connection: _add_columns(connection, "videos", (
+        ("thumbnail_version", "BIGINT"),
+    ))),
+    (9, "视频名称的拼音 (全文索引的拼音列)", lambda connection: _add_columns(connection, "videos", (
+        ("name_pinyin", "VARCHAR"),
+    ))),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+def _run_schema_migrations(is_new_database: bool):
+    with engine.connect() as connection:
+        current_version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+    if is_new_database:
+        current_version = SCHEMA_VERSION
+    elif current_version > SCHEMA_VERSION:
+        print(f"警告: 数据库结构版本 ({current_version}) 高于当前程序支持的版本 ({SCHEMA_VERSION})，可能由更新的版本创建。")
+        return
+    for version, description, migrate in SCHEMA_MIGRATIONS:
+        if version <= current_version:
+            continue
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {version}")
+        print(f"数据库升级: 已执行第 {version} 版迁移 ({description})")
+    if is_new_database:
+        with engine.begin() as connection:
+            connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def analyze_database():
+    """
+    更新 SQLite 查询规划器的统计信息 (ANALYZE)。没有统计信息时，规划器会把几乎所有视频都满足的
+    missing_since IS NULL 当作高选择性条件，放弃排序用的复合索引而对整表排序。
+    15 万条视频约需 0.3 秒，在启动时和扫描/清理任务之后执行。
+    """
+    try:
+        with engine.begin() as connection:
+            connection.exec_driver_sql("ANALYZE")
+    except Exception as e:
+        print(f"更新数据库统计信息失败: {e}")
+
 
 def get_db():
     """